@@ -0,0 +1,497 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import cache
+import config
+import db_actions
+import db_pool
+import instrumentation
+
+# ส่วนเรียก AI (OpenAI-compatible API) เพื่อจัดรูปแบบข้อความเป็น Markdown
+# - ใช้ requests.Session ร่วมกันทั้ง process เพื่อใช้ connection (keep-alive/TLS) ซ้ำ
+# - จำกัดจำนวนการเรียกพร้อมกันต่อ worker (AI_MAX_CONCURRENT) ไม่ให้งาน AI กิน thread จนหน้าอื่นของระบบช้า
+# - รองรับแบบ stream: ได้ข้อความทีละส่วนตั้งแต่ token แรก เพื่อส่งต่อให้หน้าเว็บแบบ Server-Sent Events
+# - ผลลัพธ์ถูก cache ตาม hash ของ (ข้อความที่ normalize แล้ว, system prompt, model, temperature)
+#   ชั้นแรกอยู่ในหน่วยความจำ (LRU) ชั้นที่สองอยู่ในตาราง ai_format_cache (migrations/005)
+#   คำขอเดียวกันที่เข้ามาพร้อมกันใน worker เดียวกันจะรอผลจากการเรียก AI ครั้งเดียว (single-flight)
+# - เอกสารยาวถูกแบ่งเป็นช่วงตามหัวข้อ/ย่อหน้า จัดรูปแบบพร้อมกันหลายช่วงแล้วต่อกลับตามลำดับ
+#   ทุกช่วงถูกตรวจว่าตัวเลขและวันที่ยังอยู่ครบ ถ้าไม่ครบจะใช้ข้อความเดิมของช่วงนั้นแทน
+
+SYSTEM_PROMPT = (
+    "Role: You are an expert in structuring research data.\n"
+    "Task: Convert the provided raw text into clear, well-structured Markdown (MD).\n"
+    "Formatting rules:\n"
+    "- Use `#` for main headings.\n"
+    "- Use `##` for subheadings.\n"
+    "- Use `-` for bulleted lists.\n"
+    "CRITICAL CONSTRAINT: Do NOT alter, modify, or remove any numbers, research fund names, or dates. You must maintain 100% data integrity from the original text."
+)
+TEMPERATURE = 0.2
+MAX_TOKENS = 2048
+
+
+class AIError(Exception):
+    # เรียก AI ไม่สำเร็จ (เชื่อมต่อไม่ได้ / API Key ผิด / ตอบกลับผิดรูปแบบ)
+    pass
+
+
+class AIBusy(AIError):
+    # มีงาน AI ทำงานอยู่เต็มจำนวนที่กำหนด
+    pass
+
+
+# สถิติการเรียก AI จริง (ไม่นับผลจาก cache) เวลาเป็นมิลลิวินาทีแยกแบบ stream / ทั้งก้อน
+_LATENCY_BUCKETS_MS = (250, 500, 1000, 2500, 5000, 10000, 20000, 45000, 90000)
+_upstream = {'calls': 0, 'errors': 0, 'busy': 0}
+_latency = {'full': instrumentation.Histogram(_LATENCY_BUCKETS_MS), 'stream': instrumentation.Histogram(_LATENCY_BUCKETS_MS)}
+
+_session = None
+_session_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(config.AI_MAX_CONCURRENT)
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=config.AI_MAX_CONCURRENT)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+# หลัง fork ให้ process ลูกสร้าง session ของตัวเอง (ไม่ใช้ socket ร่วมกับ process แม่)
+def _after_fork_in_child():
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def _request(content, stream):
+    # ดึงค่าจาก Environment Variables
+    api_url = os.getenv('AI_API_URL')
+    model_name = os.getenv('AI_MODEL_NAME')
+    api_key = os.getenv('AI_API_KEY')
+
+    # สร้าง Headers สำหรับยืนยันตัวตน (Bearer Token)
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": model_name,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": content}
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS,
+        "stream": stream,
+    }
+    try:
+        response = _get_session().post(api_url, json=payload, headers=headers, stream=stream,
+                                       timeout=(config.AI_CONNECT_TIMEOUT, config.AI_READ_TIMEOUT))
+    except requests.RequestException as e:
+        raise AIError(str(e))
+    # ดักจับ Error
+    if response.status_code != 200:
+        print(f"\n--- OPENTYPHOON ERROR ---")
+        print(f"Status Code: {response.status_code}")
+        print(f"Message: {response.text}")
+        response.close()
+        raise AIError(f"AI server returned {response.status_code}")
+    return response
+
+def _acquire():
+    if not _slots.acquire(timeout=config.AI_QUEUE_TIMEOUT):
+        _upstream['busy'] += 1
+        raise AIBusy("AI formatting is busy")
+    _upstream['calls'] += 1
+
+def _observe(mode, started, failed):
+    _latency[mode].observe((time.perf_counter() - started) * 1000)
+    if failed:
+        _upstream['errors'] += 1
+
+def _format_upstream(content):
+    _acquire()
+    started, failed = time.perf_counter(), True
+    try:
+        response = _request(content, stream=False)
+        try:
+            result = response.json()['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError) as e:
+            raise AIError(f"unexpected AI response: {e}")
+        failed = False
+        return result
+    finally:
+        _observe('full', started, failed)
+        _slots.release()
+
+def _stream_upstream(content):
+    _acquire()
+    started, failed = time.perf_counter(), True
+    try:
+        response = _request(content, stream=True)
+        try:
+            for line in response.iter_lines(decode_unicode=False):
+                if not line or not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                try:
+                    choice = json.loads(data)['choices'][0]
+                except (ValueError, KeyError, IndexError):
+                    continue
+                delta = (choice.get('delta') or {}).get('content') or (choice.get('message') or {}).get('content')
+                if delta:
+                    yield delta
+            failed = False
+        except requests.RequestException as e:
+            raise AIError(str(e))
+        finally:
+            response.close()
+    finally:
+        _observe('stream', started, failed)
+        _slots.release()
+
+
+# ส่วน cache ผลลัพธ์
+_memory = cache.TTLCache('ai_format', ttl=config.AI_CACHE_MEMORY_TTL, maxsize=config.AI_CACHE_MEMORY_SIZE)
+_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'coalesced': 0, 'db_errors': 0}
+
+def normalize(content):
+    # ข้อความที่ต่างกันแค่ช่องว่าง/บรรทัดว่าง/รูปแบบ Unicode ถือเป็นข้อความเดียวกัน
+    text = unicodedata.normalize('NFC', content).replace('\r\n', '\n').replace('\r', '\n')
+    lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in text.split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+def cache_key(content):
+    material = json.dumps([normalize(content), SYSTEM_PROMPT, os.getenv('AI_MODEL_NAME'), TEMPERATURE, MAX_TOKENS],
+                          ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def _db_ready(cur):
+    return db_pool.table_exists(cur, 'ai_format_cache')
+
+def _db_get(key):
+    # ยืม connection สั้นๆ ของตัวเอง (ไม่ผูกกับ request) ระหว่างนี้อาจต้องรอ AI นานหลายสิบวินาที
+    try:
+        with db_actions.detached_transaction() as conn:
+            if not conn: return None
+            with conn.cursor() as cur:
+                if not _db_ready(cur): return None
+                cur.execute(f"""
+                    UPDATE {config.DB_SCHEMA}.ai_format_cache SET hits = hits + 1, last_hit_at = now()
+                    WHERE cache_key = %s AND expires_at > now()
+                    RETURNING formatted_content
+                """, (key,))
+                row = cur.fetchone()
+                return row[0] if row else None
+    except Exception as e:
+        # cache พังไม่ควรทำให้จัดรูปแบบไม่ได้
+        print(f"[ERROR] AI cache read failed: {e}")
+        _stats['db_errors'] += 1
+        return None
+
+def _db_put(key, formatted):
+    try:
+        with db_actions.detached_transaction() as conn:
+            if not conn: return
+            with conn.cursor() as cur:
+                if not _db_ready(cur): return
+                cur.execute(f"""
+                    INSERT INTO {config.DB_SCHEMA}.ai_format_cache (cache_key, model, formatted_content, expires_at)
+                    VALUES (%s, %s, %s, now() + make_interval(secs => %s))
+                    ON CONFLICT (cache_key) DO UPDATE
+                        SET formatted_content = EXCLUDED.formatted_content, created_at = now(), expires_at = EXCLUDED.expires_at
+                """, (key, os.getenv('AI_MODEL_NAME'), formatted, config.AI_CACHE_TTL))
+                # ลบรายการที่หมดอายุทีละนิดไปพร้อมกับการเขียน
+                cur.execute(f"""
+                    DELETE FROM {config.DB_SCHEMA}.ai_format_cache WHERE cache_key IN (
+                        SELECT cache_key FROM {config.DB_SCHEMA}.ai_format_cache WHERE expires_at < now() LIMIT 100
+                    )
+                """)
+    except Exception as e:
+        print(f"[ERROR] AI cache write failed: {e}")
+        _stats['db_errors'] += 1
+
+def _lookup(key):
+    found, value = _memory.get(key, ())
+    if found:
+        _stats['memory_hits'] += 1
+        return value
+    value = _db_get(key)
+    if value is not None:
+        _stats['db_hits'] += 1
+        _memory.set(key, (), value)
+    return value
+
+def _store(key, formatted):
+    _memory.set(key, (), formatted)
+    _db_put(key, formatted)
+
+
+class _Flight:
+    # การเรียก AI ที่กำลังทำอยู่ของ key หนึ่ง คำขอที่ตามมาจะรอผลจากตัวนี้
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def _join(key):
+    # คืนค่า (flight, เป็นผู้เรียก AI เองหรือไม่)
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            _stats['coalesced'] += 1
+            return flight, False
+        flight = _flights[key] = _Flight()
+        return flight, True
+
+def _land(key, flight, result=None, error=None):
+    flight.result, flight.error = result, error
+    with _flights_lock:
+        _flights.pop(key, None)
+    flight.done.set()
+
+def _wait(flight):
+    if not flight.done.wait(config.AI_READ_TIMEOUT * 4):
+        raise AIError("timed out waiting for identical request")
+    if flight.error is not None:
+        raise AIError(str(flight.error))
+    return flight.result
+
+def format_text(content):
+    # จัดรูปแบบแล้วคืนค่า Markdown ทั้งก้อน (ใช้ผลจาก cache ถ้ามี)
+    key = cache_key(content)
+    cached = _lookup(key)
+    if cached is not None:
+        return cached
+    flight, leader = _join(key)
+    if not leader:
+        return _wait(flight)
+    _stats['misses'] += 1
+    try:
+        result = _format_upstream(content)
+    except Exception as e:
+        _land(key, flight, error=e)
+        raise
+    if not missing_numbers(content, result):
+        _store(key, result)
+    _land(key, flight, result=result)
+    return result
+
+def stream_text(content):
+    # จัดรูปแบบแบบ stream: yield ข้อความทีละส่วนตามที่ AI ส่งมา
+    # ถ้ามีใน cache หรือมีคำขอเดียวกันกำลังทำอยู่ จะได้ผลทั้งก้อนใน yield เดียว
+    key = cache_key(content)
+    cached = _lookup(key)
+    if cached is not None:
+        yield cached
+        return
+    flight, leader = _join(key)
+    if not leader:
+        yield _wait(flight)
+        return
+    _stats['misses'] += 1
+    parts = []
+    try:
+        for delta in _stream_upstream(content):
+            parts.append(delta)
+            yield delta
+    except BaseException as e:
+        # รวมถึงกรณีผู้ใช้ปิดหน้าเว็บกลางทาง (GeneratorExit) ผลยังไม่ครบจึงไม่เก็บลง cache
+        _land(key, flight, error=e if isinstance(e, Exception) else AIError("request cancelled"))
+        raise
+    result = ''.join(parts)
+    if not missing_numbers(content, result):
+        _store(key, result)
+    _land(key, flight, result=result)
+
+# ส่วนตรวจความครบถ้วนของข้อมูล
+_THAI_DIGITS = str.maketrans('๐๑๒๓๔๕๖๗๘๙', '0123456789')
+_THOUSANDS = re.compile(r'(?<=\d),(?=\d{3}(?!\d))')
+
+def _numbers(text):
+    # ตัวเลขทุกชุดในข้อความ (เลขไทยแปลงเป็นอารบิก ตัด , หลักพันและ 0 นำหน้าออก) วันที่จึงถูกนับเป็นเลขวัน/เดือน/ปีด้วย
+    text = _THOUSANDS.sub('', text.translate(_THAI_DIGITS))
+    return Counter(n.lstrip('0') or '0' for n in re.findall(r'\d+', text))
+
+def missing_numbers(source, formatted):
+    # ตัวเลขที่มีในต้นฉบับแต่หายไปจากผลลัพธ์ (ตัวเลขที่เพิ่มเข้ามา เช่น เลขลำดับรายการ ไม่นับ)
+    return sorted((_numbers(source) - _numbers(formatted)).elements())
+
+
+# ส่วนแบ่งเอกสารยาวเป็นช่วง
+_HEADING_LINE = re.compile(r'^\s*(#{1,6}\s|\d+(\.\d+)*[.)]?\s|(บทที่|ส่วนที่|ขั้นตอนที่|หัวข้อ)\s*\S)')
+_MD_HEADING = re.compile(r'^(#{1,6})(?=\s)')
+
+def _cut(text, limit):
+    # ตัดข้อความที่ยาวเกิน limit (ไม่มีบรรทัดว่างให้แบ่ง) ตามบรรทัด หรือตามช่องว่างถ้าบรรทัดเดียวยังยาวเกิน
+    pieces, current = [], ''
+    for line in text.split('\n'):
+        while len(line) > limit:
+            cut = line.rfind(' ', 0, limit)
+            cut = cut if cut > limit // 2 else limit
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:cut])
+            line = line[cut:].lstrip()
+        if current and len(current) + len(line) + 1 > limit:
+            pieces.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_segments(text, limit=None):
+    # แบ่งข้อความดิบเป็นช่วงยาวไม่เกิน limit ตัวอักษร โดยตัดที่บรรทัดว่างระหว่างย่อหน้า
+    # ถ้าเจอบรรทัดที่ดูเป็นหัวข้อและช่วงปัจจุบันยาวเกินครึ่งแล้ว จะขึ้นช่วงใหม่ที่หัวข้อนั้น
+    limit = limit or config.AI_SEGMENT_CHARS
+    text = text.replace('\r\n', '\n').strip()
+    if len(text) <= limit:
+        return [text]
+    blocks = []
+    for block in re.split(r'\n[ \t]*\n', text):
+        if block.strip():
+            blocks.extend(_cut(block, limit) if len(block) > limit else [block])
+    segments, current = [], ''
+    for block in blocks:
+        starts_section = _HEADING_LINE.match(block) and len(current) > limit // 2
+        if current and (starts_section or len(current) + len(block) + 2 > limit):
+            segments.append(current)
+            current = block
+        else:
+            current = f"{current}\n\n{block}" if current else block
+    if current:
+        segments.append(current)
+    return segments
+
+def _heading_levels(markdown):
+    levels, in_code = [], False
+    for line in markdown.split('\n'):
+        if line.lstrip().startswith('```'):
+            in_code = not in_code
+            continue
+        match = None if in_code else _MD_HEADING.match(line)
+        if match:
+            levels.append(len(match.group(1)))
+    return levels
+
+def _demote_headings(markdown, min_level):
+    # เลื่อนระดับหัวข้อลงทั้งช่วงให้หัวข้อบนสุดอยู่ที่ min_level (ช่วงหลังๆ ไม่ควรมี # หัวข้อหลักซ้ำ)
+    levels = _heading_levels(markdown)
+    if not levels or min(levels) >= min_level:
+        return markdown
+    shift = min_level - min(levels)
+    lines, in_code = [], False
+    for line in markdown.split('\n'):
+        if line.lstrip().startswith('```'):
+            in_code = not in_code
+        elif not in_code:
+            match = _MD_HEADING.match(line)
+            if match:
+                line = '#' * min(6, len(match.group(1)) + shift) + line[match.end():]
+        lines.append(line)
+    return '\n'.join(lines)
+
+def _checked(segment, formatted, warnings):
+    # ตัวเลข/วันที่หายระหว่างจัดรูปแบบ: ใช้ข้อความเดิมของช่วงนั้นแทนและแจ้งเตือน
+    missing = missing_numbers(segment, formatted)
+    if not missing:
+        return formatted
+    print(f"[ERROR] AI formatting dropped numbers {missing[:10]}; keeping original segment")
+    warnings.append({'segment': segment[:80], 'missing': missing})
+    return segment
+
+def _format_segment(segment):
+    # ลองใหม่อีกครั้งถ้าผลรอบแรกทำตัวเลขหาย (ผลที่ไม่ผ่านไม่ถูกเก็บลง cache จึงได้คำตอบใหม่)
+    formatted = format_text(segment)
+    if missing_numbers(segment, formatted):
+        formatted = format_text(segment)
+    return formatted
+
+def _assemble(formatted_segments):
+    # ต่อช่วงกลับตามลำดับ ถ้าช่วงก่อนหน้ามี # หัวข้อหลักแล้ว ช่วงถัดไปจะเริ่มที่ ## เป็นอย่างน้อย
+    parts, has_title = [], False
+    for formatted in formatted_segments:
+        if has_title:
+            formatted = _demote_headings(formatted, 2)
+        has_title = has_title or 1 in _heading_levels(formatted)
+        parts.append(formatted.strip())
+    return '\n\n'.join(parts)
+
+def _executor(count):
+    workers = max(1, min(count, config.AI_SEGMENT_WORKERS, config.AI_MAX_CONCURRENT))
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-format')
+
+def format_document(content):
+    # จัดรูปแบบเอกสาร (ยาวแค่ไหนก็ได้) คืนค่า (Markdown, รายการแจ้งเตือนช่วงที่ตัวเลขหาย)
+    segments = split_segments(content)
+    warnings = []
+    if len(segments) == 1:
+        return _checked(segments[0], _format_segment(segments[0]), warnings), warnings
+    with _executor(len(segments)) as pool:
+        results = list(pool.map(_format_segment, segments))
+    return _assemble([_checked(seg, res, warnings) for seg, res in zip(segments, results)]), warnings
+
+def stream_document(content, outcome):
+    # จัดรูปแบบแบบ stream: เอกสารสั้น yield ทีละ token ส่วนเอกสารยาว yield ทีละช่วงตามลำดับ (ทุกช่วงทำพร้อมกัน)
+    # เมื่อจบจะใส่ผลสุดท้ายที่ผ่านการตรวจแล้วไว้ใน outcome['formatted_content'] และ outcome['warnings']
+    segments = split_segments(content)
+    warnings = outcome['warnings'] = []
+    if len(segments) == 1:
+        parts = []
+        for delta in stream_text(segments[0]):
+            parts.append(delta)
+            yield delta
+        outcome['formatted_content'] = _checked(segments[0], ''.join(parts), warnings)
+        return
+    pool = _executor(len(segments))
+    try:
+        futures = [pool.submit(_format_segment, seg) for seg in segments]
+        done, sent = [], ''
+        for segment, future in zip(segments, futures):
+            done.append(_checked(segment, future.result(), warnings))
+            # ระดับหัวข้อของช่วงนี้ขึ้นกับช่วงก่อนหน้า จึงประกอบใหม่แล้วส่งเฉพาะส่วนที่เพิ่มขึ้น
+            assembled = _assemble(done)
+            yield assembled[len(sent):]
+            sent = assembled
+        outcome['formatted_content'] = sent
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def prune():
+    # ลบผลลัพธ์ที่หมดอายุทั้งหมด คืนค่าจำนวนแถวที่ลบ (None ถ้าเชื่อมต่อไม่ได้)
+    _memory.clear()
+    with db_actions.transaction() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            if not _db_ready(cur): return 0
+            cur.execute(f"DELETE FROM {config.DB_SCHEMA}.ai_format_cache WHERE expires_at < now()")
+            return cur.rowcount
+
+def cache_stats():
+    return dict(_stats, in_flight=len(_flights))
+
+def upstream_stats():
+    # จำนวนครั้ง/ข้อผิดพลาด/ไม่ว่าง และ histogram เวลาที่ใช้ของการเรียก AI จริง
+    return dict(_upstream, latency={mode: h.snapshot() for mode, h in _latency.items()})
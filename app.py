@@ -1,9 +1,23 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, send_file, session
 import db_actions
+import bulk_io
+import cache
+import cache_sync
+import snapshot
+import ai_format
+import format_jobs
+import instrumentation
+import metrics
 import config
 import re
 import os
-import requests
+import io
+import json
+import shutil
+import tempfile
+import math
+import hashlib
+import functools
 import urllib3  
 
 # ปิดแจ้งเตือน SSL Warning จะได้ไม่รกหน้า Console ตอนรัน Docker
@@ -14,96 +28,414 @@ app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
 app.jinja_env.add_extension('jinja2.ext.do')
 
+# เริ่มตัวรอฟังการแก้ไขข้อมูลจาก worker อื่น และตัวรับงานจัดรูปแบบ background (ครั้งแรกที่ worker นี้รับ request)
+@app.before_request
+def start_cache_listener():
+    cache_sync.start()
+    format_jobs.start()
+    snapshot.start()
+
+# จับเวลา SQL ของแต่ละ request (จำนวน query, เวลาใน DB) ส่งกลับใน Server-Timing และเก็บ histogram ตาม route
+@app.before_request
+def begin_request_timing():
+    instrumentation.begin()
+
+@app.after_request
+def add_server_timing(response):
+    timing = instrumentation.server_timing() if config.SERVER_TIMING_ENABLED else None
+    if timing:
+        response.headers['Server-Timing'] = timing
+    return response
+
+# ทำหลังส่ง response เสร็จ (รวมเวลาของ response แบบ stream ด้วย)
+@app.teardown_request
+def finish_request_timing(exc):
+    instrumentation.finish(request.endpoint or '<unmatched>', request.method)
+
+# คืน connection ของแต่ละ request เข้า pool เมื่อจบ request
+@app.teardown_appcontext
+def release_db_connection(exc):
+    db_actions.release_request_connection(exc)
+
+# conditional GET: ETag = hash ของ (path, query string, version ของทุกตารางที่หน้านั้นใช้, โค้ด/template ที่ deploy อยู่)
+# version อ่านจากตาราง table_versions (migrations/007) จึงตรงกันทุก worker ถ้า If-None-Match ตรงจะตอบ 304 โดยไม่ query ข้อมูลจริง
+# ถ้าเปิด PAGE_CACHE_ENABLED จะเก็บหน้าที่ render แล้วไว้ตาม ETag (ต่อ worker) ผู้ใช้คนอื่นที่เปิดหน้าเดียวกันได้หน้าเดิมทันที
+def _build_id():
+    # เปลี่ยนเมื่อ deploy โค้ดหรือ template ใหม่ ETag เดิมจะได้ไม่ถูกใช้กับหน้าที่หน้าตาเปลี่ยนไปแล้ว
+    digest = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for folder, ext in ((root, '.py'), (os.path.join(root, 'templates'), '.html')):
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(ext):
+                with open(os.path.join(folder, name), 'rb') as f:
+                    digest.update(name.encode('utf-8') + f.read())
+    return digest.hexdigest()[:16]
+
+_BUILD_ID = _build_id()
+_page_cache = cache.TTLCache('pages', ttl=config.PAGE_CACHE_TTL, maxsize=config.PAGE_CACHE_SIZE)
+
+def _current_etag(tables, marker=None):
+    # คืนค่า None ถ้าใช้ ETag ไม่ได้ (ปิดไว้, มีข้อความ flash รอแสดงในหน้านี้ หรือยังไม่ได้รัน migration)
+    # marker คือฟังก์ชันที่คืนค่าข้อมูลส่วนที่ไม่มี version ในตาราง table_versions (คืน None = ไม่ใช้ ETag)
+    if not config.ETAG_ENABLED or '_flashes' in session:
+        return None
+    versions = db_actions.get_table_versions(tables)
+    if versions is None:
+        return None
+    if marker is not None:
+        extra = marker()
+        if extra is None:
+            return None
+        versions = versions + [extra]
+    key = json.dumps([_BUILD_ID, request.path, sorted(request.args.items(multi=True)), versions], ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+def _with_etag(response, etag):
+    # no-cache = เบราว์เซอร์เก็บได้แต่ต้องถามทุกครั้ง (ส่ง If-None-Match) ข้อมูลที่แก้แล้วจะไม่ค้าง
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def conditional_get(*tables, marker=None):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = _current_etag(tables, marker)
+            if etag is None:
+                return view(*args, **kwargs)
+            if request.if_none_match.contains_weak(etag):
+                return _with_etag(Response(status=304), etag)
+            found, page = _page_cache.get(etag, ()) if config.PAGE_CACHE_ENABLED else (False, None)
+            if found:
+                return _with_etag(Response(page[0], content_type=page[1]), etag)
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if config.PAGE_CACHE_ENABLED and not response.is_streamed:
+                _page_cache.set(etag, (), (response.get_data(), response.content_type))
+            return _with_etag(response, etag)
+        return wrapper
+    return decorator
+
 # dashboard
 @app.route('/')
+@conditional_get(*db_actions.DASHBOARD_TABLES,
+                 marker=lambda: db_actions.get_sessions_marker(request.args.get('sessions_before')))
 def index():
-    # ดึงตัวเลขสถิติภาพรวมมาขึ้นที่หน้าแรก
-    stats = db_actions.get_dashboard_stats()
-    return render_template('dashboard.html', stats=stats)
+    # ดึงตัวเลขสถิติภาพรวมมาขึ้นที่หน้าแรก (?sessions_before= ใช้เลื่อนดู session แชทที่เก่ากว่า)
+    sessions_before = request.args.get('sessions_before')
+    stats = db_actions.get_dashboard_stats(sessions_before=sessions_before)
+    return render_template('dashboard.html', stats=stats, sessions_before=sessions_before,
+                           options=db_actions.get_dropdown_options(),
+                           data_types=db_actions.get_distinct_values('manual_chunks', 'data_type'))
+
+_transcript_cache = cache.TTLCache('transcripts', ttl=config.TRANSCRIPT_CACHE_TTL, maxsize=config.TRANSCRIPT_CACHE_SIZE)
+
+@app.route('/dashboard/transcript')
+def chat_transcript():
+    # ข้อความของ session แชทหนึ่งเป็น HTML fragment ให้หน้าต่าง "ดูแชท" โหลดเมื่อกดเปิด (?before= ใช้โหลดข้อความที่เก่ากว่า)
+    # HTML ที่ render แล้วถูก cache ตาม marker ของ session (db_actions.get_session_marker) ข้อความถูกเพิ่ม/ลบ/แก้เมื่อไรจะได้ key ใหม่ทันที
+    session_id = request.args.get('session_id', '')
+    before = request.args.get('before')
+    marker = db_actions.get_session_marker(session_id)
+    etag = None
+    if marker is not None:
+        key = json.dumps([_BUILD_ID, session_id, before, marker], ensure_ascii=False)
+        etag = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        if request.if_none_match.contains_weak(etag):
+            return _with_etag(Response(status=304), etag)
+
+    def render():
+        result = db_actions.get_session_messages(session_id, before=before, limit=config.TRANSCRIPT_PAGE_SIZE)
+        if result is None:
+            return None
+        messages, older = result
+        return render_template('chat_transcript.html', messages=messages, older=older, session_id=session_id)
+
+    html = _transcript_cache.get_or_load((session_id, before, marker), (), render) if marker is not None else render()
+    if html is None:
+        return Response('ไม่สามารถเชื่อมต่อฐานข้อมูลได้', status=503, mimetype='text/plain')
+    response = Response(html, mimetype='text/html')
+    return _with_etag(response, etag) if etag else response
+
+# monitoring
+@app.route('/api/pool-stats')
+def pool_stats():
+    # สถิติ connection pool ของ worker นี้ (จำนวนที่ใช้งาน การรอคิว เวลารอ)
+    return jsonify(db_actions.get_pool_stats())
+
+@app.route('/api/cache-stats')
+def cache_stats():
+    # สถิติ cache ของ worker นี้ (hit/miss, ขนาด, version ของแต่ละตาราง)
+    stats = db_actions.get_cache_stats()
+    stats['ai_format'] = ai_format.cache_stats()
+    return jsonify(stats)
+
+@app.route('/api/request-stats')
+def request_stats():
+    # histogram เวลาตอบกลับ / เวลาใน DB / จำนวน query แยกตาม route ของ worker นี้
+    return jsonify(instrumentation.route_stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # ตัวชี้วัดของ worker นี้ในรูปแบบ Prometheus (latency ต่อ route, DB/pool, AI, cache, สถานะ sync ของบอท)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# bot sync
+@app.route('/api/changes')
+def changes():
+    # รายการที่เปลี่ยนหลัง version ที่ระบุ ใช้ให้บอท index ใหม่เฉพาะส่วนที่เปลี่ยน
+    # I/U ให้ถือเป็น upsert, D คือลบ ถ้า resync_required เป็น true ต้อง sync ใหม่ทั้งหมดแล้วเริ่มจาก next
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+    result = db_actions.get_changes(since, limit)
+    if result is None:
+        return jsonify({'error': 'change journal ไม่พร้อมใช้งาน'}), 503
+    return jsonify(result)
+
+@app.route('/api/snapshot')
+def knowledge_snapshot():
+    # ไฟล์ SQLite ของฐานความรู้ทั้งหมดที่สร้างเสร็จล่าสุด (สร้างใหม่เบื้องหลังหลังมีการแก้ไข ดู snapshot.start)
+    # X-Snapshot-Version คือ version ของ journal ตอนสร้าง ใช้เป็น since ของ /api/changes เพื่อตามการแก้ไขหลังจากนั้น
+    # ETag คือ sha256 ของไฟล์ ส่ง If-None-Match มาจะได้ 304 ถ้าไม่มีอะไรเปลี่ยน
+    info, f = snapshot.open_current()
+    if info is None:
+        snapshot.request_build()
+        return jsonify({'error': 'กำลังสร้าง snapshot ลองใหม่อีกครั้ง'}), 503, {'Retry-After': '30'}
+    # ส่งไฟล์ที่เปิดไว้แล้ว (ไม่ใช่ path) ไฟล์จึงไม่หายระหว่างส่งแม้ตัวสร้างลบรุ่นเก่าทิ้ง
+    size = os.fstat(f.fileno()).st_size
+    response = send_file(f, mimetype='application/vnd.sqlite3', as_attachment=True,
+                         download_name='kb_snapshot.sqlite', etag=info['sha256'], conditional=True, max_age=0)
+    if response.status_code == 200:
+        response.content_length = size
+    response.headers['X-Snapshot-Version'] = '' if info['journal_version'] is None else str(info['journal_version'])
+    response.headers['X-Snapshot-Built-At'] = info['built_at']
+    return response
+
+@app.route('/api/snapshot/info')
+def knowledge_snapshot_info():
+    # ข้อมูลของ snapshot ล่าสุดที่สร้างไว้ (ไม่สร้างใหม่)
+    info = snapshot.current_info()
+    if info is None:
+        return jsonify({'error': 'ยังไม่มี snapshot', 'builder': snapshot.stats()}), 404
+    info.pop('path', None)
+    info['builder'] = snapshot.stats()
+    return jsonify(info)
 
 # ai formatting
 @app.route('/api/format-markdown', methods=['POST'])
 def format_markdown():
-    # รับข้อความดิบจากหน้าบ้าน 
+    # รับข้อความดิบจากหน้าบ้าน
+    # ถ้าขอแบบ stream (Accept: text/event-stream หรือ ?stream=1) จะส่งผลทีละส่วนแบบ Server-Sent Events:
+    #   data: {"delta": "..."}  ระหว่างทาง, event: done (เนื้อหาทั้งหมด) ตอนจบ, event: error ถ้าพัง
+    # warnings คือช่วงที่ AI ทำตัวเลข/วันที่หาย ช่วงนั้นจะคงข้อความเดิมไว้
     raw_content = request.json.get('content', '')
     if not raw_content:
         return jsonify({'error': 'No content provided'}), 400
-
-    system_prompt = (
-        "Role: You are an expert in structuring research data.\n"
-        "Task: Convert the provided raw text into clear, well-structured Markdown (MD).\n"
-        "Formatting rules:\n"
-        "- Use `#` for main headings.\n"
-        "- Use `##` for subheadings.\n"
-        "- Use `-` for bulleted lists.\n"
-        "CRITICAL CONSTRAINT: Do NOT alter, modify, or remove any numbers, research fund names, or dates. You must maintain 100% data integrity from the original text."
-    )
-
+    # คืน connection ของ request ก่อนรอ AI (cache ของ AI ยืม connection สั้นๆ เอง)
+    db_actions.release_request_connection()
+
+    wants_stream = request.args.get('stream') == '1' or 'text/event-stream' in request.headers.get('Accept', '')
+    if not wants_stream:
+        try:
+            formatted, warnings = ai_format.format_document(raw_content)
+            return jsonify({'formatted_content': formatted, 'warnings': warnings})
+        except ai_format.AIBusy:
+            return jsonify({'error': 'มีการใช้งาน AI พร้อมกันมากเกินไป กรุณาลองใหม่อีกครั้ง'}), 503
+        except Exception as e:
+            print(f"[ERROR] AI Formatting Failed: {e}")
+            return jsonify({'error': 'ไม่สามารถเชื่อมต่อ AI Server หรือ API Key ไม่ถูกต้อง'}), 500
+
+    def sse(data, event=None):
+        head = f"event: {event}\n" if event else ""
+        return head + "data: " + json.dumps(data, ensure_ascii=False) + "\n\n"
+
+    def generate():
+        outcome = {}
+        try:
+            for delta in ai_format.stream_document(raw_content, outcome):
+                yield sse({'delta': delta})
+            yield sse({'formatted_content': outcome['formatted_content'], 'warnings': outcome['warnings']}, event='done')
+        except ai_format.AIBusy:
+            yield sse({'error': 'มีการใช้งาน AI พร้อมกันมากเกินไป กรุณาลองใหม่อีกครั้ง'}, event='error')
+        except Exception as e:
+            print(f"[ERROR] AI Formatting Failed: {e}")
+            yield sse({'error': 'ไม่สามารถเชื่อมต่อ AI Server หรือ API Key ไม่ถูกต้อง'}, event='error')
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# background format jobs
+@app.route('/api/format-jobs', methods=['GET', 'POST'])
+def format_job_list():
+    # GET: งานล่าสุดพร้อมความคืบหน้า, POST: สร้างงานใหม่ {data_type, category_id, doc_id, mode, concurrency, rate_per_minute}
+    if request.method == 'GET':
+        jobs = format_jobs.list_jobs(limit=min(request.args.get('limit', 20, type=int), 100))
+        if jobs is None:
+            return jsonify({'error': 'ระบบงาน background ไม่พร้อมใช้งาน (ยังไม่ได้รัน migration?)'}), 503
+        return jsonify({'jobs': jobs, 'worker': format_jobs.stats()})
+
+    body = request.get_json(silent=True) or {}
+    mode = body.get('mode', 'draft')
+    if mode not in format_jobs.MODES:
+        return jsonify({'error': f'mode ต้องเป็น {", ".join(format_jobs.MODES)}'}), 400
     try:
-        # ดึงค่าจาก Environment Variables
-        api_url = os.getenv('AI_API_URL')
-        model_name = os.getenv('AI_MODEL_NAME')
-        api_key = os.getenv('AI_API_KEY')
-
-        # สร้าง Headers สำหรับยืนยันตัวตน (Bearer Token)
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": model_name,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": raw_content}
-            ],
-            "temperature": 0.2,
-            "max_tokens": 2048
-        }
-        
-        # ส่ง Request ไปที่ API รอบเดียวจบ
-        response = requests.post(api_url, json=payload, headers=headers, timeout=45)
-        
-        # ดักจับ Error
-        if response.status_code != 200:
-            print(f"\n--- OPENTYPHOON ERROR ---")
-            print(f"Status Code: {response.status_code}")
-            print(f"Message: {response.text}")
-
-        # ถ้าไม่ 200 OK ให้กระโดดไปหา except ทันที
-        response.raise_for_status()
-        
-        ai_data = response.json()
-        formatted_md = ai_data['choices'][0]['message']['content']
-        
-        return jsonify({'formatted_content': formatted_md})
-        
+        filters = {k: body.get(k) for k in format_jobs.FILTERS}
+        for key in ('category_id', 'doc_id'):
+            if filters[key] not in (None, ''):
+                filters[key] = int(filters[key])
+        job_id = format_jobs.create_job(filters, mode, body.get('concurrency'), body.get('rate_per_minute'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'ค่าที่ส่งมาไม่ถูกต้อง'}), 400
+    if job_id is None:
+        return jsonify({'error': 'ไม่สามารถสร้างงานได้'}), 503
+    return jsonify(format_jobs.get_job(job_id, limit=0)), 201
+
+@app.route('/api/format-jobs/<int:job_id>')
+def format_job_detail(job_id):
+    # รายละเอียดงาน ?status=failed|drafted|... เพื่อดูเฉพาะรายการสถานะนั้น
+    item_status = request.args.get('status')
+    if item_status and item_status not in format_jobs.ITEM_STATUSES:
+        return jsonify({'error': 'status ไม่ถูกต้อง'}), 400
+    job = format_jobs.get_job(job_id, item_status, limit=min(request.args.get('limit', 100, type=int), 1000))
+    if job is None:
+        return jsonify({'error': 'ไม่พบงาน'}), 404
+    return jsonify(job)
+
+@app.route('/api/format-jobs/<int:job_id>/<action>', methods=['POST'])
+def format_job_action(job_id, action):
+    # pause / resume / cancel หรือ apply (บันทึกผลที่เป็น draft ลงคู่มือ, ส่ง {"chunk_ids": [...]} เพื่อเลือกบางรายการ)
+    if action == 'apply':
+        chunk_ids = (request.get_json(silent=True) or {}).get('chunk_ids')
+        result = format_jobs.apply_drafts(job_id, chunk_ids)
+        if result is None:
+            return jsonify({'error': 'ไม่สามารถเชื่อมต่อฐานข้อมูลได้'}), 503
+        return jsonify({'applied': result[0], 'skipped': result[1]})
+    if action not in ('pause', 'resume', 'cancel'):
+        return jsonify({'error': 'ไม่รู้จักคำสั่งนี้'}), 404
+    status = format_jobs.set_status(job_id, action)
+    if status is None:
+        return jsonify({'error': 'เปลี่ยนสถานะงานนี้ไม่ได้'}), 409
+    return jsonify({'id': job_id, 'status': status})
+
+# ดึงรายการแบบแบ่งหน้าสำหรับหน้า list ทุกหน้า
+# ถ้ามี ?cursor= จะใช้ keyset pagination (ลึกแค่ไหนก็เร็วเท่าหน้าแรก) ส่วนเลขหน้ายังใช้ OFFSET ตามเดิม
+def _paginate(table_name, order_by_col, search_cols, filter_col):
+    page = max(1, request.args.get('page', 1, type=int))
+    search = request.args.get('search', '')
+    filter_val = request.args.get('filter', '')
+    cursor = request.args.get('cursor')
+    per_page = 10
+    query = dict(search_query=search, search_cols=search_cols, filter_col=filter_col, filter_val=filter_val)
+
+    # ผลการค้นหาเรียงตามความเกี่ยวข้อง ใช้ cursor ไม่ได้ จึงแบ่งหน้าด้วยเลขหน้าอย่างเดียว
+    if cursor and not search and db_actions.decode_cursor(order_by_col, cursor):
+        items, next_cursor, prev_cursor, total_count, count_mode = db_actions.get_keyset_list(
+            table_name=table_name, order_by_col=order_by_col, cursor=cursor, per_page=per_page, **query)
+        total_pages = max(1, math.ceil(total_count / per_page))
+        # จำนวนแบบ N+ หรือค่าประมาณ อาจเดินเลยหน้าสุดท้ายที่คำนวณได้ด้วย cursor
+        page = min(page, total_pages) if count_mode == 'exact' else page
+        total_pages = max(total_pages, page)
+    else:
+        items, total_pages, total_count, count_mode = db_actions.get_paginated_list(
+            table_name=table_name, order_by_col=order_by_col, page=page, per_page=per_page, **query)
+        # ปุ่มก่อนหน้า/ถัดไปจะพาไปใช้ keyset ต่อ ไม่ต้อง OFFSET ยาวๆ
+        next_cursor = prev_cursor = None
+        if items and not search:
+            if page < total_pages or count_mode != 'exact':
+                next_cursor = db_actions.encode_cursor(order_by_col, items[-1], 'next')
+            if page > 1:
+                prev_cursor = db_actions.encode_cursor(order_by_col, items[0], 'prev')
+
+    return items, dict(page=page, total_pages=total_pages, total_count=total_count, count_mode=count_mode,
+                       next_cursor=next_cursor, prev_cursor=prev_cursor,
+                       search=search, filter_val=filter_val)
+
+# ลบข้อมูลตารางหลัก (ทีละรายการหรือหลายรายการ) พร้อมตรวจการใช้งานในตารางลูก
+# ตารางหลัก -> (ชื่อที่ใช้ในข้อความ, หน้ารายการ)
+_DELETE_TARGETS = {
+    'research_funds': ('ทุนวิจัย', 'funds_list'),
+    'documents': ('เอกสาร', 'documents_list'),
+    'categories': ('หมวดหมู่', 'categories_list'),
+}
+_MAX_DELETE_MESSAGES = 10   # แสดงรายละเอียดของรายการที่ลบไม่ได้ไม่เกินนี้ ที่เหลือสรุปเป็นจำนวน
+
+def _selected_ids():
+    # ID ที่ติ๊กเลือกในหน้ารายการ (ข้ามค่าที่ไม่ใช่ตัวเลข)
+    return [int(v) for v in request.form.getlist('ids') if v.strip().isdigit()]
+
+def _describe_blockers(children):
+    # {'manual_chunks': {'page': 'manuals', 'count': 35, 'ids': [...]}} -> ข้อความอธิบาย
+    parts = []
+    for info in children.values():
+        id_str = ", ".join(map(str, info['ids']))
+        more = f" (ทั้งหมด {info['count']} รายการ)" if info['count'] > len(info['ids']) else ""
+        parts.append(f'พบการใช้งานในหน้า "{info["page"]}" ID ที่ {id_str}{more}')
+    return ", ".join(parts)
+
+def _delete_and_report(table_name, ids):
+    noun, endpoint = _DELETE_TARGETS[table_name]
+    if not ids:
+        flash('ยังไม่ได้เลือกรายการที่จะลบ', 'warning')
+        return redirect(url_for(endpoint))
+    try:
+        result = db_actions.bulk_delete(table_name, ids)
     except Exception as e:
-        print(f"[ERROR] AI Formatting Failed: {e}")
-        return jsonify({'error': 'ไม่สามารถเชื่อมต่อ AI Server หรือ API Key ไม่ถูกต้อง'}), 500
-    
+        flash(f'ลบไม่สำเร็จ: {e}', 'danger')
+        return redirect(url_for(endpoint))
+    if result is None:
+        flash('ลบไม่สำเร็จ: ไม่สามารถเชื่อมต่อฐานข้อมูลได้', 'danger')
+        return redirect(url_for(endpoint))
+
+    deleted = result['deleted']
+    if len(deleted) > _MAX_DELETE_MESSAGES:
+        flash(f'ลบ{noun} {len(deleted)} รายการสำเร็จ', 'success')
+    elif deleted:
+        flash(f'ลบ{noun} ID {", ".join(map(str, deleted))} สำเร็จ', 'success')
+    blocked = list(result['blocked'].items())
+    for parent_id, children in blocked[:_MAX_DELETE_MESSAGES]:
+        flash(f'ลบ{noun} ID {parent_id} ไม่สำเร็จ: {_describe_blockers(children)}', 'danger')
+    if len(blocked) > _MAX_DELETE_MESSAGES:
+        flash(f'และยังมีอีก {len(blocked) - _MAX_DELETE_MESSAGES} รายการที่ลบไม่ได้เพราะมีการใช้งานอยู่', 'danger')
+    if result['missing']:
+        flash(f'ไม่พบ{noun} ID {", ".join(map(str, result["missing"]))}', 'warning')
+    return redirect(url_for(endpoint))
+
+@app.route('/api/dependencies/<table_name>')
+def dependencies_api(table_name):
+    # ?ids=1,2,3 -> {"blockers": {"1": {"manual_chunks": {"page", "count", "ids"}}}} เฉพาะ id ที่ยังลบไม่ได้
+    if table_name not in db_actions.DEPENDENCIES:
+        return jsonify({'error': 'ไม่รองรับตารางนี้'}), 404
+    ids = [int(v) for v in request.args.get('ids', '').split(',') if v.strip().isdigit()]
+    blockers = db_actions.get_dependencies(table_name, ids)
+    if blockers is None:
+        return jsonify({'error': 'ไม่สามารถเชื่อมต่อฐานข้อมูลได้'}), 503
+    return jsonify({'blockers': blockers})
+
+@app.route('/api/bulk-delete/<table_name>', methods=['POST'])
+def bulk_delete_api(table_name):
+    # {"ids": [1, 2, 3]} -> {"deleted": [...], "blocked": {...}, "missing": [...]}
+    if table_name not in db_actions.DEPENDENCIES:
+        return jsonify({'error': 'ไม่รองรับตารางนี้'}), 404
+    ids = (request.get_json(silent=True) or {}).get('ids') or []
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({'error': 'ids ต้องเป็นรายการตัวเลข'}), 400
+    try:
+        result = db_actions.bulk_delete(table_name, ids)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if result is None:
+        return jsonify({'error': 'ไม่สามารถเชื่อมต่อฐานข้อมูลได้'}), 503
+    return jsonify(result)
+
 # research funds
 @app.route('/funds')
+@conditional_get('research_funds')
 def funds_list():
     # แสดงรายการทุนวิจัย ค้นหาได้ กรองสถานะได้ และแบ่งหน้าได้
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    filter_val = request.args.get('filter', '') 
     status_options = db_actions.get_distinct_values('research_funds', 'status')
-
-    items, total_pages, total_count = db_actions.get_paginated_list(
-        table_name='research_funds', 
-        order_by_col='fund_id ASC', 
-        page=max(1, page),
-        search_query=search,
-        search_cols=['fund_abbr', 'fund_name_th', 'source_agency'],
-        filter_col='status',
-        filter_val=filter_val
-    )
-    return render_template('funds_list.html', funds=items, 
-                           page=page, total_pages=total_pages, total_count=total_count,
-                           search=search, filter_val=filter_val,
-                           status_options=status_options)
+    items, pager = _paginate('research_funds', 'fund_id ASC', ['fund_abbr', 'fund_name_th', 'source_agency'], 'status')
+    return render_template('funds_list.html', funds=items, status_options=status_options, **pager)
 
 @app.route('/funds/add', methods=['GET', 'POST'])
 def funds_add():
@@ -121,14 +453,13 @@ def funds_add():
 @app.route('/funds/edit/<int:id>', methods=['GET', 'POST'])
 def funds_edit(id):
     # ดึงข้อมูลทุนเดิมมาแก้ไขตาม ID
-    conn = db_actions.get_db_connection()
     item = {}
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.research_funds WHERE fund_id=%s", (id,))
-            if cur.rowcount > 0:
-                item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
-        conn.close()
+    with db_actions.get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.research_funds WHERE fund_id=%s", (id,))
+                if cur.rowcount > 0:
+                    item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
     if request.method == 'POST':
         if db_actions.update_fund(id, request.form.to_dict()):
             flash('แก้ไขสำเร็จ', 'success')
@@ -140,52 +471,21 @@ def funds_edit(id):
 @app.route('/funds/delete/<int:id>', methods=['POST'])
 def funds_delete(id):
     # ระบบลบทุน: มีการเช็คความสัมพันธ์ว่ามีคู่มือตัวไหนใช้อยู่ไหม
-    fund_abbr = None
-    conn = db_actions.get_db_connection()
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT fund_abbr FROM {config.DB_SCHEMA}.research_funds WHERE fund_id=%s", (id,))
-            res = cur.fetchone()
-            if res: fund_abbr = res[0]
-        conn.close()
+    return _delete_and_report('research_funds', [id])
 
-    try:
-        if db_actions.delete_fund(id):
-            flash(f'ลบทุนวิจัย ID {id} สำเร็จ', 'success')
-        else:
-            flash(f'ไม่พบข้อมูลทุน ID {id}', 'warning')
-    except Exception as e:
-        err_msg = str(e).lower()
-        if 'manual_chunks' in err_msg:
-            ids = db_actions.get_blocking_ids('manual_chunks', 'fund_abbr', fund_abbr)
-            id_str = ", ".join(map(str, ids))
-            flash(f'ลบไม่สำเร็จ: พบการใช้งานในหน้า "manuals" ID ที่ {id_str}', 'danger')
-        else:
-            flash(f'ลบไม่สำเร็จ: {e}', 'danger')
-    return redirect(url_for('funds_list'))
+@app.route('/funds/delete-selected', methods=['POST'])
+def funds_delete_selected():
+    # ลบทุนที่เลือกหลายรายการพร้อมกัน
+    return _delete_and_report('research_funds', _selected_ids())
 
 # glossary
 @app.route('/glossary')
+@conditional_get('glossary_terms')
 def glossary_list():
     # แสดงรายการพจนานุกรมคำศัพท์
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    filter_val = request.args.get('filter', '') 
     type_options = db_actions.get_distinct_values('glossary_terms', 'word_type')
-
-    items, total_pages, total_count = db_actions.get_paginated_list(
-        table_name='glossary_terms', 
-        order_by_col='word_id ASC', 
-        page=max(1, page),
-        search_query=search,
-        search_cols=['word', 'meaning'], 
-        filter_col='word_type',
-        filter_val=filter_val
-    )
-    return render_template('glossary_list.html', terms=items, 
-                           page=page, total_pages=total_pages, total_count=total_count,
-                           search=search, filter_val=filter_val,
-                           type_options=type_options)
+    items, pager = _paginate('glossary_terms', 'word_id ASC', ['word', 'meaning'], 'word_type')
+    return render_template('glossary_list.html', terms=items, type_options=type_options, **pager)
 
 @app.route('/glossary/add', methods=['GET', 'POST'])
 def glossary_add():
@@ -203,14 +503,13 @@ def glossary_add():
 @app.route('/glossary/edit/<int:id>', methods=['GET', 'POST'])
 def glossary_edit(id):
     # แก้ไขคำศัพท์หรือความหมาย
-    conn = db_actions.get_db_connection()
     item = {}
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.glossary_terms WHERE word_id=%s", (id,))
-            if cur.rowcount > 0:
-                item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
-        conn.close()
+    with db_actions.get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.glossary_terms WHERE word_id=%s", (id,))
+                if cur.rowcount > 0:
+                    item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
     if request.method == 'POST':
         if db_actions.update_glossary(id, request.form.to_dict()):
             flash('แก้ไขสำเร็จ', 'success')
@@ -230,26 +529,12 @@ def glossary_delete(id):
 
 # documents
 @app.route('/documents')
+@conditional_get('documents')
 def documents_list():
     # แสดงรายการเอกสารต้นฉบับ
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    filter_val = request.args.get('filter', '') 
     version_options = db_actions.get_distinct_values('documents', 'version')
-
-    items, total_pages, total_count = db_actions.get_paginated_list(
-        table_name='documents', 
-        order_by_col='id ASC', 
-        page=max(1, page),
-        search_query=search,
-        search_cols=['title', 'version'],
-        filter_col='version',  
-        filter_val=filter_val
-    )
-    return render_template('documents_list.html', docs=items, 
-                           page=page, total_pages=total_pages, total_count=total_count,
-                           search=search, filter_val=filter_val,
-                           version_options=version_options)
+    items, pager = _paginate('documents', 'id ASC', ['title', 'version'], 'version')
+    return render_template('documents_list.html', docs=items, version_options=version_options, **pager)
 
 @app.route('/documents/add', methods=['GET', 'POST'])
 def documents_add():
@@ -266,14 +551,13 @@ def documents_add():
 @app.route('/documents/edit/<int:id>', methods=['GET', 'POST'])
 def documents_edit(id):
     # แก้ไขชื่อเอกสารหรือเวอร์ชัน
-    conn = db_actions.get_db_connection()
     item = {}
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.documents WHERE id=%s", (id,))
-            if cur.rowcount > 0:
-                item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
-        conn.close()
+    with db_actions.get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.documents WHERE id=%s", (id,))
+                if cur.rowcount > 0:
+                    item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
     if request.method == 'POST':
         if db_actions.update_document(id, request.form.to_dict()):
             flash('แก้ไขสำเร็จ', 'success')
@@ -284,44 +568,21 @@ def documents_edit(id):
 @app.route('/documents/delete/<int:id>', methods=['POST'])
 def documents_delete(id):
     # ลบเอกสาร: เช็คก่อนว่าติด Manual ตัวไหนอยู่ไหม
-    try:
-        if db_actions.delete_document(id):
-            flash(f'ลบเอกสาร ID {id} สำเร็จ', 'success')
-        else:
-            flash(f'ไม่พบเอกสาร ID {id}', 'warning')
-    except Exception as e:
-        err_msg = str(e).lower()
-        if 'manual_chunks' in err_msg:
+    return _delete_and_report('documents', [id])
 
-            ids = db_actions.get_blocking_ids('manual_chunks', 'doc_id', id)
-            id_str = ", ".join(map(str, ids))
-            flash(f'ลบไม่สำเร็จ: พบการใช้งานในหน้า "manuals" ID ที่ {id_str}', 'danger')
-        else:
-            flash(f'ลบไม่สำเร็จ: {e}', 'danger')
-    return redirect(url_for('documents_list'))
+@app.route('/documents/delete-selected', methods=['POST'])
+def documents_delete_selected():
+    # ลบเอกสารที่เลือกหลายรายการพร้อมกัน
+    return _delete_and_report('documents', _selected_ids())
 
 # categories
 @app.route('/categories')
+@conditional_get('categories')
 def categories_list():
     # รายการหมวดหมู่ข้อมูล
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    filter_val = request.args.get('filter', '') 
     group_options = db_actions.get_distinct_values('categories', 'main_group')
-
-    items, total_pages, total_count = db_actions.get_paginated_list(
-        table_name='categories', 
-        order_by_col='id ASC', 
-        page=max(1, page),
-        search_query=search,
-        search_cols=['name', 'description', 'main_group'],
-        filter_col='main_group',
-        filter_val=filter_val
-    )
-    return render_template('categories_list.html', cats=items, 
-                           page=page, total_pages=total_pages, total_count=total_count,
-                           search=search, filter_val=filter_val,
-                           group_options=group_options)
+    items, pager = _paginate('categories', 'id ASC', ['name', 'description', 'main_group'], 'main_group')
+    return render_template('categories_list.html', cats=items, group_options=group_options, **pager)
 
 @app.route('/categories/add', methods=['GET', 'POST'])
 def categories_add():
@@ -339,14 +600,13 @@ def categories_add():
 @app.route('/categories/edit/<int:id>', methods=['GET', 'POST'])
 def categories_edit(id):
     # แก้ไขหมวดหมู่
-    conn = db_actions.get_db_connection()
     item = {}
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.categories WHERE id=%s", (id,))
-            if cur.rowcount > 0:
-                item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
-        conn.close()
+    with db_actions.get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.categories WHERE id=%s", (id,))
+                if cur.rowcount > 0:
+                    item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
     if request.method == 'POST':
         if db_actions.update_category(id, request.form.to_dict()):
             flash('แก้ไขสำเร็จ', 'success')
@@ -358,47 +618,21 @@ def categories_edit(id):
 @app.route('/categories/delete/<int:id>', methods=['POST'])
 def categories_delete(id):
     # ลบหมวดหมู่: เช็คทั้งใน "คู่มือ" และ "เคสช่วยเหลือ"
-    try:
-        if db_actions.delete_category(id):
-            flash(f'ลบหมวดหมู่ ID {id} สำเร็จ', 'success')
-        else:
-            flash(f'ไม่พบหมวดหมู่ ID {id}', 'warning')
-    except Exception as e:
-        err_msg = str(e).lower()
-        if 'manual_chunks' in err_msg:
-            ids = db_actions.get_blocking_ids('manual_chunks', 'category_id', id)
-            id_str = ", ".join(map(str, ids))
-            flash(f'ลบไม่สำเร็จ: พบการใช้งานในหน้า "manuals" ID ที่ {id_str}', 'danger')
-        elif 'support_stories' in err_msg:
-            ids = db_actions.get_blocking_ids('support_stories', 'category_id', id)
-            id_str = ", ".join(map(str, ids))
-            flash(f'ลบไม่สำเร็จ: พบการใช้งานในหน้า "stories" ID ที่ {id_str}', 'danger')
-        else:
-            flash(f'ลบไม่สำเร็จ: ข้อมูล ID {id} ติดปัญหาความสัมพันธ์อื่น', 'danger')
-    return redirect(url_for('categories_list'))
+    return _delete_and_report('categories', [id])
+
+@app.route('/categories/delete-selected', methods=['POST'])
+def categories_delete_selected():
+    # ลบหมวดหมู่ที่เลือกหลายรายการพร้อมกัน
+    return _delete_and_report('categories', _selected_ids())
 
 # manuals
 @app.route('/manuals')
+@conditional_get('manual_chunks')
 def manuals_list():
     # รายการเนื้อหาย่อยของคู่มือสำหรับสอนบอท
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    filter_val = request.args.get('filter', '') 
     type_options = db_actions.get_distinct_values('manual_chunks', 'data_type')
-
-    items, total_pages, total_count = db_actions.get_paginated_list(
-        table_name='manual_chunks',  
-        order_by_col='id ASC', 
-        page=max(1, page),
-        search_query=search,
-        search_cols=['topic', 'content', 'category_name', 'doc_title'],
-        filter_col='data_type', 
-        filter_val=filter_val
-    )
-    return render_template('manuals_list.html', chunks=items, 
-                           page=page, total_pages=total_pages, total_count=total_count,
-                           search=search, filter_val=filter_val,
-                           type_options=type_options) 
+    items, pager = _paginate('manual_chunks', 'id ASC', ['topic', 'content', 'category_name', 'doc_title'], 'data_type')
+    return render_template('manuals_list.html', chunks=items, type_options=type_options, **pager)
 
 @app.route('/manuals/add', methods=['GET', 'POST'])
 def manuals_add():
@@ -422,14 +656,13 @@ def manuals_add():
 @app.route('/manuals/edit/<int:id>', methods=['GET', 'POST'])
 def manuals_edit(id):
     # แก้ไขคู่มือตาม ID
-    conn = db_actions.get_db_connection()
     item = {}
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.manual_chunks WHERE id=%s", (id,))
-            if cur.rowcount > 0:
-                item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
-        conn.close()
+    with db_actions.get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.manual_chunks WHERE id=%s", (id,))
+                if cur.rowcount > 0:
+                    item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
     if request.method == 'POST':
         data = request.form.to_dict()
         
@@ -458,26 +691,12 @@ def manuals_delete(id):
 
 # support stories
 @app.route('/stories')
+@conditional_get('view_support_stories')
 def stories_list():
     # รายการเคสช่วยเหลือและวิธีแก้ไขสำหรับสอนบอท
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    filter_val = request.args.get('filter', '') 
     options = db_actions.get_dropdown_options()
-
-    items, total_pages, total_count = db_actions.get_paginated_list(
-        table_name='support_stories', 
-        order_by_col='id ASC', 
-        page=max(1, page),
-        search_query=search,
-        search_cols=['scenario', 'solution', 'category_name'],
-        filter_col='category_name',
-        filter_val=filter_val
-    )
-    return render_template('stories_list.html', stories=items, 
-                           page=page, total_pages=total_pages, total_count=total_count,
-                           search=search, filter_val=filter_val,
-                           categories=options['categories'])
+    items, pager = _paginate('support_stories', 'id ASC', ['scenario', 'solution', 'category_name'], 'category_name')
+    return render_template('stories_list.html', stories=items, categories=options['categories'], **pager)
 
 @app.route('/stories/add', methods=['GET', 'POST'])
 def stories_add():
@@ -495,14 +714,13 @@ def stories_add():
 @app.route('/stories/edit/<int:id>', methods=['GET', 'POST'])
 def stories_edit(id):
     # แก้ไขเคสเดิม
-    conn = db_actions.get_db_connection()
     item = {}
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT ss.*, c.name as category_name FROM {config.DB_SCHEMA}.support_stories ss LEFT JOIN {config.DB_SCHEMA}.categories c ON ss.category_id=c.id WHERE ss.id=%s", (id,))
-            if cur.rowcount > 0:
-                item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
-        conn.close()
+    with db_actions.get_db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT ss.*, c.name as category_name FROM {config.DB_SCHEMA}.support_stories ss LEFT JOIN {config.DB_SCHEMA}.categories c ON ss.category_id=c.id WHERE ss.id=%s", (id,))
+                if cur.rowcount > 0:
+                    item = dict(zip([d[0] for d in cur.description], cur.fetchone()))
     if request.method == 'POST':
         if db_actions.update_support_story(id, request.form.to_dict()):
             flash('แก้ไขสำเร็จ', 'success')
@@ -520,6 +738,79 @@ def stories_delete(id):
     except Exception as e: flash(f'ลบไม่สำเร็จ {e}', 'danger')
     return redirect(url_for('stories_list'))
 
+# bulk import
+@app.route('/import')
+def import_page():
+    # หน้าอัปโหลดไฟล์ CSV/JSONL เพื่อนำเข้าข้อมูลทีละมากๆ
+    return render_template('import.html', tables=sorted(bulk_io.IMPORT_TARGETS), selected=request.args.get('table'))
+
+@app.route('/api/import/<table_name>', methods=['POST'])
+def import_upload(table_name):
+    # นำเข้าไฟล์ที่อัปโหลด ตอบกลับเป็น NDJSON ทีละบรรทัด (ความคืบหน้าทุก batch และผลสรุปบรรทัดสุดท้าย)
+    upload = request.files.get('file')
+    if table_name not in bulk_io.IMPORT_TARGETS or upload is None:
+        return jsonify({'error': 'ต้องระบุตารางและไฟล์ที่จะนำเข้า'}), 400
+    fmt = request.form.get('format') or bulk_io.detect_format(upload.filename)
+    # ไฟล์ที่อัปโหลดจะถูกปิดเมื่อ view คืนค่า จึงคัดลอกลงไฟล์ชั่วคราวของเราเองก่อน (ทีละส่วน ไม่โหลดทั้งไฟล์)
+    spool = tempfile.TemporaryFile()
+    shutil.copyfileobj(upload.stream, spool)
+    spool.seek(0)
+
+    def generate():
+        with io.TextIOWrapper(spool, encoding='utf-8-sig', newline='') as stream:
+            try:
+                for progress in bulk_io.iter_import(table_name, stream, fmt):
+                    if not progress['done']:
+                        progress = {k: v for k, v in progress.items() if k != 'errors'}
+                    yield json.dumps(progress, ensure_ascii=False) + "\n"
+            except Exception as e:
+                print(f"[ERROR] Import failed: {e}")
+                yield json.dumps({'done': True, 'error': str(e)}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# batch edit
+@app.route('/api/batch-edit/<table_name>', methods=['POST'])
+def batch_edit(table_name):
+    # แก้ไขหลายแถวในคำขอเดียว (manual_chunks, support_stories) รับ JSON แบบใดแบบหนึ่ง:
+    #   {"ids": [1, 2], "set": {"category_id": 5}}
+    #   {"filter": {"data_type": "info", "category_name": "ทุนวิจัย"}, "set": {"data_type": "guide"}}
+    #   {"rows": [{"id": 1, "fund_abbr": "F01"}, {"id": 2, "fund_abbr": null}]}
+    # ตอบกลับ {"table", "matched", "updated", "missing"} ถ้าข้อมูลไม่ถูกต้องจะไม่แก้แถวใดเลย (400 พร้อม errors รายแถว)
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'ต้องส่งข้อมูลเป็น JSON object'}), 400
+    for key, kind in (('ids', list), ('filter', dict), ('set', dict), ('rows', list)):
+        if payload.get(key) is not None and not isinstance(payload[key], kind):
+            return jsonify({'error': f'{key} ไม่ถูกต้อง'}), 400
+    try:
+        result = bulk_io.batch_update(table_name, changes=payload.get('set'), ids=payload.get('ids'),
+                                      filters=payload.get('filter'), rows=payload.get('rows'))
+    except bulk_io.BatchEditError as e:
+        return jsonify({'error': str(e), 'errors': e.errors[:bulk_io.MAX_REPORTED_ERRORS]}), 400
+    except Exception as e:
+        print(f"[ERROR] Batch edit failed: {e}")
+        return jsonify({'error': f'แก้ไขไม่สำเร็จ: {e}'}), 500
+    return jsonify(result)
+
+# export
+@app.route('/api/export/<table_name>')
+def export_table(table_name):
+    # ดาวน์โหลดข้อมูลทั้งตาราง ?format=csv|jsonl และ ?gzip=1 ส่งแบบ chunked ทีละก้อน
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip') in ('1', 'true', 'yes')
+    if table_name not in bulk_io.EXPORT_TABLES or fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': 'ไม่รองรับตารางหรือรูปแบบไฟล์นี้'}), 400
+    # ไฟล์ไม่เปลี่ยนถ้า version ของตารางไม่เปลี่ยน ส่ง If-None-Match มาจะได้ 304 โดยไม่ต้องอ่านทั้งตาราง
+    etag = _current_etag([table_name])
+    if etag and request.if_none_match.contains_weak(etag):
+        return _with_etag(Response(status=304), etag)
+    mimetype = 'application/gzip' if compress else ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    filename = bulk_io.export_filename(table_name, fmt, compress)
+    response = Response(stream_with_context(bulk_io.iter_export(table_name, fmt, compress)), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    return _with_etag(response, etag) if etag else response
+
 # run app
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
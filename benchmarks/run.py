@@ -0,0 +1,310 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+# วัดเวลาของ query หลักและหน้า list บนฐานข้อมูลที่สร้างด้วย benchmarks/seed.py แล้วบันทึกผลเป็น JSON ไว้เทียบข้าม commit
+#   DB_SCHEMA=kb_bench python benchmarks/run.py                      # ผลอยู่ใน benchmarks/results/<เวลา>-<commit>.json
+#   DB_SCHEMA=kb_bench python benchmarks/run.py --only manuals --iterations 50
+#   DB_SCHEMA=kb_bench python benchmarks/run.py --concurrency 8      # load test: ยิงพร้อมกันหลาย thread วัด req/s
+#   python benchmarks/run.py --compare results/old.json results/new.json
+# ค่าเริ่มต้นจะไม่ใช้ cache จำนวนแถว/dropdown (cache ที่ผูกกับ version ตาราง) วัดงานของฐานข้อมูลจริง ใส่ --warm-cache เพื่อวัดกรณีที่ cache อุ่นแล้ว
+# /api/format-markdown ใช้ AI server จำลอง (benchmarks/stub_ai.py) และส่งข้อความไม่ซ้ำทุกครั้ง ยกเว้น scenario *_cached
+# จำนวน query / เวลาใน DB นับจากตัวจับเวลา SQL (instrumentation.py) จึงครอบทั้งการเรียกฟังก์ชันตรงและผ่าน route
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+# ไม่ต้องมี thread พื้นหลังมาปนเวลาที่วัด
+os.environ.setdefault('CACHE_NOTIFY_ENABLED', 'false')
+os.environ.setdefault('FORMAT_JOBS_ENABLED', 'false')
+os.environ.setdefault('SLOW_QUERY_MS', '1000000')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+TABLES = ['manual_chunks', 'categories', 'documents', 'research_funds', 'support_stories', 'glossary_terms', 'chat_logs']
+PAGE_DEPTHS = [1, 10, 100, 1000, 10000, 50000]
+SEARCH_TERMS = {'common': 'ทุน', 'rare': 'ครุภัณฑ์', 'missing': 'ไม่มีคำนี้ในระบบ'}
+MANUAL_SEARCH_COLS = ['topic', 'content', 'category_name', 'doc_title']
+SHORT_TEXT = "ขั้นตอนการยื่นข้อเสนอโครงการ 1. เข้าสู่ระบบ NRIIS 2. กรอกแบบฟอร์ม งบประมาณไม่เกิน 500,000 บาท ภายใน 30 วัน"
+
+
+def _git(*args):
+    try:
+        return subprocess.check_output(['git', *args], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _row_counts():
+    # ใช้ค่าประมาณจาก planner (seed.py ANALYZE ไว้แล้ว) จะได้ไม่ต้อง COUNT(*) chat_logs หลายล้านแถว
+    import config
+    import db_actions
+    with db_actions.get_db_connection() as conn:
+        if not conn: return {}
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname, c.reltuples::bigint FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relname = ANY(%s)
+            """, (config.DB_SCHEMA, TABLES))
+            return dict(cur.fetchall())
+
+def _key_at(table_name, key_col, offset):
+    # ค่า key ของแถวที่ offset (ใช้สร้าง cursor สำหรับ keyset หน้าลึก)
+    import config
+    import db_actions
+    with db_actions.get_db_connection() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {key_col} FROM {config.DB_SCHEMA}.{table_name} ORDER BY {key_col} OFFSET %s LIMIT 1", (offset,))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def build_scenarios(app, rows, ai_ready):
+    # คืน list ของ (ชื่อ, ฟังก์ชันที่รับเลขรอบ) ฟังก์ชันต้อง raise ถ้าผลลัพธ์ผิด
+    import db_actions
+    scenarios = []
+    chunks = rows.get('manual_chunks', 0)
+    local = threading.local()
+
+    def client():
+        # test client แยกต่อ thread (ใช้ร่วมกันข้าม thread ไม่ได้)
+        if getattr(local, 'client', None) is None:
+            local.client = app.test_client()
+        return local.client
+
+    def get(url):
+        def run(i):
+            response = client().get(url)
+            response.get_data()
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url} -> {response.status_code}")
+        return run
+
+    def paginated(**kwargs):
+        return lambda i: db_actions.get_paginated_list('manual_chunks', 'id ASC', per_page=10, **kwargs)
+
+    for depth in PAGE_DEPTHS:
+        if depth == 1 or (depth - 1) * 10 < chunks:
+            scenarios.append((f"paginated.page_{depth}", paginated(page=depth)))
+    for label, term in SEARCH_TERMS.items():
+        scenarios.append((f"paginated.search_{label}", paginated(search_query=term, search_cols=MANUAL_SEARCH_COLS)))
+        scenarios.append((f"paginated.search_{label}_page_10", paginated(page=10, search_query=term, search_cols=MANUAL_SEARCH_COLS)))
+    scenarios.append(("paginated.filter", paginated(filter_col='data_type', filter_val='warning')))
+    scenarios.append(("paginated.filter_search", paginated(filter_col='data_type', filter_val='warning',
+                                                           search_query=SEARCH_TERMS['common'], search_cols=MANUAL_SEARCH_COLS)))
+
+    # keyset ที่ตำแหน่งเดียวกับหน้าลึกสุดที่วัดแบบ OFFSET
+    deep = max(d for d in PAGE_DEPTHS if d == 1 or (d - 1) * 10 < chunks)
+    deep_cursor = None
+    key = _key_at('manual_chunks', 'id', (deep - 1) * 10) if deep > 1 else None
+    if key is not None:
+        deep_cursor = db_actions.encode_cursor('id ASC', {'id': key})
+        scenarios.append((f"keyset.page_{deep}",
+                          lambda i: db_actions.get_keyset_list('manual_chunks', 'id ASC', cursor=deep_cursor, per_page=10)))
+
+    scenarios.append(("dashboard.stats", lambda i: db_actions.get_dashboard_stats()))
+    scenarios.append(("dashboard.sessions", lambda i: db_actions.get_recent_sessions()))
+    sessions, _ = db_actions.get_recent_sessions(limit=1)
+    if sessions:
+        latest = sessions[0]['session_id']
+        scenarios.append(("dashboard.transcript", lambda i: db_actions.get_session_messages(latest)))
+        scenarios.append(("route.transcript", get(f"/dashboard/transcript?session_id={quote(latest)}")))
+
+    scenarios.append(("route.dashboard", get('/')))
+    scenarios.append(("route.manuals", get('/manuals')))
+    scenarios.append(("route.manuals_page_100", get('/manuals?page=100')))
+    scenarios.append(("route.manuals_search", get(f"/manuals?search={SEARCH_TERMS['common']}")))
+    scenarios.append(("route.manuals_filter", get('/manuals?filter=warning')))
+    if deep_cursor:
+        scenarios.append(("route.manuals_cursor", get(f"/manuals?page={deep}&cursor={deep_cursor}")))
+    for path in ('funds', 'glossary', 'stories', 'documents', 'categories'):
+        scenarios.append((f"route.{path}", get(f"/{path}")))
+
+    if ai_ready:
+        long_text = "\n\n".join(f"ขั้นตอนที่ {n}: {SHORT_TEXT}" for n in range(1, 60))
+
+        def format_markdown(text, unique):
+            def run(i):
+                content = f"{text}\nรอบที่ {threading.get_ident()}-{i}-{time.time_ns()}" if unique else text
+                response = client().post('/api/format-markdown', json={'content': content})
+                if response.status_code != 200:
+                    raise RuntimeError(f"format-markdown -> {response.status_code}")
+            return run
+
+        scenarios.append(("ai.format_short", format_markdown(SHORT_TEXT, True)))
+        scenarios.append(("ai.format_long", format_markdown(long_text, True)))
+        scenarios.append(("ai.format_short_cached", format_markdown(SHORT_TEXT, False)))
+    return scenarios
+
+
+def measure(fn, iterations, warmup, concurrency):
+    import instrumentation
+    errors = []
+    for i in range(warmup):
+        try:
+            fn(-1 - i)
+        except Exception as e:
+            errors.append(str(e))
+
+    timings = []
+    def one(i):
+        started = time.perf_counter()
+        try:
+            fn(i)
+        except Exception as e:
+            errors.append(str(e))
+            return
+        timings.append((time.perf_counter() - started) * 1000)
+
+    before = instrumentation.query_totals()
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(iterations)))
+    else:
+        for i in range(iterations):
+            one(i)
+    wall = time.perf_counter() - started
+    after = instrumentation.query_totals()
+
+    result = {'iterations': iterations, 'errors': len(errors),
+              'queries': round((after['queries'] - before['queries']) / iterations, 2),
+              'db_ms': round((after['seconds'] - before['seconds']) * 1000 / iterations, 3),
+              'throughput': round(len(timings) / wall, 2) if wall else None}
+    if timings:
+        result.update(median_ms=round(statistics.median(timings), 3), p95_ms=round(_percentile(timings, 95), 3),
+                      mean_ms=round(statistics.mean(timings), 3), min_ms=round(min(timings), 3),
+                      max_ms=round(max(timings), 3))
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+
+def run(args):
+    import config
+    import cache
+    import app as webapp
+    import stub_ai
+
+    if not config.DB_SCHEMA:
+        sys.exit("ต้องตั้งค่า DB_SCHEMA (schema ที่สร้างด้วย benchmarks/seed.py)")
+    rows = _row_counts()
+    if not rows.get('manual_chunks'):
+        sys.exit(f"ไม่พบข้อมูลใน {config.DB_SCHEMA} ให้รัน benchmarks/seed.py ก่อน")
+
+    ai_ready = not args.no_ai
+    if ai_ready:
+        server, handler = stub_ai.start(0, args.stub_latency, args.stub_tokens_per_second)
+        os.environ['AI_API_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+        os.environ.setdefault('AI_MODEL_NAME', 'benchmark-stub')
+        os.environ.setdefault('AI_API_KEY', 'benchmark')
+
+    cache.set_bypass(not args.warm_cache)
+    webapp.app.config['TESTING'] = True
+    scenarios = build_scenarios(webapp.app, rows, ai_ready)
+    if args.only:
+        scenarios = [(name, fn) for name, fn in scenarios if any(part in name for part in args.only)]
+
+    results = {}
+    for name, fn in scenarios:
+        # scenario ที่เรียก AI ช้ากว่ามาก ลดจำนวนรอบลง
+        iterations = max(1, args.iterations // 4) if name.startswith('ai.') else args.iterations
+        result = measure(fn, iterations, args.warmup, args.concurrency)
+        results[name] = result
+        summary = (f"median {result['median_ms']:9.2f}ms  p95 {result['p95_ms']:9.2f}ms  "
+                   f"{result['queries']:5.1f} queries  {result['throughput']:8.1f}/s") if 'median_ms' in result else "failed"
+        errors = f"  errors={result['errors']} ({result['first_error']})" if result['errors'] else ""
+        print(f"{name:36s} {summary}{errors}", file=sys.stderr)
+
+    commit = _git('rev-parse', 'HEAD')
+    report = {
+        'meta': {
+            'commit': commit, 'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+            'subject': _git('log', '-1', '--format=%s'), 'label': args.label,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'schema': config.DB_SCHEMA, 'rows': rows,
+            'iterations': args.iterations, 'warmup': args.warmup, 'concurrency': args.concurrency,
+            'warm_cache': args.warm_cache, 'stub_latency': args.stub_latency,
+        },
+        'results': results,
+    }
+    output = args.output
+    if not output:
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(BENCH_DIR, 'results', f"{stamp}-{(commit or 'nogit')[:8]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[BENCH] report: {output}")
+
+
+def compare(old_path, new_path, threshold):
+    # เทียบ median ของ scenario ที่มีในทั้งสองรายงาน ช้าลงเกิน threshold % ถือว่า regression (exit code 1)
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    for label, report in (('old', old), ('new', new)):
+        meta = report['meta']
+        print(f"{label}: {(meta.get('commit') or '?')[:8]}{'+dirty' if meta.get('dirty') else ''} "
+              f"{meta.get('timestamp')} rows={meta.get('rows', {}).get('manual_chunks')} {meta.get('subject') or ''}")
+    if old['meta'].get('rows') != new['meta'].get('rows'):
+        print("[WARN] จำนวนข้อมูลของสองรายงานไม่เท่ากัน ผลอาจเทียบกันไม่ได้")
+
+    regressions = 0
+    print(f"\n{'scenario':36s} {'old ms':>10s} {'new ms':>10s} {'change':>8s} {'queries':>12s}")
+    for name in sorted(set(old['results']) | set(new['results'])):
+        a, b = old['results'].get(name, {}), new['results'].get(name, {})
+        if 'median_ms' not in a or 'median_ms' not in b:
+            print(f"{name:36s} {a.get('median_ms', '-'):>10} {b.get('median_ms', '-'):>10}")
+            continue
+        change = (b['median_ms'] - a['median_ms']) / a['median_ms'] * 100 if a['median_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  <- slower'
+            regressions += 1
+        elif change < -threshold:
+            flag = '  faster'
+        print(f"{name:36s} {a['median_ms']:10.2f} {b['median_ms']:10.2f} {change:+7.1f}% "
+              f"{a['queries']:5.1f} -> {b['queries']:<5.1f}{flag}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark list queries, dashboard and routes against a seeded schema")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=1, help="run iterations from N threads (load test)")
+    parser.add_argument('--only', nargs='+', help="run scenarios whose name contains any of these")
+    parser.add_argument('--warm-cache', action='store_true', help="keep the table-versioned count/option caches enabled")
+    parser.add_argument('--no-ai', action='store_true', help="skip /api/format-markdown scenarios")
+    parser.add_argument('--stub-latency', type=float, default=0.0, help="stub AI seconds before the first token")
+    parser.add_argument('--stub-tokens-per-second', type=float, default=0.0)
+    parser.add_argument('--label', help="free text stored in the report")
+    parser.add_argument('--output', help="report path (default benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two reports instead of running")
+    parser.add_argument('--threshold', type=float, default=10.0, help="percent slower that counts as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        sys.exit(compare(args.compare[0], args.compare[1], args.threshold))
+    run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+-- โครงสร้างตารางหลักที่ db_actions ใช้ (เท่าที่โค้ดอ้างถึง) สำหรับสร้างฐานข้อมูลทดสอบประสิทธิภาพ
+-- ส่วนที่เพิ่มภายหลัง (search_vector, ตัวนับ, journal ฯลฯ) มาจาก migrations/ ตามปกติ
+
+CREATE SCHEMA IF NOT EXISTS {schema};
+
+CREATE TABLE IF NOT EXISTS {schema}.categories (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    main_group TEXT,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS {schema}.documents (
+    id SERIAL PRIMARY KEY,
+    title TEXT NOT NULL,
+    version TEXT,
+    last_updated DATE
+);
+
+CREATE TABLE IF NOT EXISTS {schema}.research_funds (
+    fund_id SERIAL PRIMARY KEY,
+    fund_abbr TEXT UNIQUE NOT NULL,
+    fund_name_th TEXT,
+    fund_name_en TEXT,
+    fiscal_year INTEGER,
+    source_agency TEXT,
+    start_period DATE,
+    end_period DATE,
+    status TEXT
+);
+
+CREATE TABLE IF NOT EXISTS {schema}.manual_chunks (
+    id SERIAL PRIMARY KEY,
+    doc_id INTEGER REFERENCES {schema}.documents (id),
+    category_id INTEGER REFERENCES {schema}.categories (id),
+    topic TEXT,
+    section TEXT,
+    step_number INTEGER,
+    content TEXT,
+    data_type TEXT,
+    fund_abbr TEXT
+);
+
+CREATE TABLE IF NOT EXISTS {schema}.support_stories (
+    id SERIAL PRIMARY KEY,
+    category_id INTEGER REFERENCES {schema}.categories (id),
+    scenario TEXT,
+    solution TEXT
+);
+
+CREATE TABLE IF NOT EXISTS {schema}.glossary_terms (
+    word_id SERIAL PRIMARY KEY,
+    word TEXT NOT NULL,
+    meaning TEXT,
+    word_type TEXT
+);
+
+CREATE TABLE IF NOT EXISTS {schema}.chat_logs (
+    id BIGSERIAL PRIMARY KEY,
+    session_id TEXT,
+    user_input TEXT,
+    ai_response TEXT,
+    feedback_score INTEGER,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS {schema}.system_metadata (
+    key TEXT PRIMARY KEY,
+    pending_update BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO {schema}.system_metadata (key) VALUES ('bot_sync_status') ON CONFLICT DO NOTHING;
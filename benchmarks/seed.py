@@ -0,0 +1,153 @@
+import argparse
+import os
+import sys
+import time
+import psycopg2
+
+# สร้างฐานข้อมูลทดสอบประสิทธิภาพด้วยข้อมูลสังเคราะห์ (สร้างใน PostgreSQL ด้วย generate_series ไม่ต้องส่งข้อมูลผ่าน Python)
+#   DB_SCHEMA=kb_bench python benchmarks/seed.py --scale small
+#   DB_SCHEMA=kb_bench python benchmarks/seed.py --chunks 1000000 --chat-logs 10000000 --skip-search
+# schema ที่ระบุจะถูกลบแล้วสร้างใหม่ทั้งหมด จึงยอมให้ใช้เฉพาะชื่อที่มีคำว่า bench (หรือใส่ --force)
+# หลังใส่ข้อมูลจะรัน migrations/ ทั้งหมด (ตัวนับ, chat_sessions, journal ฯลฯ) และ rebuild-search เหมือนระบบจริง
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+import db_pool
+import manage
+
+SCALES = {
+    'small': {'chunks': 10000, 'chat_logs': 100000},
+    'medium': {'chunks': 100000, 'chat_logs': 1000000},
+    'large': {'chunks': 1000000, 'chat_logs': 10000000},
+}
+
+WORDS = [
+    'ทุน', 'วิจัย', 'ระบบ', 'เอกสาร', 'ขั้นตอน', 'ยื่น', 'ข้อเสนอ', 'โครงการ', 'งบประมาณ', 'อนุมัติ', 'รายงาน',
+    'ความก้าวหน้า', 'สัญญา', 'นักวิจัย', 'หน่วยงาน', 'เบิกจ่าย', 'ตรวจสอบ', 'แก้ไข', 'ส่ง', 'กรอก', 'แบบฟอร์ม',
+    'ผลงาน', 'ตีพิมพ์', 'ปิดโครงการ', 'ประเมิน', 'คณะกรรมการ', 'กำหนดการ', 'ปีงบประมาณ', 'เมนู', 'หน้าจอ',
+    'เข้าสู่ระบบ', 'รหัสผ่าน', 'อัปโหลด', 'ไฟล์', 'ผู้ประสานงาน', 'มหาวิทยาลัย', 'จริยธรรม', 'ครุภัณฑ์',
+    'NRIIS', 'login', 'PDF', 'email', '2567', '2568', '30', '15', '100,000', '500,000',
+]
+DATA_TYPES = ['manual', 'guide', 'warning', 'info', 'troubleshoot', 'contact', 'rule']
+MAIN_GROUPS = ['ทุนวิจัย', 'ระบบสารสนเทศ', 'การเงิน', 'จริยธรรมการวิจัย', 'ทั่วไป']
+WORD_TYPES = ['คำย่อ', 'ศัพท์เฉพาะ', 'ชื่อระบบ', 'ชื่อหน่วยงาน']
+
+# ข้อความสุ่มจากคลังคำ ยาว min_words..min_words+spread คำ (อ้าง g เพื่อให้สุ่มใหม่ทุกแถว)
+def _text(min_words, spread):
+    return (f"(SELECT string_agg(v.w[1 + floor(random() * array_length(v.w, 1))::int], ' ') "
+            f"FROM generate_series(1, {min_words} + g %% {spread}))")
+
+def _insert_batches(conn, label, total, batch, sql, params):
+    started = time.monotonic()
+    for start in range(1, total + 1, batch):
+        end = min(start + batch - 1, total)
+        with conn.cursor() as cur:
+            cur.execute(sql, dict(params, start=start, end=end, words=WORDS))
+        conn.commit()
+        rate = end / max(time.monotonic() - started, 1e-6)
+        print(f"[SEED] {label}: {end}/{total} ({rate:,.0f} rows/s)", file=sys.stderr)
+
+def seed(conn, counts, batch):
+    s = config.DB_SCHEMA
+    words = "(SELECT %(words)s::text[] AS w) v"
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO {s}.categories (name, main_group, description)
+            SELECT 'หมวดหมู่ ' || g, (%(groups)s::text[])[1 + g %% %(group_count)s], {_text(5, 10)}
+            FROM generate_series(1, %(n)s) g, {words}
+        """, {'n': counts['categories'], 'groups': MAIN_GROUPS, 'group_count': len(MAIN_GROUPS), 'words': WORDS})
+        cur.execute(f"""
+            INSERT INTO {s}.documents (title, version, last_updated)
+            SELECT 'คู่มือ ' || {_text(2, 4)} || ' ' || g, 'v' || (1 + g %% 5) || '.' || (g %% 10),
+                   DATE '2020-01-01' + (g * 13 %% 1800)
+            FROM generate_series(1, %(n)s) g, {words}
+        """, {'n': counts['documents'], 'words': WORDS})
+        cur.execute(f"""
+            INSERT INTO {s}.research_funds (fund_abbr, fund_name_th, fund_name_en, fiscal_year, source_agency,
+                                            start_period, end_period, status)
+            SELECT 'F' || lpad(g::text, 3, '0'), 'ทุน' || {_text(3, 5)}, 'Research Fund ' || g, 2560 + g %% 10,
+                   'หน่วยงาน ' || (1 + g %% 8), DATE '2024-01-01' + g, DATE '2024-03-01' + g * 2,
+                   CASE WHEN g %% 4 = 0 THEN 'N' ELSE 'Y' END
+            FROM generate_series(1, %(n)s) g, {words}
+        """, {'n': counts['funds'], 'words': WORDS})
+    conn.commit()
+
+    _insert_batches(conn, 'manual_chunks', counts['chunks'], batch, f"""
+        INSERT INTO {s}.manual_chunks (doc_id, category_id, topic, section, step_number, content, data_type, fund_abbr)
+        SELECT 1 + g %% %(docs)s, 1 + (g * 7) %% %(cats)s, 'หัวข้อ ' || g || ' ' || {_text(2, 5)},
+               'ส่วนที่ ' || (1 + g %% 12), 1 + g %% 10, {_text(20, 80)},
+               (%(types)s::text[])[1 + g %% %(type_count)s],
+               CASE WHEN g %% 3 = 0 THEN NULL ELSE 'F' || lpad((1 + g %% %(funds)s)::text, 3, '0') END
+        FROM generate_series(%(start)s, %(end)s) g, {words}
+    """, {'docs': counts['documents'], 'cats': counts['categories'], 'funds': counts['funds'],
+          'types': DATA_TYPES, 'type_count': len(DATA_TYPES)})
+
+    _insert_batches(conn, 'support_stories', counts['stories'], batch, f"""
+        INSERT INTO {s}.support_stories (category_id, scenario, solution)
+        SELECT 1 + g %% %(cats)s, {_text(10, 30)}, {_text(15, 40)}
+        FROM generate_series(%(start)s, %(end)s) g, {words}
+    """, {'cats': counts['categories']})
+
+    _insert_batches(conn, 'glossary_terms', counts['glossary'], batch, f"""
+        INSERT INTO {s}.glossary_terms (word, meaning, word_type)
+        SELECT 'คำ' || g, {_text(5, 20)}, (%(types)s::text[])[1 + g %% %(type_count)s]
+        FROM generate_series(%(start)s, %(end)s) g, {words}
+    """, {'types': WORD_TYPES, 'type_count': len(WORD_TYPES)})
+
+    # แชทเรียงตามเวลา session ละ 8 ข้อความ ห่างกัน 5 วินาที (ข้อความล่าสุด = ตอนนี้)
+    _insert_batches(conn, 'chat_logs', counts['chat_logs'], batch, f"""
+        INSERT INTO {s}.chat_logs (session_id, user_input, ai_response, feedback_score, created_at)
+        SELECT 'sess-' || lpad((g / 8)::text, 9, '0'), {_text(5, 15)}, {_text(20, 60)},
+               CASE g %% 10 WHEN 0 THEN 0 WHEN 1 THEN 1 END,
+               now() - (%(total)s - g) * interval '5 seconds'
+        FROM generate_series(%(start)s, %(end)s) g, {words}
+    """, {'total': counts['chat_logs']})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a benchmark schema with synthetic data")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--chunks', type=int, help="override manual_chunks rows")
+    parser.add_argument('--chat-logs', type=int, help="override chat_logs rows")
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--skip-search', action='store_true', help="do not build search_vector (slow at large scales)")
+    parser.add_argument('--force', action='store_true', help="allow a schema name without 'bench'")
+    args = parser.parse_args(argv)
+
+    if not config.DB_SCHEMA:
+        sys.exit("ต้องตั้งค่า DB_SCHEMA")
+    if 'bench' not in config.DB_SCHEMA and not args.force:
+        sys.exit(f"schema {config.DB_SCHEMA} จะถูกลบทั้งหมด ใช้ชื่อที่มีคำว่า bench หรือใส่ --force")
+
+    counts = dict(SCALES[args.scale])
+    counts['chunks'] = args.chunks if args.chunks is not None else counts['chunks']
+    counts['chat_logs'] = args.chat_logs if args.chat_logs is not None else counts['chat_logs']
+    counts.update(categories=50, documents=max(20, counts['chunks'] // 200), funds=40,
+                  stories=max(100, counts['chunks'] // 10), glossary=max(200, counts['chunks'] // 20))
+
+    conn = psycopg2.connect(**db_pool.connect_kwargs())
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {config.DB_SCHEMA} CASCADE")
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql'), encoding='utf-8') as f:
+                cur.execute(f.read().replace('{schema}', config.DB_SCHEMA))
+        conn.commit()
+        seed(conn, counts, args.batch_size)
+    finally:
+        conn.close()
+
+    manage.main(['migrate'])
+    if not args.skip_search:
+        manage.main(['rebuild-search'])
+    conn = psycopg2.connect(**db_pool.connect_kwargs())
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+    finally:
+        conn.close()
+    print(f"[SEED] done: {counts}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# AI server จำลอง (รูปแบบ OpenAI chat completions) สำหรับวัด /api/format-markdown โดยไม่เรียก AI จริง
+# ตอบกลับด้วยข้อความเดิมที่ใส่หัวข้อ # ไว้ด้านหน้า (ตัวเลขครบ จึงผ่านการตรวจความครบถ้วน)
+# จำลองความช้าได้ด้วย latency (ก่อน token แรก) และ tokens_per_second (ความเร็วในการส่งแต่ละส่วน)
+#   python benchmarks/stub_ai.py --port 5099 --latency 0.5 --tokens-per-second 50
+#   AI_API_URL=http://127.0.0.1:5099/v1/chat/completions
+
+
+class _Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+    tokens_per_second = 0.0
+    calls = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _formatted(self, body):
+        content = body['messages'][-1]['content']
+        return f"# {content.strip()}"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        type(self).calls += 1
+        output = self._formatted(body)
+        time.sleep(self.latency)
+        if body.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            delay = 1.0 / self.tokens_per_second if self.tokens_per_second else 0
+            for i in range(0, len(output), 4):
+                chunk = {'choices': [{'delta': {'content': output[i:i + 4]}}]}
+                self.wfile.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode('utf-8') + b"\n\n")
+                self.wfile.flush()
+                if delay:
+                    time.sleep(delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        if self.tokens_per_second:
+            time.sleep(len(output) / 4 / self.tokens_per_second)
+        data = json.dumps({'choices': [{'message': {'content': output}, 'finish_reason': 'stop'}]},
+                          ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start(port=5099, latency=0.0, tokens_per_second=0.0):
+    # เริ่ม server ใน thread พื้นหลัง คืนค่า (server, handler class) ใช้ handler.calls นับจำนวนครั้งที่ถูกเรียก
+    handler = type('StubHandler', (_Handler,), {'latency': latency, 'tokens_per_second': tokens_per_second, 'calls': 0})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stub-ai', daemon=True).start()
+    return server, handler
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible server for benchmarks")
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help="0 = as fast as possible")
+    args = parser.parse_args()
+    server, _ = start(args.port, args.latency, args.tokens_per_second)
+    print(f"[STUB AI] listening on http://127.0.0.1:{args.port}/v1/chat/completions")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
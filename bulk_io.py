@@ -0,0 +1,533 @@
+import csv
+import io
+import json
+import zlib
+import config
+import db_actions
+import journal
+import search
+
+# นำเข้าข้อมูลจำนวนมากจากไฟล์ CSV / JSONL (manual_chunks, glossary_terms, support_stories)
+# อ่านไฟล์ทีละชุด (batch) ตรวจสอบข้อมูล + แปลง Foreign Key ทีละชุด แล้ว COPY ลงตารางพักชั่วคราว (staging)
+# จากนั้น merge เข้าตารางจริงครั้งเดียว: แถวที่มี id เดิมจะ UPDATE แถวที่ไม่มี id จะ INSERT
+# ทั้งไฟล์อยู่ใน transaction เดียว ถ้าพังกลางทางจะไม่มีอะไรถูกบันทึก และตั้งค่า pending แค่ครั้งเดียวตอนจบ
+
+IMPORT_TARGETS = {
+    'manual_chunks': {
+        'pk': 'id',
+        'columns': ['doc_id', 'category_id', 'topic', 'section', 'step_number', 'content', 'data_type', 'fund_abbr'],
+        'required': ['doc_id', 'category_id', 'topic', 'section', 'step_number', 'data_type'],
+        'integers': ['doc_id', 'category_id', 'step_number'],
+    },
+    'glossary_terms': {
+        'pk': 'word_id',
+        'columns': ['word', 'meaning', 'word_type'],
+        'required': ['word', 'meaning', 'word_type'],
+        'integers': [],
+    },
+    'support_stories': {
+        'pk': 'id',
+        'columns': ['category_id', 'scenario', 'solution'],
+        'required': ['category_id', 'scenario'],
+        'integers': ['category_id'],
+    },
+}
+
+# Foreign Key ที่แปลงได้: คอลัมน์ -> (ตารางแม่, คอลัมน์ key, คอลัมน์ชื่อที่ใช้แทน id ได้ในไฟล์, คอลัมน์ชื่อในตารางแม่)
+_FOREIGN_KEYS = {
+    'category_id': ('categories', 'id', 'category_name', 'name'),
+    'doc_id': ('documents', 'id', 'doc_title', 'title'),
+    'fund_abbr': ('research_funds', 'fund_abbr', None, None),
+}
+
+MAX_REPORTED_ERRORS = 100
+
+
+class BulkImportError(Exception):
+    # ไฟล์หรือคำสั่งนำเข้าไม่ถูกต้องทั้งไฟล์ (เช่น ไม่รู้จักตาราง / รูปแบบไฟล์)
+    pass
+
+
+def detect_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+def _read_records(stream, fmt):
+    # อ่านไฟล์ทีละแถว คืนค่า (ลำดับแถว, dict หรือ None, ข้อความ error)
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row_no, record in enumerate(reader, start=2):
+            yield row_no, {k.strip(): v for k, v in record.items() if k}, None
+    elif fmt == 'jsonl':
+        for row_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_no, None, f"JSON ไม่ถูกต้อง: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield row_no, None, "แต่ละบรรทัดต้องเป็น JSON object"
+                continue
+            yield row_no, record, None
+    else:
+        raise BulkImportError(f"ไม่รองรับไฟล์แบบ {fmt}")
+
+def _batches(records, size):
+    batch = []
+    for item in records:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value if value != '' else None
+    return value
+
+
+class _ForeignKeyResolver:
+    # ตรวจ/แปลง Foreign Key ทีละ batch ด้วย query เดียวต่อตารางแม่ ผลที่เคยหาแล้วจะจำไว้ใช้กับ batch ถัดไป
+    def __init__(self, cur, columns):
+        self.cur = cur
+        self.columns = [c for c in columns if c in _FOREIGN_KEYS]
+        self.known = {c: set() for c in self.columns}      # key ที่มีอยู่จริง
+        self.missing = {c: set() for c in self.columns}    # key ที่เช็คแล้วว่าไม่มี
+        self.by_name = {c: {} for c in self.columns}       # ชื่อ -> key
+        self.missing_names = {c: set() for c in self.columns}
+
+    def prefetch(self, records):
+        for column in self.columns:
+            parent, key_col, name_field, name_col = _FOREIGN_KEYS[column]
+            keys, names = set(), set()
+            for record in records:
+                key = record.get(column)
+                if key is not None:
+                    if key not in self.known[column] and key not in self.missing[column]:
+                        keys.add(key)
+                elif name_field:
+                    name = record.get(name_field)
+                    if name is not None and name not in self.by_name[column] and name not in self.missing_names[column]:
+                        names.add(name)
+            if keys:
+                self.cur.execute(f"SELECT {key_col} FROM {config.DB_SCHEMA}.{parent} WHERE {key_col} = ANY(%s)", (list(keys),))
+                found = {row[0] for row in self.cur.fetchall()}
+                self.known[column] |= found
+                self.missing[column] |= keys - found
+            if names:
+                self.cur.execute(f"SELECT {name_col}, {key_col} FROM {config.DB_SCHEMA}.{parent} WHERE {name_col} = ANY(%s)", (list(names),))
+                found = dict(self.cur.fetchall())
+                self.by_name[column].update(found)
+                self.known[column] |= set(found.values())
+                self.missing_names[column] |= names - set(found)
+
+    def resolve(self, record):
+        # แก้ค่าใน record ให้เป็น key จริง คืนค่าข้อความ error หรือ None
+        for column in self.columns:
+            parent, key_col, name_field, name_col = _FOREIGN_KEYS[column]
+            key = record.get(column)
+            if key is None and name_field and record.get(name_field) is not None:
+                key = self.by_name[column].get(record[name_field])
+                if key is None:
+                    return f"ไม่พบ {name_field} = {record[name_field]!r} ในตาราง {parent}"
+                record[column] = key
+            elif key is not None and key not in self.known[column]:
+                return f"ไม่พบ {column} = {key!r} ในตาราง {parent}"
+        return None
+
+
+def _normalize(target, record):
+    # แปลงค่าในแถวให้อยู่ในรูปที่บันทึกได้ คืนค่า (record ใหม่, error)
+    pk = target['pk']
+    row = {pk: _clean(record.get(pk))}
+    for column in target['columns']:
+        row[column] = _clean(record.get(column))
+    for column in _FOREIGN_KEYS:
+        name_field = _FOREIGN_KEYS[column][2]
+        if name_field:
+            row[name_field] = _clean(record.get(name_field))
+    for column in target['integers'] + [pk]:
+        if row[column] is not None:
+            try:
+                row[column] = int(str(row[column]))
+            except ValueError:
+                return None, f"{column} ต้องเป็นตัวเลข"
+    for column in target['required']:
+        name_field = _FOREIGN_KEYS.get(column, (None, None, None))[2]
+        if row[column] is None and not (name_field and row.get(name_field) is not None):
+            return None, f"ไม่ได้ระบุ {column}"
+    return row, None
+
+def _copy_field(value):
+    # รูปแบบ CSV ของ COPY: ช่องว่างที่ไม่มีเครื่องหมายคำพูด = NULL ส่วนค่าอื่นใส่ "" เสมอ
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def iter_import(table_name, stream, fmt='csv', batch_size=1000):
+    # นำเข้าไฟล์แบบ generator: yield สถานะความคืบหน้าหลังจบแต่ละ batch และ yield ผลสรุป (done=True) เป็นค่าสุดท้าย
+    # stream ต้องเป็นไฟล์แบบข้อความ (text) อ่านทีละบรรทัด ไม่โหลดทั้งไฟล์เข้าหน่วยความจำ
+    target = IMPORT_TARGETS.get(table_name)
+    if target is None:
+        raise BulkImportError(f"ไม่รองรับการนำเข้าตาราง {table_name}")
+    pk = target['pk']
+    columns = target['columns']
+    stage = f"import_{table_name}"
+    progress = {'table': table_name, 'read': 0, 'staged': 0, 'inserted': 0, 'updated': 0,
+                'error_count': 0, 'errors': [], 'done': False}
+
+    def add_error(row_no, message):
+        progress['error_count'] += 1
+        if len(progress['errors']) < MAX_REPORTED_ERRORS:
+            progress['errors'].append({'row': row_no, 'error': message})
+
+    with db_actions.transaction() as conn:
+        if not conn:
+            raise BulkImportError("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+        with conn.cursor() as cur:
+            # ตารางพักใช้ชนิดคอลัมน์เดียวกับตารางจริง แต่ไม่มี constraint และหายไปเองเมื่อจบ transaction
+            cur.execute(f"""
+                CREATE TEMP TABLE {stage} ON COMMIT DROP AS
+                SELECT 0 AS row_no, {pk} AS src_pk, {', '.join(columns)}
+                FROM {config.DB_SCHEMA}.{table_name} WITH NO DATA
+            """)
+            resolver = _ForeignKeyResolver(cur, columns)
+            seen_pks = set()
+
+            for batch in _batches(_read_records(stream, fmt), batch_size):
+                rows = []
+                for row_no, record, error in batch:
+                    progress['read'] += 1
+                    if error is None:
+                        record, error = _normalize(target, record)
+                    if error is None and record[pk] is not None:
+                        if record[pk] in seen_pks:
+                            error = f"{pk} = {record[pk]} ซ้ำกับแถวก่อนหน้าในไฟล์"
+                        seen_pks.add(record[pk])
+                    if error is not None:
+                        add_error(row_no, error)
+                        continue
+                    rows.append((row_no, record))
+
+                resolver.prefetch([record for _, record in rows])
+                buf = io.StringIO()
+                for row_no, record in rows:
+                    error = resolver.resolve(record)
+                    if error is not None:
+                        add_error(row_no, error)
+                        continue
+                    values = [row_no, record[pk]] + [record[c] for c in columns]
+                    buf.write(','.join(_copy_field(v) for v in values) + '\n')
+                    progress['staged'] += 1
+                buf.seek(0)
+                cur.copy_expert(f"COPY {stage} (row_no, src_pk, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+                yield dict(progress)
+
+            # id ที่ระบุมาแต่ไม่มีในตารางจริง ถือเป็น error (ไม่สร้างแถวใหม่ด้วย id ที่กำหนดเอง)
+            cur.execute(f"""
+                DELETE FROM {stage} s
+                WHERE s.src_pk IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM {config.DB_SCHEMA}.{table_name} t WHERE t.{pk} = s.src_pk)
+                RETURNING s.row_no, s.src_pk
+            """)
+            for row_no, src_pk in sorted(cur.fetchall()):
+                add_error(row_no, f"ไม่พบ {pk} = {src_pk}")
+                progress['staged'] -= 1
+
+            # ถ้าตารางมี index ค้นหา ขอ id ของแถวที่เปลี่ยนกลับมาด้วย เพื่อสร้าง index ใหม่เฉพาะแถวเหล่านั้น
+            indexed = search.is_enabled(cur, table_name)
+            # merge พร้อมบันทึก change journal ของทุกแถวใน statement เดียวกัน
+            updated = journal.execute_logged(cur, table_name, 'U', f"""
+                UPDATE {config.DB_SCHEMA}.{table_name} t
+                SET {', '.join(f'{c} = s.{c}' for c in columns)}
+                FROM {stage} s
+                WHERE t.{pk} = s.src_pk
+            """, (), pk, returning=indexed)
+            inserted = journal.execute_logged(cur, table_name, 'I', f"""
+                INSERT INTO {config.DB_SCHEMA}.{table_name} ({', '.join(columns)})
+                SELECT {', '.join(columns)} FROM {stage} WHERE src_pk IS NULL ORDER BY row_no
+            """, (), pk, returning=indexed)
+            progress['updated'] = len(updated) if indexed else updated
+            progress['inserted'] = len(inserted) if indexed else inserted
+
+        if progress['inserted'] or progress['updated']:
+            # สร้าง index ค้นหาเฉพาะแถวที่เพิ่ม/แก้ แล้วตั้งค่า pending ครั้งเดียว
+            if indexed:
+                search.refresh_for_write(conn, table_name, updated + inserted)
+            db_actions.record_change(conn, table_name, [])
+
+    progress['done'] = True
+    yield progress
+
+def import_file(table_name, stream, fmt='csv', batch_size=1000, on_progress=None):
+    # นำเข้าทั้งไฟล์แล้วคืนค่าผลสรุป (on_progress จะถูกเรียกทุกครั้งที่จบ batch)
+    result = None
+    for result in iter_import(table_name, stream, fmt, batch_size):
+        if on_progress and not result['done']:
+            on_progress(result)
+    return result
+
+
+# แก้ไขหลายแถวพร้อมกัน (ย้ายหมวดหมู่ เปลี่ยน data_type / fund_abbr ฯลฯ) แบบ set-based ใน transaction เดียว
+# เลือกแถวได้ 3 แบบ: ids + set (ค่าเดียวกันทุกแถว), filter + set (ทุกแถวที่ตรงเงื่อนไข), rows (ค่าแยกรายแถว)
+# คอลัมน์ที่แก้ได้ -> ชนิดใน PostgreSQL (ใช้ cast array ตอน unnest)
+BATCH_EDIT_FIELDS = {
+    'manual_chunks': {'doc_id': 'integer', 'category_id': 'integer', 'section': 'text', 'step_number': 'integer',
+                      'data_type': 'text', 'fund_abbr': 'text'},
+    'support_stories': {'category_id': 'integer'},
+}
+MAX_BATCH_EDIT_ROWS = 10000   # จำนวน ids / rows สูงสุดต่อคำขอ (แบบ filter ไม่จำกัด)
+
+
+class BatchEditError(Exception):
+    # คำสั่งแก้ไขหลายแถวไม่ถูกต้อง errors คือรายละเอียดรายแถว (ถ้ามี) ไม่มีการแก้ไขใดๆ เกิดขึ้น
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def _edit_values(table_name, values):
+    # ตรวจ/แปลงค่าที่จะแก้ คืนค่า (dict ใหม่, error)
+    fields = BATCH_EDIT_FIELDS[table_name]
+    name_fields = {_FOREIGN_KEYS[c][2]: c for c in fields if c in _FOREIGN_KEYS and _FOREIGN_KEYS[c][2]}
+    row = {}
+    for key, value in values.items():
+        if key not in fields and key not in name_fields:
+            return None, f"แก้ไข {key} แบบหลายแถวไม่ได้"
+        row[key] = _clean(value)
+    for column, pg_type in fields.items():
+        if pg_type == 'integer' and row.get(column) is not None:
+            try:
+                row[column] = int(str(row[column]))
+            except ValueError:
+                return None, f"{column} ต้องเป็นตัวเลข"
+    for name_field, column in name_fields.items():
+        # ระบุชื่อแทน id ได้ (เช่น category_name) แต่ถ้าระบุทั้งคู่จะใช้ id
+        if row.get(name_field) is not None and row.get(column) is None:
+            row[column] = None
+    return row, None
+
+def _resolve_edits(cur, table_name, records, check_required=True):
+    # แปลงชื่อเป็น id และตรวจ Foreign Key ของทุกแถวด้วย query เดียวต่อตารางแม่ แล้วตรวจคอลัมน์ที่ห้ามว่าง
+    fields = BATCH_EDIT_FIELDS[table_name]
+    required = IMPORT_TARGETS[table_name]['required'] if check_required else []
+    resolver = _ForeignKeyResolver(cur, list(fields))
+    resolver.prefetch(records)
+    errors = []
+    for index, record in enumerate(records):
+        error = resolver.resolve(record)
+        if error is None:
+            missing = [c for c in required if c in record and record[c] is None]
+            if missing:
+                error = f"{', '.join(missing)} เป็นค่าว่างไม่ได้"
+        if error is not None:
+            errors.append({'row': index, 'error': error})
+        for column in fields:
+            name_field = _FOREIGN_KEYS.get(column, (None, None, None))[2]
+            record.pop(name_field, None)
+    return errors
+
+def batch_update(table_name, changes=None, ids=None, filters=None, rows=None):
+    # คืนค่า {'table', 'matched', 'updated', 'missing'} (updated นับเฉพาะแถวที่ค่าเปลี่ยนจริง)
+    # ทุกแถวแก้ใน transaction เดียว บันทึก journal ใน statement เดียวกับ UPDATE และตั้งค่า pending / แจ้ง worker อื่นครั้งเดียว
+    fields = BATCH_EDIT_FIELDS.get(table_name)
+    if fields is None:
+        raise BatchEditError(f"ไม่รองรับการแก้ไขหลายแถวของตาราง {table_name}")
+    pk = IMPORT_TARGETS[table_name]['pk']
+    if (rows is not None) + (ids is not None) + (filters is not None) != 1:
+        raise BatchEditError("ต้องระบุ ids, filter หรือ rows อย่างใดอย่างหนึ่ง")
+    if rows is None and not changes:
+        raise BatchEditError("ไม่ได้ระบุค่าที่จะแก้ไข (set)")
+
+    # แปลงทุกแบบให้เป็น list ของ record ({pk?, คอลัมน์: ค่า}) ก่อนเปิด transaction
+    records, errors = [], []
+    if rows is not None:
+        if not rows or len(rows) > MAX_BATCH_EDIT_ROWS:
+            raise BatchEditError(f"rows ต้องมี 1-{MAX_BATCH_EDIT_ROWS} รายการ")
+        seen = set()
+        for index, item in enumerate(rows):
+            values = dict(item) if isinstance(item, dict) else {}
+            key = _clean(values.pop(pk, None))
+            record, error = _edit_values(table_name, values) if values else (None, "ไม่ได้ระบุค่าที่จะแก้ไข")
+            if error is None and (key is None or not str(key).isdigit()):
+                error = f"ไม่ได้ระบุ {pk} หรือ {pk} ไม่ใช่ตัวเลข"
+            elif error is None and int(str(key)) in seen:
+                error = f"{pk} = {key} ซ้ำกับแถวก่อนหน้า"
+            if error is not None:
+                errors.append({'row': index, 'error': error})
+                continue
+            seen.add(int(str(key)))
+            records.append(dict(record, **{pk: int(str(key))}))
+    else:
+        record, error = _edit_values(table_name, changes)
+        if error is not None:
+            raise BatchEditError(error)
+        records.append(record)
+        if ids is not None:
+            if not ids or len(ids) > MAX_BATCH_EDIT_ROWS or not all(str(i).isdigit() for i in ids):
+                raise BatchEditError(f"ids ต้องเป็นตัวเลข 1-{MAX_BATCH_EDIT_ROWS} รายการ")
+            ids = sorted({int(str(i)) for i in ids})
+        else:
+            filters, error = _edit_values(table_name, filters or {})
+            if error is not None:
+                raise BatchEditError(f"filter: {error}")
+            if not filters:
+                raise BatchEditError("filter ต้องมีอย่างน้อยหนึ่งเงื่อนไข")
+    if errors:
+        raise BatchEditError("ข้อมูลไม่ถูกต้อง ไม่ได้แก้ไขแถวใดเลย", errors)
+
+    s = config.DB_SCHEMA
+    result = {'table': table_name, 'matched': 0, 'updated': 0, 'missing': []}
+    with db_actions.transaction() as conn:
+        if not conn:
+            raise BatchEditError("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+        with conn.cursor() as cur:
+            if filters is not None:
+                # ชื่อใน filter (เช่น category_name) แปลงเป็น id ด้วยวิธีเดียวกับค่าที่จะแก้
+                filter_errors = _resolve_edits(cur, table_name, [filters], check_required=False)
+                if filter_errors:
+                    raise BatchEditError(f"filter: {filter_errors[0]['error']}")
+            errors = _resolve_edits(cur, table_name, records)
+            if errors:
+                raise BatchEditError("ข้อมูลไม่ถูกต้อง ไม่ได้แก้ไขแถวใดเลย", errors)
+
+            # id ของแถวที่ค่าเปลี่ยนจริง ใช้สร้าง index ค้นหาใหม่เฉพาะแถวเหล่านั้น
+            changed_ids = []
+
+            if rows is not None:
+                keys = [r[pk] for r in records]
+                cur.execute(f"SELECT {pk} FROM {s}.{table_name} WHERE {pk} = ANY(%s)", (keys,))
+                found = {row[0] for row in cur.fetchall()}
+                result['matched'] = len(found)
+                result['missing'] = [k for k in keys if k not in found]
+                # แถวที่แก้คอลัมน์ชุดเดียวกันรวมเป็น UPDATE ... FROM unnest(arrays) คำสั่งเดียว
+                groups = {}
+                for record in records:
+                    groups.setdefault(tuple(sorted(c for c in record if c != pk)), []).append(record)
+                for columns, group in groups.items():
+                    arrays = [[r[pk] for r in group]] + [[r[c] for r in group] for c in columns]
+                    changed_ids += journal.execute_logged(cur, table_name, 'U', f"""
+                        UPDATE {s}.{table_name} t
+                        SET {', '.join(f'{c} = v.{c}' for c in columns)}
+                        FROM unnest(%s::integer[], {', '.join(f'%s::{fields[c]}[]' for c in columns)})
+                             AS v(row_key, {', '.join(columns)})
+                        WHERE t.{pk} = v.row_key
+                          AND ({' OR '.join(f't.{c} IS DISTINCT FROM v.{c}' for c in columns)})
+                    """, tuple(arrays), pk, returning=True)
+            else:
+                changes = records[0]
+                if ids is not None:
+                    where_sql, where_params = f"t.{pk} = ANY(%s)", [ids]
+                    cur.execute(f"SELECT t.{pk} FROM {s}.{table_name} t WHERE {where_sql}", tuple(where_params))
+                    found = {row[0] for row in cur.fetchall()}
+                    result['matched'] = len(found)
+                    result['missing'] = [i for i in ids if i not in found]
+                else:
+                    conditions, where_params = [], []
+                    for column, value in filters.items():
+                        if value is None:
+                            conditions.append(f"t.{column} IS NULL")
+                        else:
+                            conditions.append(f"t.{column} = %s")
+                            where_params.append(value)
+                    where_sql = " AND ".join(conditions)
+                    cur.execute(f"SELECT COUNT(*) FROM {s}.{table_name} t WHERE {where_sql}", tuple(where_params))
+                    result['matched'] = cur.fetchone()[0]
+                columns = list(changes)
+                changed_ids = journal.execute_logged(cur, table_name, 'U', f"""
+                    UPDATE {s}.{table_name} t
+                    SET {', '.join(f'{c} = %s' for c in columns)}
+                    WHERE {where_sql}
+                      AND ({' OR '.join(f't.{c} IS DISTINCT FROM %s::{fields[c]}' for c in columns)})
+                """, tuple([changes[c] for c in columns] + where_params + [changes[c] for c in columns]), pk, returning=True)
+            result['updated'] = len(changed_ids)
+
+        if changed_ids:
+            search.refresh_for_write(conn, table_name, changed_ids)
+            db_actions.record_change(conn, table_name, [])
+    return result
+
+
+# ส่งออกข้อมูลทั้งตาราง (พร้อมชื่อจากตารางที่ JOIN เหมือนหน้า list) เป็น CSV / JSONL และบีบอัด gzip ได้
+# อ่านผ่าน server-side cursor ทีละ fetch_size แถว แล้วส่งออกทีละก้อน หน่วยความจำจึงคงที่ไม่ว่าตารางจะใหญ่แค่ไหน
+# ไฟล์ที่ได้นำกลับเข้ามาด้วย import ได้เลย (คอลัมน์ที่ไม่รู้จักจะถูกข้าม)
+EXPORT_TABLES = {
+    'manual_chunks': 'id',
+    'support_stories': 'id',
+    'glossary_terms': 'word_id',
+}
+_EXPORT_SKIP_COLUMNS = {'search_vector'}
+
+def _export_rows(table_name, fetch_size):
+    # yield (ชื่อคอลัมน์, list ของแถว) ทีละชุด
+    from_sql, select_sql, alias = db_actions._list_sources(table_name)
+    order_col = f"{alias}.{EXPORT_TABLES[table_name]}" if alias else EXPORT_TABLES[table_name]
+    with db_actions.get_db_connection() as conn:
+        if not conn:
+            raise BulkImportError("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+        cur = conn.cursor(name=f"export_{table_name}")
+        cur.itersize = fetch_size
+        try:
+            cur.execute(f"SELECT {select_sql} FROM {from_sql} ORDER BY {order_col}")
+            columns = None
+            keep = None
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if columns is None:
+                    names = [d[0] for d in cur.description]
+                    keep = [i for i, name in enumerate(names) if name not in _EXPORT_SKIP_COLUMNS]
+                    columns = [names[i] for i in keep]
+                if not rows:
+                    break
+                yield columns, [[row[i] for i in keep] for row in rows]
+            if columns is not None and keep is not None:
+                yield columns, []
+        finally:
+            cur.close()
+
+def iter_export(table_name, fmt='csv', compress=False, fetch_size=2000):
+    # generator ของ bytes สำหรับส่งเป็น chunked response หรือเขียนลงไฟล์
+    if table_name not in EXPORT_TABLES:
+        raise BulkImportError(f"ไม่รองรับการส่งออกตาราง {table_name}")
+    if fmt not in ('csv', 'jsonl'):
+        raise BulkImportError(f"ไม่รองรับไฟล์แบบ {fmt}")
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def encode(text):
+        data = text.encode('utf-8')
+        return compressor.compress(data) if compressor else data
+
+    header_written = False
+    for columns, rows in _export_rows(table_name, fetch_size):
+        buf = io.StringIO()
+        if fmt == 'csv':
+            writer = csv.writer(buf)
+            if not header_written:
+                # ใส่ BOM ให้ Excel อ่านภาษาไทยถูก
+                buf.write('\ufeff')
+                writer.writerow(columns)
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                buf.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n')
+        header_written = True
+        chunk = encode(buf.getvalue())
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+def export_filename(table_name, fmt='csv', compress=False):
+    return f"{table_name}.{fmt}" + ('.gz' if compress else '')
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Cache ในหน่วยความจำของแต่ละ worker สำหรับข้อมูลที่อ่านบ่อยแต่เปลี่ยนไม่บ่อย (dropdown, ตัวเลือก filter, จำนวนแถว)
+# ทุก key จะผูกกับเลข version ของตารางที่ข้อมูลนั้นอ้างอิง เมื่อมีการแก้ไขตารางจะเพิ่ม version (bump)
+# ทำให้ key เดิมไม่ถูกใช้อีก แล้วค่อยหลุดออกไปเองตาม TTL หรือ LRU
+
+_versions = {}   # table -> version ปัจจุบัน
+_versions_lock = threading.Lock()
+_bumped_at = {}  # table -> เวลาที่ถูกแก้ไขล่าสุด (time.monotonic) ใช้ตัดสินว่าอ่านจาก read replica ได้หรือยัง
+_bypass = [False]  # True = ไม่เชื่อ cache ที่สร้างด้วย sync=True ชั่วคราว (เช่น ตัวรอฟังการแก้ไขจาก worker อื่นหลุดการเชื่อมต่อ)
+
+def set_bypass(flag):
+    _bypass[0] = flag
+
+def table_version(table_name):
+    return _versions.get(table_name, 0)
+
+def bump(table_name):
+    # เรียกหลัง commit การแก้ไขตาราง
+    with _versions_lock:
+        _versions[table_name] = _versions.get(table_name, 0) + 1
+        _bumped_at[table_name] = time.monotonic()
+
+def bump_all():
+    # ใช้ตอนไม่แน่ใจว่าพลาดการแจ้งเตือนการแก้ไขไปบ้างหรือไม่ ให้ทุก cache เริ่มใหม่
+    with _versions_lock:
+        for table_name in list(_versions):
+            _versions[table_name] += 1
+        _versions['*'] = _versions.get('*', 0) + 1
+        _bumped_at['*'] = time.monotonic()
+
+def changed_within(tables, seconds):
+    # มีตารางใดใน tables ถูกแก้ไข (จาก worker นี้หรือที่ได้รับแจ้งจาก worker อื่น) ภายใน seconds วินาทีที่ผ่านมาหรือไม่
+    # ระหว่าง bypass ไม่รู้ว่าพลาดการแจ้งเตือนอะไรไปบ้าง จึงถือว่าเพิ่งถูกแก้ไข
+    if _bypass[0]:
+        return True
+    since = time.monotonic() - seconds
+    return any(_bumped_at.get(t, since - 1) >= since for t in list(tables) + ['*'])
+
+
+class TTLCache:
+    # sync=True สำหรับ cache ที่รู้ว่าข้อมูลเปลี่ยนจาก version ของตาราง (bump) เท่านั้น ซึ่งต้องพึ่งการแจ้งเตือนข้าม worker
+    # ระหว่างที่ตัวรอฟังหลุด cache แบบนี้จะไม่ถูกใช้ ส่วน cache ที่ key บอกความสดในตัวเอง (hash ของเนื้อหา, ETag) ใช้ได้ตามปกติ
+    def __init__(self, name, ttl=60, maxsize=256, sync=False):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.sync = sync
+        self._data = OrderedDict()   # key -> (value, expires_at) เรียงจากใช้ล่าสุดน้อยที่สุดไปมากที่สุด
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'bypassed': 0}
+        _caches.append(self)
+
+    # key จริงคือ key ที่ส่งมา + version ของทุกตารางที่เกี่ยวข้อง (ต้องอ่าน version ก่อน query เสมอ)
+    def _versioned_key(self, key, tables):
+        return (key, _versions.get('*', 0), tuple(table_version(t) for t in sorted(tables)))
+
+    def get(self, key, tables):
+        full_key = self._versioned_key(key, tables)
+        now = time.monotonic()
+        with self._lock:
+            if self.sync and _bypass[0]:
+                self._stats['bypassed'] += 1
+                return False, None
+            entry = self._data.get(full_key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._data.move_to_end(full_key)
+                    self._stats['hits'] += 1
+                    return True, entry[0]
+                del self._data[full_key]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+        return False, None
+
+    def set(self, key, tables, value, versioned_key=None):
+        if self.sync and _bypass[0]:
+            return
+        full_key = versioned_key or self._versioned_key(key, tables)
+        with self._lock:
+            self._data[full_key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(full_key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def get_or_load(self, key, tables, loader):
+        # คืนค่าจาก cache ถ้ามี ไม่งั้นเรียก loader() แล้วเก็บผลไว้ (ผลที่เป็น None จะไม่ถูกเก็บ)
+        full_key = self._versioned_key(key, tables)
+        found, value = self.get(key, tables)
+        if found:
+            return value
+        value = loader()
+        if value is not None:
+            self.set(key, tables, value, versioned_key=full_key)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl, 'sync': self.sync})
+        total = data['hits'] + data['misses']
+        data['hit_rate'] = data['hits'] / total if total else 0.0
+        return data
+
+
+_caches = []
+
+def all_stats():
+    # สถิติของทุก cache สำหรับ monitoring
+    return {
+        'bypass': _bypass[0],
+        'versions': dict(_versions),
+        'caches': {c.name: c.stats() for c in _caches},
+    }
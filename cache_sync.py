@@ -0,0 +1,114 @@
+import json
+import os
+import select
+import socket
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+import cache
+import config
+import db_pool
+
+# ส่งต่อการแก้ไขข้อมูลระหว่าง gunicorn worker ด้วย LISTEN/NOTIFY ของ PostgreSQL
+# - ตอนเขียนข้อมูล db_actions จะเรียก notify() ใน transaction เดียวกัน (PostgreSQL ส่งให้ผู้ฟังเมื่อ commit เท่านั้น)
+# - แต่ละ worker มี thread รอฟังหนึ่งตัว (connection แยกจาก pool) พอได้รับแล้วจะ bump version ของตารางใน cache
+# - ถ้าการเชื่อมต่อของตัวรอฟังหลุด จะปิดการใช้ cache ที่ผูกกับ version ตาราง (sync=True) ไว้ก่อนจนกว่าจะต่อใหม่ได้ เพราะอาจพลาดการแจ้งเตือน
+#   ถ้าต่อไม่ได้นานเกิน _ALERT_AFTER วินาที (เช่น ผ่าน pgbouncer แบบ transaction mode ที่ไม่รองรับ LISTEN) จะแจ้ง [ERROR] อีกครั้ง
+#   และดูได้จาก down_seconds ใน /api/cache-stats และ cache_listener_down_seconds ใน /metrics
+
+_MAX_PAYLOAD = 7000   # NOTIFY รับ payload ได้ไม่เกิน 8000 bytes ถ้า id เยอะเกินจะส่งแค่ชื่อตาราง
+_ALERT_AFTER = 300    # วินาทีที่ต่อไม่ได้ติดต่อกันก่อนแจ้งว่า cache ถูกปิดถาวร
+
+_state = {'pid': None, 'thread': None, 'connected': False, 'received': 0, 'sent': 0,
+          'reconnects': 0, 'last_error': None, 'down_since': None, 'alerted': False}
+_start_lock = threading.Lock()
+
+def _origin():
+    # ตัวระบุ worker นี้ ใช้ข้ามการแจ้งเตือนที่ตัวเองส่ง (ฝั่งนี้ bump ไปแล้วหลัง commit)
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def notify(cur, table_name, ids):
+    # เรียกภายใน transaction ของการเขียน payload เป็น JSON {table, ids, origin}
+    if not config.CACHE_NOTIFY_ENABLED:
+        return
+    payload = json.dumps({'table': table_name, 'ids': list(ids), 'origin': _origin()}, default=str)
+    if len(payload.encode('utf-8')) > _MAX_PAYLOAD:
+        payload = json.dumps({'table': table_name, 'ids': None, 'origin': _origin()})
+    cur.execute("SELECT pg_notify(%s, %s)", (config.CACHE_NOTIFY_CHANNEL, payload))
+    _state['sent'] += 1
+
+def _handle(payload):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        cache.bump_all()
+        return
+    _state['received'] += 1
+    if message.get('origin') == _origin():
+        return
+    cache.bump(message.get('table'))
+
+def _listen_forever():
+    delay = 1
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**db_pool.connect_kwargs())
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{config.CACHE_NOTIFY_CHANNEL}"')
+            # ระหว่างที่ยังไม่ได้ฟังอาจมีการแก้ไขที่ไม่ได้รับแจ้ง จึงล้าง cache ทั้งหมดก่อนกลับมาใช้
+            cache.bump_all()
+            cache.set_bypass(False)
+            _state.update(connected=True, down_since=None, alerted=False)
+            delay = 1
+            while True:
+                if select.select([conn], [], [], config.CACHE_NOTIFY_HEARTBEAT) == ([], [], []):
+                    # เงียบนานเกินไป ยิง query เช็คว่า connection ยังอยู่
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _handle(conn.notifies.pop(0).payload)
+        except Exception as e:
+            print(f"[ERROR] Cache listener disconnected: {e}")
+            _state['last_error'] = str(e)
+        cache.set_bypass(True)
+        _state['connected'] = False
+        _state['reconnects'] += 1
+        if _state['down_since'] is None:
+            _state['down_since'] = time.monotonic()
+        down = time.monotonic() - _state['down_since']
+        if down >= _ALERT_AFTER and not _state['alerted']:
+            _state['alerted'] = True
+            print(f"[ERROR] Cache listener down for {down:.0f}s, table caches stay disabled until LISTEN succeeds "
+                  f"(check that DB_HOST is not a transaction-mode pooler): {_state['last_error']}")
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        time.sleep(delay)
+        delay = min(delay * 2, 30)
+
+def start():
+    # เริ่ม thread รอฟังของ process นี้ (เรียกซ้ำได้ หลัง fork จะเริ่มใหม่ใน process ลูก)
+    if not config.CACHE_NOTIFY_ENABLED or _state['pid'] == os.getpid():
+        return
+    with _start_lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        _state.update(connected=False, down_since=time.monotonic(), alerted=False)
+        # ยังไม่ได้ LISTEN ห้ามใช้ cache ก่อน
+        cache.set_bypass(True)
+        thread = threading.Thread(target=_listen_forever, name='cache-listener', daemon=True)
+        thread.start()
+        _state['thread'] = thread
+
+def stats():
+    data = {k: v for k, v in _state.items() if k not in ('thread', 'down_since')}
+    data['down_seconds'] = 0.0 if _state['down_since'] is None else time.monotonic() - _state['down_since']
+    return data
@@ -11,5 +11,77 @@ DB_USER = os.getenv("DB_USER")
 DB_PASS = os.getenv("DB_PASS")
 DB_PORT = os.getenv("DB_PORT")
 DB_SCHEMA = os.getenv("DB_SCHEMA")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+
+# Connection Pool (แยกต่อ gunicorn worker)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 16))   # ไม่ควรน้อยกว่า threads ของ gunicorn + AI_SEGMENT_WORKERS + งานเบื้องหลัง (ดู Dockerfile)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))               # วินาทีที่ยอมรอ connection ว่าง
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 1800))   # อายุสูงสุดของ connection
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))            # ปิด connection ที่ว่างนานเกิน (ส่วนที่เกิน min)
+DB_POOL_CHECK_INTERVAL = float(os.getenv("DB_POOL_CHECK_INTERVAL", 30)) # ว่างนานเกินนี้จะเช็ค SELECT 1 ก่อนใช้
+
+# Read replica (ไม่บังคับ) สำหรับ query อ่านอย่างเดียวของหน้า list / ค้นหา / dashboard ส่วนการแก้ไขใช้ primary (DB_HOST) เสมอ
+# ใส่ได้หลายตัวคั่นด้วย , เป็น DSN (host=replica1 port=5432) หรือ URI (postgresql://replica2/kb) ค่าที่ไม่ระบุจะใช้ตาม primary
+DB_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv("DB_REPLICA_DSNS", "").split(",") if dsn.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))                # replica ที่ช้ากว่า primary เกินนี้ (วินาที) จะไม่ถูกใช้
+DB_REPLICA_STICKY = float(os.getenv("DB_REPLICA_STICKY", 10))                 # หลังแก้ไขข้อมูล session นั้นอ่านจาก primary ต่ออีกกี่วินาที
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))  # ตรวจ lag ของ replica ทุกกี่วินาที
+DB_REPLICA_RETRY = float(os.getenv("DB_REPLICA_RETRY", 30))                   # replica ที่เชื่อมต่อไม่ได้จะพักกี่วินาทีก่อนลองใหม่
+
+# การนับจำนวนแถวในหน้า list
+COUNT_EXACT_LIMIT = int(os.getenv("COUNT_EXACT_LIMIT", 10000))               # นับจริงไม่เกินนี้ เกินแล้วแสดงเป็น N+
+COUNT_ESTIMATE_THRESHOLD = int(os.getenv("COUNT_ESTIMATE_THRESHOLD", 100000)) # ผลลัพธ์ใหญ่กว่านี้ใช้ค่าประมาณจาก planner
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", 60))
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", 1000))
+OPTIONS_CACHE_TTL = float(os.getenv("OPTIONS_CACHE_TTL", 300))    # อายุ cache ของ dropdown/ตัวเลือก filter (วินาที)
+OPTIONS_CACHE_SIZE = int(os.getenv("OPTIONS_CACHE_SIZE", 256))
+
+# ETag ของหน้า list / API จาก version ของตาราง (ต้องรัน migrations/007_table_versions.sql) ตอบ 304 ถ้าข้อมูลไม่เปลี่ยน
+ETAG_ENABLED = os.getenv("ETAG_ENABLED", "true").lower() in ("1", "true", "yes")
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")   # เก็บหน้า HTML ที่ render แล้วตาม ETag
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", 300))
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", 200))
+
+# หน้าต่างดูแชทบน Dashboard (โหลดเมื่อกดเปิด ทีละหน้า)
+TRANSCRIPT_PAGE_SIZE = int(os.getenv("TRANSCRIPT_PAGE_SIZE", 50))     # จำนวนข้อความต่อครั้ง
+TRANSCRIPT_CACHE_TTL = float(os.getenv("TRANSCRIPT_CACHE_TTL", 600))  # อายุ cache ของ HTML ที่ render แล้ว (วินาที)
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", 500))
+
+# แจ้งการแก้ไขข้อมูลข้าม worker ด้วย LISTEN/NOTIFY (ปิดได้ถ้ารันแค่ process เดียว)
+CACHE_NOTIFY_ENABLED = os.getenv("CACHE_NOTIFY_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_NOTIFY_CHANNEL = os.getenv("CACHE_NOTIFY_CHANNEL", "kb_admin_changes")
+CACHE_NOTIFY_HEARTBEAT = float(os.getenv("CACHE_NOTIFY_HEARTBEAT", 30))   # วินาทีที่เงียบแล้วจะเช็คว่า connection ยังอยู่
+
+# AI จัดรูปแบบ Markdown (URL / model / key อ่านจาก AI_API_URL, AI_MODEL_NAME, AI_API_KEY)
+AI_MAX_CONCURRENT = int(os.getenv("AI_MAX_CONCURRENT", 4))        # จำนวนการเรียก AI พร้อมกันสูงสุดต่อ worker
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", 5))        # วินาทีที่ยอมรอคิวก่อนตอบว่าไม่ว่าง
+AI_CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", 5))
+AI_READ_TIMEOUT = float(os.getenv("AI_READ_TIMEOUT", 45))         # รอข้อมูลจาก AI ได้นานสุดต่อช่วง (ไม่ใช่ทั้งคำตอบ)
+AI_SEGMENT_CHARS = int(os.getenv("AI_SEGMENT_CHARS", 2000))        # ข้อความยาวกว่านี้จะแบ่งเป็นช่วงก่อนส่งให้ AI
+AI_SEGMENT_WORKERS = int(os.getenv("AI_SEGMENT_WORKERS", 3))      # จำนวนช่วงที่จัดรูปแบบพร้อมกันต่อเอกสาร
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", 30 * 24 * 3600))   # อายุผลลัพธ์ใน ai_format_cache (วินาที)
+AI_CACHE_MEMORY_TTL = float(os.getenv("AI_CACHE_MEMORY_TTL", 3600))
+AI_CACHE_MEMORY_SIZE = int(os.getenv("AI_CACHE_MEMORY_SIZE", 256))
+
+# การจับเวลา SQL ต่อ request (instrumentation.py)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))                 # query ที่ช้ากว่านี้ (มิลลิวินาที) จะถูก log
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")   # ส่ง header Server-Timing
+
+# งานจัดรูปแบบ manual_chunks ด้วย AI แบบ background (format_jobs.py)
+FORMAT_JOBS_ENABLED = os.getenv("FORMAT_JOBS_ENABLED", "true").lower() in ("1", "true", "yes")   # ให้ worker ของเว็บรับงานเองด้วย
+FORMAT_JOB_CONCURRENCY = int(os.getenv("FORMAT_JOB_CONCURRENCY", 2))               # ค่าเริ่มต้นของจำนวนรายการที่ทำพร้อมกัน
+FORMAT_JOB_RATE_PER_MINUTE = int(os.getenv("FORMAT_JOB_RATE_PER_MINUTE", 30))      # ค่าเริ่มต้นของจำนวนการเรียก AI ต่อนาที (0 = ไม่จำกัด)
+FORMAT_JOB_MAX_ATTEMPTS = int(os.getenv("FORMAT_JOB_MAX_ATTEMPTS", 3))
+FORMAT_JOB_HEARTBEAT = float(os.getenv("FORMAT_JOB_HEARTBEAT", 15))
+FORMAT_JOB_STALE = float(os.getenv("FORMAT_JOB_STALE", 120))                       # heartbeat ขาดนานเท่านี้ worker อื่นรับงานไปทำต่อได้
+FORMAT_JOB_POLL = float(os.getenv("FORMAT_JOB_POLL", 10))
+
+# Snapshot ฐานความรู้ (ไฟล์ SQLite สำหรับบอท)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots'))
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", 300))   # ใช้เมื่อไม่มี change journal: สร้างใหม่ถ้าไฟล์เก่ากว่านี้ (วินาที)
+SNAPSHOT_BUILDER_ENABLED = os.getenv("SNAPSHOT_BUILDER_ENABLED", "true").lower() in ("1", "true", "yes")   # ให้ worker ของเว็บสร้าง snapshot เบื้องหลัง
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", 60))   # เช็คว่าต้องสร้างใหม่ทุกกี่วินาที (การแก้ไขจาก worker อื่น)
+SNAPSHOT_BUILD_DELAY = float(os.getenv("SNAPSHOT_BUILD_DELAY", 5))          # หลังมีการแก้ไข รอกี่วินาทีก่อนสร้าง (รวบการแก้ไขต่อเนื่อง)
 
 SECRET_KEY = os.getenv("SECRET_KEY")
\ No newline at end of file
@@ -1,39 +1,289 @@
 import psycopg2
+import psycopg2.extensions
 import config
 import math
+import time
+import json
+import base64
+import threading
+import db_pool
+import search
+import cache
+import cache_sync
+import journal
+import snapshot
+from contextlib import contextmanager
+from flask import g, has_app_context, has_request_context, session
 
 # ส่วนจัดการการเชื่อมต่อและประมวลผลฐานข้อมูล
-# เชื่อมต่อฐานข้อมูล PostgreSQL โดยดึงค่าจากไฟล์ config
+# Unit of Work: ใน 1 request (หรือ 1 transaction นอก request) จะใช้ connection เดียวกันทั้งหมด
+# ยืมจาก pool ตอนใช้ครั้งแรก และคืนตอนจบ request (release_request_connection)
+class _UnitOfWork:
+    def __init__(self):
+        self.conn = None
+        self.failed = False   # เชื่อมต่อไม่สำเร็จแล้ว ไม่ต้องลองซ้ำใน request เดิม
+        self.broken = False   # connection เสีย ให้ pool ปิดทิ้งตอนคืน
+        self.tx_depth = 0     # ความลึกของ transaction() ที่ซ้อนกันอยู่
+        self.after_commit = []  # งานที่ต้องทำหลัง commit สำเร็จ เช่น ล้าง cache
+
+    def connection(self):
+        if self.conn is None and not self.failed:
+            try:
+                self.conn = db_pool.get_pool().getconn()
+            except Exception as e:
+                print(f"[ERROR] DB Connection Failed: {e}")
+                self.failed = True
+        return self.conn
+
+    def release(self):
+        if self.conn is not None:
+            db_pool.get_pool().putconn(self.conn, discard=self.broken)
+            self.conn = None
+
+_local = threading.local()
+
+def _current_uow(create=False):
+    # ใน Flask ผูกกับ g ของ request นอก request ผูกกับ thread ปัจจุบัน
+    if has_app_context():
+        uow = g.get('_db_uow')
+        if uow is None and create:
+            uow = g._db_uow = _UnitOfWork()
+        return uow
+    return getattr(_local, 'uow', None)
+
+# คืน connection ของ request เข้า pool (เรียกจาก teardown_appcontext หรือก่อนงานที่รอนานใน view ที่ไม่ได้อยู่ใน transaction)
+def release_request_connection(exc=None):
+    uow = g.pop('_db_uow', None)
+    if uow is not None:
+        uow.release()
+
+# ยืม connection สำหรับอ่านข้อมูล ใช้งานแบบ with
+# ใน request จะได้ connection เดียวกันทุกครั้ง นอก request จะยืมจาก pool แล้วคืนทันทีเมื่อจบ with
+# ถ้าเชื่อมต่อไม่ได้จะได้ค่า None กลับไป (เหมือนเดิม) ผู้เรียกต้องเช็คก่อนใช้
+@contextmanager
 def get_db_connection():
+    uow = _current_uow(create=True)
+    if uow is not None:
+        conn = uow.connection()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            uow.broken = True
+            raise
+        finally:
+            # query ที่พังนอก transaction ไม่ควรทำให้ query ถัดไปใน request เดียวกันพังตาม
+            if conn is not None and uow.tx_depth == 0 and not conn.closed and \
+                    conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+                conn.rollback()
+        return
+
+    pool = db_pool.get_pool()
     try:
-        conn = psycopg2.connect(
-            host=config.DB_HOST,
-            database=config.DB_NAME,
-            user=config.DB_USER,
-            password=config.DB_PASS,
-            port=config.DB_PORT
-        )
-        return conn
+        conn = pool.getconn()
     except Exception as e:
         print(f"[ERROR] DB Connection Failed: {e}")
-        return None
+        yield None
+        return
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, discard=broken)
+
+# ยืม connection สำหรับ query อ่านอย่างเดียวที่ยอมให้ข้อมูลช้ากว่าปัจจุบันได้เล็กน้อย (หน้า list / ค้นหา / dashboard)
+# ถ้าตั้งค่า DB_REPLICA_DSNS จะอ่านจาก replica ยกเว้นกรณีต่อไปนี้ที่ต้องอ่านจาก primary:
+# - อยู่ใน transaction (ต้องเห็นสิ่งที่เพิ่งเขียน) หรือ session นี้เพิ่งแก้ไขข้อมูลภายใน DB_REPLICA_STICKY วินาที
+# - ตารางที่ query อ้างถึง (tables) เพิ่งถูกแก้ไขจาก worker ใดก็ตาม ภายในช่วงที่ replica อาจยังตามไม่ทัน
+#   (ผลจาก replica จะถูกเก็บใน cache ตาม version ปัจจุบัน ถ้าอ่านข้อมูลเก่ามาจะค้างใน cache จนหมดอายุ)
+# - ไม่มี replica ที่เชื่อมต่อได้และ lag ไม่เกิน DB_REPLICA_MAX_LAG
+# ภายใน request เดียวกันจะอ่านจากที่เดิมทุกครั้ง (version ที่ใช้ทำ ETag กับข้อมูลที่ render จะได้มาจากเครื่องเดียวกัน)
+@contextmanager
+def get_read_connection(tables):
+    replica = _read_target(tables)
+    conn = None
+    if replica is not None:
+        try:
+            conn = replica.pool.getconn()
+        except Exception as e:
+            if not isinstance(e, db_pool.PoolTimeout):
+                replica.mark_down(e)
+    if conn is None:
+        if replica is not None and has_app_context():
+            g._db_read_target = 'primary'
+        with get_db_connection() as conn:
+            yield conn
+        return
+
+    replica.reads += 1
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        broken = True
+        replica.mark_down(e)
+        raise
+    finally:
+        replica.pool.putconn(conn, discard=broken)
 
-# รันคำสั่ง SQL (Insert/Update/Delete) พร้อมบันทึก (Commit) และยกเลิก (Rollback) หากมี Error
-def _execute_commit(sql, params):
-    conn = get_db_connection()
-    if not conn: return False
+def _read_target(tables):
+    # คืนค่า replica ที่จะอ่าน หรือ None = อ่านจาก primary
+    # ถ้าเปลี่ยนไปอ่าน primary แล้ว (ตารางเพิ่งถูกแก้ไข / replica ใช้ไม่ได้) จะไม่กลับไปอ่าน replica อีกใน request นั้น
+    if _read_from_primary():
+        return None
+    pinned = g.get('_db_read_target') if has_app_context() else None
+    if pinned == 'primary':
+        return None
+    replica = pinned
+    if cache.changed_within(tables, config.DB_REPLICA_MAX_LAG + config.DB_REPLICA_CHECK_INTERVAL):
+        replica = None
+    elif replica is None:
+        replica = db_pool.pick_replica()
+    elif replica.down_until > time.monotonic():
+        replica = None
+    if has_app_context():
+        g._db_read_target = replica or 'primary'
+    return replica
+
+def _read_from_primary():
+    if not config.DB_REPLICA_DSNS:
+        return True
+    uow = _current_uow()
+    if uow is not None and uow.tx_depth > 0:
+        return True
+    return has_request_context() and session.get('_db_primary_until', 0) > time.time()
+
+def _stick_to_primary():
+    # หลังแก้ไขข้อมูล ให้ session นี้อ่านจาก primary ต่อ จะได้เห็นสิ่งที่ตัวเองเพิ่งแก้ทันที (read-your-writes)
+    if config.DB_REPLICA_DSNS and has_request_context():
+        session['_db_primary_until'] = time.time() + config.DB_REPLICA_STICKY
+        g._db_read_target = 'primary'
+
+# เปิด transaction ถ้าซ้อนกันหลายชั้น จะ commit ครั้งเดียวตอนจบชั้นนอกสุด และ rollback ทั้งหมดถ้ามี Error
+@contextmanager
+def transaction():
+    uow = _current_uow(create=True)
+    owner = uow is None
+    if owner:
+        uow = _local.uow = _UnitOfWork()
     try:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            affected = cur.rowcount 
-            conn.commit()
-            return affected > 0 
+        conn = uow.connection()
+        if conn is None:
+            yield None
+            return
+        uow.tx_depth += 1
+        hooks = []
+        try:
+            yield conn
+            if uow.tx_depth == 1:
+                conn.commit()
+                hooks, uow.after_commit = uow.after_commit, []
+        except Exception as e:
+            if uow.tx_depth == 1:
+                uow.after_commit = []
+                if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                    uow.broken = True
+                try:
+                    conn.rollback() # ย้อนกลับข้อมูลถ้าพัง
+                except Exception:
+                    uow.broken = True
+            raise
+        finally:
+            uow.tx_depth -= 1
+        for fn in hooks:
+            fn()
+    finally:
+        if owner:
+            _local.uow = None
+            uow.release()
+
+# transaction ที่ยืม connection ของตัวเองจาก pool และคืนทันทีเมื่อจบ with (ไม่ใช้ connection ของ request / transaction ที่เปิดอยู่)
+# ใช้กับงานสั้นๆ ระหว่างงานที่รอนาน เช่น cache ของ AI จัดรูปแบบ จะได้ไม่ถือ connection ไว้ตลอดการเรียก AI
+# ไม่มี after_commit (ไม่ควรใช้กับการแก้ไขข้อมูลที่ต้อง record_change)
+@contextmanager
+def detached_transaction():
+    pool = db_pool.get_pool()
+    try:
+        conn = pool.getconn()
+    except Exception as e:
+        print(f"[ERROR] DB Connection Failed: {e}")
+        yield None
+        return
+    broken = False
+    try:
+        yield conn
+        conn.commit()
     except Exception as e:
-        print(f"[ERROR] SQL Action Failed: {e}")
-        conn.rollback() # ย้อนกลับข้อมูลถ้าพัง
-        raise e 
+        broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        raise
     finally:
-        conn.close()
+        pool.putconn(conn, discard=broken)
+
+# สั่งให้ทำงานหลัง transaction ปัจจุบัน commit สำเร็จ (ถ้าไม่ได้อยู่ใน transaction จะทำทันที)
+def _after_commit(fn):
+    uow = _current_uow()
+    if uow is not None and uow.tx_depth > 0:
+        uow.after_commit.append(fn)
+    else:
+        fn()
+
+# สถิติของ pool สำหรับ monitoring (มี replicas เพิ่มถ้าตั้งค่า read replica)
+def get_pool_stats():
+    stats = db_pool.pool_stats()
+    if config.DB_REPLICA_DSNS:
+        stats['replicas'] = db_pool.replica_stats()
+    return stats
+
+# รันคำสั่ง SQL (Insert/Update/Delete) ภายใน transaction ปัจจุบัน (Commit/Rollback ตอนจบ transaction)
+def _execute_commit(sql, params):
+    with transaction() as conn:
+        if not conn: return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.rowcount > 0
+        except Exception as e:
+            print(f"[ERROR] SQL Action Failed: {e}")
+            raise e
+
+# บันทึกข้อมูลพร้อมตั้งค่า pending ใน transaction เดียวกัน ข้อมูลกับสถานะ sync จึงตรงกันเสมอ
+# คำสั่ง SQL ต้องมี RETURNING <primary key> เพื่อให้รู้ว่าแถวไหนเปลี่ยน (ใช้อัปเดต index ค้นหา)
+def _execute_write(table_name, sql, params):
+    with transaction() as conn:
+        if not conn: return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                ids = [row[0] for row in cur.fetchall()] if cur.description else []
+                success = cur.rowcount > 0
+        except Exception as e:
+            print(f"[ERROR] SQL Action Failed: {e}")
+            raise e
+        if success:
+            op = journal.OPS[sql.split(None, 1)[0].upper()]
+            if op != 'D':
+                search.refresh_for_write(conn, table_name, ids)
+            record_change(conn, table_name, ids, op)
+    return success
+
+# งานที่ต้องทำทุกครั้งที่ตารางถูกแก้ไข (ใน transaction เดียวกับการแก้ไข):
+# บันทึก change journal, ตั้งค่า pending ให้บอท sync, แจ้ง worker อื่นผ่าน NOTIFY และ bump version ของ cache หลัง commit
+# op เป็น None ได้ ถ้าผู้เรียกบันทึก journal เองแล้ว (เช่น bulk import ที่ใช้ journal.execute_logged)
+def record_change(conn, table_name, ids, op=None):
+    with conn.cursor() as cur:
+        if op is not None:
+            journal.record(cur, table_name, ids, op)
+        cache_sync.notify(cur, table_name, ids)
+    mark_as_pending()
+    _after_commit(lambda: cache.bump(table_name))
+    _after_commit(snapshot.request_build)
+    _after_commit(_stick_to_primary)
 
 # ส่วนฟังก์ชันการทำงานหลัก 
 # เช็คการแก้ไขข้อมูล
@@ -45,241 +295,400 @@ def mark_as_pending():
     """
     return _execute_commit(sql, None)
 
+# สถานะ pending ของ bot_sync_status (True = มีการแก้ไขที่บอทยังไม่ได้ sync) คืนค่า None ถ้าอ่านไม่ได้
+def get_bot_sync_pending():
+    with get_db_connection() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT pending_update FROM {config.DB_SCHEMA}.system_metadata WHERE key = 'bot_sync_status'")
+            row = cur.fetchone()
+            return bool(row[0]) if row else None
+
+# เลือกตารางและ JOIN ตามประเภทของข้อมูลที่จะดึง คืนค่า (from_sql, select_sql, alias ของตารางหลัก)
+def _list_sources(table_name):
+    if table_name == 'manual_chunks':
+        from_sql = f"""
+            {config.DB_SCHEMA}.manual_chunks m
+            LEFT JOIN {config.DB_SCHEMA}.categories c ON m.category_id = c.id
+            LEFT JOIN {config.DB_SCHEMA}.documents d ON m.doc_id = d.id
+            LEFT JOIN {config.DB_SCHEMA}.research_funds f ON m.fund_abbr = f.fund_abbr
+        """
+        select_sql = """
+            m.*, c.name as category_name, c.main_group, 
+            d.title as doc_title, d.version as doc_version,
+            f.fund_name_th as fund_full_name
+        """
+        return from_sql, select_sql, 'm'
+    if table_name in ['support_stories', 'view_support_stories']:
+        from_sql = f"""
+            {config.DB_SCHEMA}.support_stories s
+            LEFT JOIN {config.DB_SCHEMA}.categories c ON s.category_id = c.id
+        """
+        return from_sql, "s.*, c.name as category_name", 's'
+    return f"{config.DB_SCHEMA}.{table_name}", "*", None
+
+# เลือกวิธีค้นหา คืนค่า tsquery ถ้าใช้ full-text ได้ (ตารางมี search_vector, ทุกคอลัมน์ที่เลือกอยู่ใน index และคำค้นมีคำไทย)
+# ไม่งั้นคืน None ให้ใช้ ILIKE อย่างเดียว
+def _fts_query(cur, table_name, search_query, search_cols, search_mode='auto'):
+    if not search_query or not search_cols or search_mode == 'ilike':
+        return None
+    source = search.SEARCH_SOURCES.get(table_name)
+    if source is None or not set(search_cols) <= source['columns']:
+        return None
+    tsquery = search.build_tsquery(search_query)
+    if tsquery and search.is_enabled(cur, table_name):
+        return tsquery
+    return None
+
+# สร้างเงื่อนไข WHERE จาก search และ filter คืนค่า (where_sql, params)
+def _build_where(table_name, search_query=None, search_cols=[], filter_col=None, filter_val=None, tsquery=None):
+    where_clauses = []
+    params = []
+
+    # คัดแถวด้วย full-text index ก่อน (GIN index คัดแถวที่มี bigram ไทยของคำค้นครบในคอลัมน์ใดก็ได้ที่ทำ index ไว้)
+    # tsquery ได้แถวครบทุกแถวที่ ILIKE จะเจอเสมอ (ดู search.build_tsquery) แล้วตรวจซ้ำด้วย ILIKE เฉพาะคอลัมน์ที่เลือก
+    # ผลลัพธ์จึงเหมือนการค้นแบบ substring ของคอลัมน์เหล่านั้นเดิม
+    if tsquery:
+        alias = _list_sources(table_name)[2]
+        where_clauses.append(f"{alias + '.' if alias else ''}search_vector @@ %s::tsquery")
+        params.append(tsquery)
+
+    # สร้าง if search (ถ้าค้นด้วย full-text ไม่ได้ จะใช้ ILIKE อย่างเดียว)
+    if search_query and search_cols:
+        formatted_cols = []
+        for col in search_cols:
+            if table_name in ['manual_chunks', 'support_stories', 'view_support_stories']:
+                if col == 'category_name': formatted_cols.append("c.name")
+                elif col == 'main_group': formatted_cols.append("c.main_group")
+                elif col == 'doc_title' and table_name == 'manual_chunks': formatted_cols.append("d.title")
+                elif col == 'fund_full_name' and table_name == 'manual_chunks': formatted_cols.append("f.fund_name_th")
+                else: formatted_cols.append(f"{col}::text")
+            else:
+                formatted_cols.append(f"{col}::text")
+        
+        search_parts = [f"{col} ILIKE %s" for col in formatted_cols] 
+        where_clauses.append("(" + " OR ".join(search_parts) + ")")
+        term = f"%{search_query}%"
+        params.extend([term] * len(formatted_cols))
+
+    # สร้าง if filter
+    if filter_col and filter_val and filter_val != 'all':
+        actual_filter_col = filter_col
+        if table_name in ['manual_chunks', 'support_stories', 'view_support_stories']:
+            if filter_col == 'category_name': actual_filter_col = "c.name"
+            elif filter_col == 'main_group': actual_filter_col = "c.main_group"
+            elif filter_col == 'doc_title': actual_filter_col = "d.title"
+            elif filter_col == 'data_type' and table_name == 'manual_chunks': actual_filter_col = "m.data_type"
+
+        where_clauses.append(f"{actual_filter_col} = %s")
+        params.append(filter_val)
+
+    where_sql = ""
+    if where_clauses:
+        where_sql = "WHERE " + " AND ".join(where_clauses)
+    return where_sql, params
+
+# ส่วนนับจำนวนแถวของหน้า list
+# - ไม่มีเงื่อนไขและตารางใหญ่: ใช้ค่าประมาณจาก pg_class.reltuples (ไม่ต้องสแกนตาราง)
+# - มีเงื่อนไขและ planner ประเมินว่าผลลัพธ์ใหญ่มาก: ใช้ค่าประมาณจาก EXPLAIN
+# - นอกนั้นนับจริงแต่หยุดที่ COUNT_EXACT_LIMIT ถ้าเกินจะแสดงเป็น "N+ รายการ"
+# ผลการนับจริงจะถูก cache ไว้ต่อ (ตาราง, search, filter) ผูกกับ version ของตารางที่เกี่ยวข้อง แก้ไขแล้วจะนับใหม่
+_LIST_DEPENDENCIES = {
+    'manual_chunks': {'manual_chunks', 'categories', 'documents', 'research_funds'},
+    'support_stories': {'support_stories', 'categories'},
+    'view_support_stories': {'support_stories', 'categories'},
+}
+_count_cache = cache.TTLCache('counts', ttl=config.COUNT_CACHE_TTL, maxsize=config.COUNT_CACHE_SIZE, sync=True)
+# dropdown และตัวเลือก filter เปลี่ยนเฉพาะตอนแก้ไขตารางต้นทาง จึง cache ได้นานกว่า
+_options_cache = cache.TTLCache('options', ttl=config.OPTIONS_CACHE_TTL, maxsize=config.OPTIONS_CACHE_SIZE, sync=True)
+
+def _tables_for(table_name):
+    return _LIST_DEPENDENCIES.get(table_name, {table_name})
+
+def get_cache_stats():
+    stats = cache.all_stats()
+    stats['listener'] = cache_sync.stats()
+    return stats
+
+def _estimate_table_rows(cur, table_name):
+    base_table = 'support_stories' if table_name == 'view_support_stories' else table_name
+    cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+                (f"{config.DB_SCHEMA}.{base_table}",))
+    row = cur.fetchone()
+    return row[0] if row and row[0] is not None else -1
+
+def _estimate_query_rows(cur, from_sql, where_sql, params):
+    cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {from_sql} {where_sql}", tuple(params))
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str): plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+# คืนค่า (total_count, count_mode) โดย count_mode เป็น 'exact', 'capped' (N+) หรือ 'estimate' (ประมาณ)
+def _count_rows(cur, table_name, from_sql, where_sql, params, cache_key):
+    tables = _tables_for(table_name)
+    found, cached = _count_cache.get(cache_key, tables)
+    if found:
+        return cached
+
+    if not where_sql:
+        estimate = _estimate_table_rows(cur, table_name)
+        if estimate >= config.COUNT_ESTIMATE_THRESHOLD:
+            return estimate, 'estimate'
+    else:
+        estimate = _estimate_query_rows(cur, from_sql, where_sql, params)
+        if estimate >= config.COUNT_ESTIMATE_THRESHOLD:
+            return estimate, 'estimate'
+
+    limit = config.COUNT_EXACT_LIMIT
+    cur.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {from_sql} {where_sql} LIMIT %s) t", tuple(params + [limit + 1]))
+    total_count = cur.fetchone()[0]
+    count_mode = 'exact'
+    if total_count > limit:
+        total_count, count_mode = limit, 'capped'
+
+    _count_cache.set(cache_key, tables, (total_count, count_mode))
+    return total_count, count_mode
+
 # ดึงข้อมูลมาแสดงผลแบบแบ่งหน้า รองรับ search และ filter 
 def get_paginated_list(table_name, order_by_col, page=1, per_page=10, 
                        search_query=None, search_cols=[], 
-                       filter_col=None, filter_val=None):
-    conn = get_db_connection()
+                       filter_col=None, filter_val=None, search_mode='auto'):
+    # คืนค่า (items, total_pages, total_count, count_mode)
     items = []
     total_pages = 1
     total_count = 0
+    count_mode = 'exact'
     
-    if conn:
+    with get_read_connection(_tables_for(table_name)) as conn:
+        if not conn: return items, total_pages, total_count, count_mode
         with conn.cursor() as cur:
-            where_clauses = []
-            params = []
-
-            #  JOIN ตาราง ตามประเภทของข้อมูลที่จะดึง
-            if table_name == 'manual_chunks':
-                from_sql = f"""
-                    {config.DB_SCHEMA}.manual_chunks m
-                    LEFT JOIN {config.DB_SCHEMA}.categories c ON m.category_id = c.id
-                    LEFT JOIN {config.DB_SCHEMA}.documents d ON m.doc_id = d.id
-                    LEFT JOIN {config.DB_SCHEMA}.research_funds f ON m.fund_abbr = f.fund_abbr
-                """
-                select_sql = """
-                    m.*, c.name as category_name, c.main_group, 
-                    d.title as doc_title, d.version as doc_version,
-                    f.fund_name_th as fund_full_name
-                """
-            elif table_name in ['support_stories', 'view_support_stories']:
-                from_sql = f"""
-                    {config.DB_SCHEMA}.support_stories s
-                    LEFT JOIN {config.DB_SCHEMA}.categories c ON s.category_id = c.id
-                """
-                select_sql = "s.*, c.name as category_name"
-            else:
-                from_sql = f"{config.DB_SCHEMA}.{table_name}"
-                select_sql = "*"
-
-            # สร้าง if search 
-            if search_query and search_cols:
-                formatted_cols = []
-                for col in search_cols:
-                    if table_name in ['manual_chunks', 'support_stories', 'view_support_stories']:
-                        if col == 'category_name': formatted_cols.append("c.name")
-                        elif col == 'main_group': formatted_cols.append("c.main_group")
-                        elif col == 'doc_title' and table_name == 'manual_chunks': formatted_cols.append("d.title")
-                        elif col == 'fund_full_name' and table_name == 'manual_chunks': formatted_cols.append("f.fund_name_th")
-                        else: formatted_cols.append(f"{col}::text")
-                    else:
-                        formatted_cols.append(f"{col}::text")
-                
-                search_parts = [f"{col} ILIKE %s" for col in formatted_cols] 
-                where_clauses.append("(" + " OR ".join(search_parts) + ")")
-                term = f"%{search_query}%"
-                params.extend([term] * len(formatted_cols))
-
-            # สร้าง if filter
-            if filter_col and filter_val and filter_val != 'all':
-                actual_filter_col = filter_col
-                if table_name in ['manual_chunks', 'support_stories', 'view_support_stories']:
-                    if filter_col == 'category_name': actual_filter_col = "c.name"
-                    elif filter_col == 'main_group': actual_filter_col = "c.main_group"
-                    elif filter_col == 'doc_title': actual_filter_col = "d.title"
-                    elif filter_col == 'data_type' and table_name == 'manual_chunks': actual_filter_col = "m.data_type"
-
-                where_clauses.append(f"{actual_filter_col} = %s")
-                params.append(filter_val)
-
-            where_sql = ""
-            if where_clauses:
-                where_sql = "WHERE " + " AND ".join(where_clauses)
+            from_sql, select_sql, alias = _list_sources(table_name)
+            tsquery = _fts_query(cur, table_name, search_query, search_cols, search_mode)
+            where_sql, params = _build_where(table_name, search_query, search_cols, filter_col, filter_val, tsquery)
 
             # นับจำนวนข้อมูลทั้งหมดเพื่อคำนวณจำนวนหน้า
-            cur.execute(f"SELECT COUNT(*) FROM {from_sql} {where_sql}", tuple(params))
-            total_count = cur.fetchone()[0]
+            cache_key = (table_name, search_query or '', tuple(search_cols), filter_col, filter_val or '')
+            total_count, count_mode = _count_rows(cur, table_name, from_sql, where_sql, params, cache_key)
             total_pages = max(1, math.ceil(total_count / per_page))
             offset = (page - 1) * per_page
             
+            # ค้นด้วย full-text จะเรียงตามความเกี่ยวข้องก่อน
+            order_sql, order_params = order_by_col, []
+            if tsquery:
+                vector_col = f"{alias}.search_vector" if alias else "search_vector"
+                order_sql = f"ts_rank_cd({vector_col}, %s::tsquery) DESC, {order_by_col}"
+                order_params = [tsquery]
+
             data_query = f"""
                 SELECT {select_sql} FROM {from_sql} {where_sql}
-                ORDER BY {order_by_col} LIMIT %s OFFSET %s
+                ORDER BY {order_sql} LIMIT %s OFFSET %s
             """
-            cur.execute(data_query, tuple(params + [per_page, offset]))
+            cur.execute(data_query, tuple(params + order_params + [per_page, offset]))
             
             cols = [desc[0] for desc in cur.description]
             items = [dict(zip(cols, row)) for row in cur.fetchall()]
             
-        conn.close()
-    return items, total_pages, total_count
+    return items, total_pages, total_count, count_mode
+
+# Keyset (seek) pagination
+# แทนที่จะใช้ OFFSET ซึ่งต้องสแกนทิ้งทุกแถวก่อนหน้า จะจำค่าคอลัมน์ที่ใช้เรียงของแถวสุดท้าย/แรกไว้ใน cursor
+# แล้วค้นต่อด้วย WHERE col > ค่านั้น ทำให้หน้าลึกๆ ใช้เวลาเท่ากับหน้าแรก (คอลัมน์ที่ใช้เรียงต้องไม่ซ้ำ เช่น id)
+def _parse_order(order_by_col):
+    # 'fund_id ASC' -> ('fund_id', False)
+    parts = order_by_col.split()
+    return parts[0], len(parts) > 1 and parts[1].upper() == 'DESC'
+
+def _encode_token(payload):
+    # แปลง dict เป็นข้อความทึบ (base64) สำหรับใส่ใน URL
+    return base64.urlsafe_b64encode(json.dumps(payload, default=str).encode()).decode().rstrip('=')
+
+def _decode_token(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        return None
+
+def encode_cursor(order_by_col, row, direction='next'):
+    # สร้าง cursor จากค่าคอลัมน์ที่ใช้เรียงของแถว
+    col, _ = _parse_order(order_by_col)
+    return _encode_token({'c': col, 'k': row[col], 'd': direction})
+
+def decode_cursor(order_by_col, cursor):
+    # คืนค่า (key, direction) หรือ None ถ้า cursor เสียหาย/ไม่ตรงกับคอลัมน์ที่ใช้เรียง
+    if not cursor: return None
+    payload = _decode_token(cursor)
+    col, _ = _parse_order(order_by_col)
+    if not isinstance(payload, dict) or payload.get('c') != col or payload.get('d') not in ('next', 'prev'):
+        return None
+    return payload.get('k'), payload['d']
+
+def get_keyset_list(table_name, order_by_col, cursor=None, per_page=10,
+                    search_query=None, search_cols=[],
+                    filter_col=None, filter_val=None, search_mode='auto'):
+    # คืนค่า (items, next_cursor, prev_cursor, total_count, count_mode)
+    items = []
+    next_cursor = prev_cursor = None
+    total_count = 0
+    count_mode = 'exact'
+
+    with get_read_connection(_tables_for(table_name)) as conn:
+        if not conn: return items, next_cursor, prev_cursor, total_count, count_mode
+        with conn.cursor() as cur:
+            from_sql, select_sql, alias = _list_sources(table_name)
+            # keyset เรียงตามคอลัมน์ key เสมอ (ไม่เรียงตามความเกี่ยวข้อง)
+            tsquery = _fts_query(cur, table_name, search_query, search_cols, search_mode)
+            where_sql, params = _build_where(table_name, search_query, search_cols, filter_col, filter_val, tsquery)
+
+            cache_key = (table_name, search_query or '', tuple(search_cols), filter_col, filter_val or '')
+            total_count, count_mode = _count_rows(cur, table_name, from_sql, where_sql, params, cache_key)
+
+            col, desc = _parse_order(order_by_col)
+            key_col = f"{alias}.{col}" if alias else col
+            decoded = decode_cursor(order_by_col, cursor)
+            direction = decoded[1] if decoded else 'next'
+
+            # ย้อนหน้า = ค้นกลับทิศแล้วค่อยกลับลำดับผลลัพธ์
+            backwards = direction == 'prev'
+            seek_desc = desc != backwards
+            seek_params = list(params)
+            if decoded:
+                seek = f"{key_col} {'<' if seek_desc else '>'} %s"
+                where_sql = f"{where_sql} AND {seek}" if where_sql else f"WHERE {seek}"
+                seek_params.append(decoded[0])
+
+            data_query = f"""
+                SELECT {select_sql} FROM {from_sql} {where_sql}
+                ORDER BY {key_col} {'DESC' if seek_desc else 'ASC'} LIMIT %s
+            """
+            cur.execute(data_query, tuple(seek_params + [per_page + 1]))
+
+            cols = [d[0] for d in cur.description]
+            items = [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+    if items:
+        if (has_more and not backwards) or (backwards and decoded):
+            next_cursor = encode_cursor(order_by_col, items[-1], 'next')
+        if (has_more and backwards) or (decoded and not backwards):
+            prev_cursor = encode_cursor(order_by_col, items[0], 'prev')
+    return items, next_cursor, prev_cursor, total_count, count_mode
 
 # หมวดทุนวิจัย Research Funds
 def create_fund(data):
     # เพิ่มทุนวิจัยใหม่
     sql = f"""INSERT INTO {config.DB_SCHEMA}.research_funds 
     (fund_abbr, fund_name_th, fund_name_en, fiscal_year, source_agency, start_period, end_period, status)
-    VALUES (%(fund_abbr)s, %(fund_name_th)s, %(fund_name_en)s, %(fiscal_year)s, %(source_agency)s, %(start_period)s, %(end_period)s, %(status)s)"""
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    VALUES (%(fund_abbr)s, %(fund_name_th)s, %(fund_name_en)s, %(fiscal_year)s, %(source_agency)s, %(start_period)s, %(end_period)s, %(status)s) RETURNING fund_id"""
+    return _execute_write('research_funds', sql, data)
 
 def update_fund(fund_id, data):
     # แก้ไขทุนวิจัยเดิม
     data['pk'] = fund_id
     sql = f"""UPDATE {config.DB_SCHEMA}.research_funds SET 
     fund_abbr=%(fund_abbr)s, fund_name_th=%(fund_name_th)s, fund_name_en=%(fund_name_en)s, fiscal_year=%(fiscal_year)s, 
-    source_agency=%(source_agency)s, start_period=%(start_period)s, end_period=%(end_period)s, status=%(status)s WHERE fund_id=%(pk)s"""
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    source_agency=%(source_agency)s, start_period=%(start_period)s, end_period=%(end_period)s, status=%(status)s WHERE fund_id=%(pk)s RETURNING fund_id"""
+    return _execute_write('research_funds', sql, data)
 
 def delete_fund(fund_id):
     # ลบทุนวิจัย
-    success = _execute_commit(f"DELETE FROM {config.DB_SCHEMA}.research_funds WHERE fund_id = %s", (fund_id,))
-    if success: mark_as_pending()
-    return success
+    return _execute_write('research_funds', f"DELETE FROM {config.DB_SCHEMA}.research_funds WHERE fund_id = %s RETURNING fund_id", (fund_id,))
 
 # พจนานุกรมคำศัพท์ Glossary
 def create_glossary(data):
     # เพิ่มคำศัพท์ใหม่
-    sql = f"INSERT INTO {config.DB_SCHEMA}.glossary_terms (word, meaning, word_type) VALUES (%(word)s, %(meaning)s, %(word_type)s)"
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    sql = f"INSERT INTO {config.DB_SCHEMA}.glossary_terms (word, meaning, word_type) VALUES (%(word)s, %(meaning)s, %(word_type)s) RETURNING word_id"
+    return _execute_write('glossary_terms', sql, data)
 
 def update_glossary(word_id, data):
     # แก้ไขคำศัพท์
     data['pk'] = word_id
-    sql = f"UPDATE {config.DB_SCHEMA}.glossary_terms SET word=%(word)s, meaning=%(meaning)s, word_type=%(word_type)s WHERE word_id=%(pk)s"
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    sql = f"UPDATE {config.DB_SCHEMA}.glossary_terms SET word=%(word)s, meaning=%(meaning)s, word_type=%(word_type)s WHERE word_id=%(pk)s RETURNING word_id"
+    return _execute_write('glossary_terms', sql, data)
 
 def delete_glossary(word_id):
     # ลบคำศัพท์
-    success = _execute_commit(f"DELETE FROM {config.DB_SCHEMA}.glossary_terms WHERE word_id = %s", (word_id,))
-    if success: mark_as_pending()
-    return success
+    return _execute_write('glossary_terms', f"DELETE FROM {config.DB_SCHEMA}.glossary_terms WHERE word_id = %s RETURNING word_id", (word_id,))
 
 # เนื้อหาคู่มือการใช้งาน Manual Chunks
 def create_manual_chunk(data):
     # เพิ่มเนื้อหาคู่มือใหม่
     sql = f"""INSERT INTO {config.DB_SCHEMA}.manual_chunks (doc_id, category_id, topic, section, step_number, content, data_type, fund_abbr)
-    VALUES (%(doc_id)s, %(category_id)s, %(topic)s, %(section)s, %(step_number)s, %(content)s, %(data_type)s, %(fund_abbr)s)"""
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    VALUES (%(doc_id)s, %(category_id)s, %(topic)s, %(section)s, %(step_number)s, %(content)s, %(data_type)s, %(fund_abbr)s) RETURNING id"""
+    return _execute_write('manual_chunks', sql, data)
 
 def update_manual_chunk(chunk_id, data):
     # แก้ไขเนื้อหาคู่มือ
     data['pk'] = chunk_id
     sql = f"""UPDATE {config.DB_SCHEMA}.manual_chunks SET topic=%(topic)s, content=%(content)s, section=%(section)s, step_number=%(step_number)s, 
-    fund_abbr=%(fund_abbr)s, data_type=%(data_type)s, doc_id=%(doc_id)s, category_id=%(category_id)s WHERE id=%(pk)s"""
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    fund_abbr=%(fund_abbr)s, data_type=%(data_type)s, doc_id=%(doc_id)s, category_id=%(category_id)s WHERE id=%(pk)s RETURNING id"""
+    return _execute_write('manual_chunks', sql, data)
 
 def delete_manual_chunk(chunk_id):
     # ลบเนื้อหาคู่มือ
-    success = _execute_commit(f"DELETE FROM {config.DB_SCHEMA}.manual_chunks WHERE id = %s", (chunk_id,))
-    if success: mark_as_pending()
-    return success
+    return _execute_write('manual_chunks', f"DELETE FROM {config.DB_SCHEMA}.manual_chunks WHERE id = %s RETURNING id", (chunk_id,))
 
 # การแก้ปัญหา Support Stories
 def create_support_story(data):
     # เพิ่มเคสช่วยเหลือใหม่
-    sql = f"INSERT INTO {config.DB_SCHEMA}.support_stories (category_id, scenario, solution) VALUES (%(category_id)s, %(scenario)s, %(solution)s)"
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    sql = f"INSERT INTO {config.DB_SCHEMA}.support_stories (category_id, scenario, solution) VALUES (%(category_id)s, %(scenario)s, %(solution)s) RETURNING id"
+    return _execute_write('support_stories', sql, data)
 
 def update_support_story(pk_id, data):
     # แก้ไขเคสช่วยเหลือ
     data['pk'] = pk_id
-    sql = f"UPDATE {config.DB_SCHEMA}.support_stories SET scenario=%(scenario)s, solution=%(solution)s, category_id=%(category_id)s WHERE id=%(pk)s"
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    sql = f"UPDATE {config.DB_SCHEMA}.support_stories SET scenario=%(scenario)s, solution=%(solution)s, category_id=%(category_id)s WHERE id=%(pk)s RETURNING id"
+    return _execute_write('support_stories', sql, data)
 
 def delete_support_story(story_id):
     # ลบเคสช่วยเหลือ
-    success = _execute_commit(f"DELETE FROM {config.DB_SCHEMA}.support_stories WHERE id = %s", (story_id,))
-    if success: mark_as_pending()
-    return success
+    return _execute_write('support_stories', f"DELETE FROM {config.DB_SCHEMA}.support_stories WHERE id = %s RETURNING id", (story_id,))
 
 # เอกสารอ้างอิง Documents
 def create_document(data):
     # เพิ่มเอกสารใหม่
-    sql = f"INSERT INTO {config.DB_SCHEMA}.documents (title, version, last_updated) VALUES (%(title)s, %(version)s, %(last_updated)s)"
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    sql = f"INSERT INTO {config.DB_SCHEMA}.documents (title, version, last_updated) VALUES (%(title)s, %(version)s, %(last_updated)s) RETURNING id"
+    return _execute_write('documents', sql, data)
 
 def update_document(doc_id, data):
     # แก้ไขข้อมูลเอกสาร
     data['pk'] = doc_id
-    sql = f"UPDATE {config.DB_SCHEMA}.documents SET title=%(title)s, version=%(version)s, last_updated=%(last_updated)s WHERE id=%(pk)s"
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    sql = f"UPDATE {config.DB_SCHEMA}.documents SET title=%(title)s, version=%(version)s, last_updated=%(last_updated)s WHERE id=%(pk)s RETURNING id"
+    return _execute_write('documents', sql, data)
 
 def delete_document(doc_id):
     # ลบเอกสาร
-    success = _execute_commit(f"DELETE FROM {config.DB_SCHEMA}.documents WHERE id = %s", (doc_id,))
-    if success: mark_as_pending()
-    return success
+    return _execute_write('documents', f"DELETE FROM {config.DB_SCHEMA}.documents WHERE id = %s RETURNING id", (doc_id,))
 
 # หมวดหมู่ข้อมูล Categories
 def create_category(data):
     # เพิ่มหมวดหมู่ใหม่
-    sql = f"INSERT INTO {config.DB_SCHEMA}.categories (name, main_group, description) VALUES (%(name)s, %(main_group)s, %(description)s)"
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    sql = f"INSERT INTO {config.DB_SCHEMA}.categories (name, main_group, description) VALUES (%(name)s, %(main_group)s, %(description)s) RETURNING id"
+    return _execute_write('categories', sql, data)
 
 def update_category(cat_id, data):
     # แก้ไขหมวดหมู่
     data['pk'] = cat_id
-    sql = f"UPDATE {config.DB_SCHEMA}.categories SET name=%(name)s, main_group=%(main_group)s, description=%(description)s WHERE id=%(pk)s"
-    success = _execute_commit(sql, data)
-    if success: mark_as_pending()
-    return success
+    sql = f"UPDATE {config.DB_SCHEMA}.categories SET name=%(name)s, main_group=%(main_group)s, description=%(description)s WHERE id=%(pk)s RETURNING id"
+    return _execute_write('categories', sql, data)
 
 def delete_category(cat_id):
     # ลบหมวดหมู่
-    success = _execute_commit(f"DELETE FROM {config.DB_SCHEMA}.categories WHERE id = %s", (cat_id,))
-    if success: mark_as_pending()
-    return success
+    return _execute_write('categories', f"DELETE FROM {config.DB_SCHEMA}.categories WHERE id = %s RETURNING id", (cat_id,))
 
 #  Helpers
 
 def get_dropdown_options():
-    # ดึงข้อมูลสำหรับทำตัวเลือก Dropdown ในหน้าฟอร์ม
-    conn = get_db_connection()
+    # ดึงข้อมูลสำหรับทำตัวเลือก Dropdown ในหน้าฟอร์ม (cache ไว้จนกว่าตารางต้นทางจะถูกแก้ไข)
+    options = _options_cache.get_or_load('dropdown', ('categories', 'documents', 'research_funds'), _load_dropdown_options)
+    return options or {'categories': [], 'documents': [], 'funds': []}
+
+def _load_dropdown_options():
     options = {'categories': [], 'documents': [], 'funds': []}
-    if not conn: return options
-    try:
+    with get_read_connection(('categories', 'documents', 'research_funds')) as conn:
+        if not conn: return None
         with conn.cursor() as cur:
             cur.execute(f"SELECT id, name FROM {config.DB_SCHEMA}.categories ORDER BY name ASC")
             options['categories'] = [dict(zip([d[0] for d in cur.description], row)) for row in cur.fetchall()]
@@ -287,78 +696,296 @@ def get_dropdown_options():
             options['documents'] = [dict(zip([d[0] for d in cur.description], row)) for row in cur.fetchall()]
             cur.execute(f"SELECT fund_id, fund_abbr, fund_name_th FROM {config.DB_SCHEMA}.research_funds ORDER BY fund_abbr")
             options['funds'] = [dict(zip([d[0] for d in cur.description], row)) for row in cur.fetchall()]
-    finally:
-        conn.close()
     return options
 
-def get_dashboard_stats():
+# ตารางที่นับจำนวนแสดงบน Dashboard (key ใน stats, ชื่อตาราง)
+_DASHBOARD_COUNTS = [
+    ('funds_count', 'research_funds'),
+    ('glossary_count', 'glossary_terms'),
+    ('manuals_count', 'manual_chunks'),
+    ('stories_count', 'support_stories'),
+    ('docs_count', 'documents'),
+    ('cats_count', 'categories')
+]
+# ตารางทั้งหมดที่หน้า Dashboard แสดง (ใช้สร้าง ETag) ส่วนรายการ session แชทใช้ get_sessions_marker แทน
+DASHBOARD_TABLES = [table for _, table in _DASHBOARD_COUNTS]
+
+# version ของข้อมูลทุกตารางที่หน้าเว็บอ้างถึง (รวมตารางที่ join/dropdown ด้วย) ใช้สร้าง ETag ใน query เดียว
+# อ่านจาก primary เสมอ (replica ที่ตามไม่ทันจะทำให้ ETag เก่าติดไปกับข้อมูลใหม่)
+# ถ้า request นี้จะอ่านตารางเหล่านี้จาก replica แต่ replica ยังไม่ถึง version นี้ ให้อ่านจาก primary ทั้ง request แทน
+# ข้อมูลในหน้าจึงใหม่อย่างน้อยเท่ากับ version ใน ETag เสมอ (หน้าที่ cache ไว้ด้วย ETag นี้ก็เช่นกัน)
+# คืนค่า None ถ้ายังไม่ได้รัน migration หรือเชื่อมต่อไม่ได้
+def get_table_versions(tables):
+    names = sorted(set().union(*(_tables_for(t) for t in tables)))
+    with get_db_connection() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            versions = _read_table_versions(cur, names)
+    if versions is None or not has_app_context() or _read_target(names) is None:
+        return versions
+    with get_read_connection(names) as conn:
+        if not conn: return versions
+        with conn.cursor() as cur:
+            replica_versions = _read_table_versions(cur, names)
+    if replica_versions != versions:
+        g._db_read_target = 'primary'
+    return versions
+
+def _read_table_versions(cur, names):
+    # ตารางที่ยังไม่มีแถวใน table_versions แปลว่ายังไม่ได้รัน migration ที่ติด trigger ให้ตารางนั้น
+    if not db_pool.table_exists(cur, 'table_versions'):
+        return None
+    cur.execute(f"SELECT table_name, version FROM {config.DB_SCHEMA}.table_versions WHERE table_name = ANY(%s)",
+                (names,))
+    found = dict(cur.fetchall())
+    if any(t not in found for t in names):
+        return None
+    return [[t, found[t]] for t in names]
+
+def get_dashboard_stats(sessions_before=None):
     # ดึงสถิติจำนวนข้อมูลทั้งหมด และประวัติการแชทล่าสุด สำหรับแสดงผลหน้า Dashboard
-    conn = get_db_connection()
+    # จำนวนแถวอ่านจากตาราง entity_counters (trigger คอยอัปเดต) ใน query เดียว
+    # ถ้ายังไม่มีตารางนี้ หรือยังไม่มีตัวนับของตารางไหน จะ COUNT(*) ตารางนั้นตรงๆ แทน
     stats = {
         'funds_count': 0, 'glossary_count': 0, 'manuals_count': 0,
         'stories_count': 0, 'docs_count': 0, 'cats_count': 0,
-        'recent_logs': []
+        'recent_logs': [], 'sessions_next': None
     }
-    if not conn: return stats
-    try:
+    with get_read_connection([table for _, table in _DASHBOARD_COUNTS]) as conn:
+        if not conn: return stats
         with conn.cursor() as cur:
-            tables_to_count = [
-                ('funds_count', 'research_funds'),
-                ('glossary_count', 'glossary_terms'),
-                ('manuals_count', 'manual_chunks'),
-                ('stories_count', 'support_stories'),
-                ('docs_count', 'documents'),
-                ('cats_count', 'categories')
-            ]
-            for key, table in tables_to_count:
-                cur.execute(f"SELECT COUNT(*) FROM {config.DB_SCHEMA}.{table}")
-                stats[key] = cur.fetchone()[0]
-            try:
-                # จัดกลุ่มประวัติแชทตาม session_id เพื่อให้แสดงผลเป็นกล่องบทสนทนา
-                cur.execute(f"SELECT * FROM {config.DB_SCHEMA}.chat_logs ORDER BY created_at DESC")
-                cols = [desc[0] for desc in cur.description]
-                raw_logs = [dict(zip(cols, row)) for row in cur.fetchall()]
-                sessions_dict = {}
-                for log in raw_logs:
-                    sid = log.get('session_id')
-                    if sid not in sessions_dict:
-                        sessions_dict[sid] = {
-                            'session_id': sid,
-                            'last_updated': log['created_at'],
-                            'messages': [] 
-                        }
-                    sessions_dict[sid]['messages'].append(log)
-                stats['recent_logs'] = list(sessions_dict.values())[:50]
-            except Exception as e:
-                stats['recent_logs'] = []
-    finally:
-        conn.close()
+            counters = {}
+            if db_pool.table_exists(cur, 'entity_counters'):
+                cur.execute(f"SELECT table_name, row_count FROM {config.DB_SCHEMA}.entity_counters WHERE table_name = ANY(%s)",
+                            ([table for _, table in _DASHBOARD_COUNTS],))
+                counters = dict(cur.fetchall())
+            for key, table in _DASHBOARD_COUNTS:
+                if table in counters:
+                    stats[key] = counters[table]
+                else:
+                    cur.execute(f"SELECT COUNT(*) FROM {config.DB_SCHEMA}.{table}")
+                    stats[key] = cur.fetchone()[0]
+    try:
+        stats['recent_logs'], stats['sessions_next'] = get_recent_sessions(before=sessions_before)
+    except Exception as e:
+        print(f"[ERROR] Load chat sessions failed: {e}")
     return stats
 
-def get_distinct_values(table_name, column_name):
-    # ดึงค่าที่ไม่ซ้ำกันในคอลัมน์ ใช้สำหรับทำตัวเลือกในช่อง filter 
-    conn = get_db_connection()
-    items = []
-    if conn:
+# ดึงรายการเปลี่ยนแปลงที่ใหม่กว่า since (ดู journal.get_changes) คืนค่า None ถ้ายังไม่มีตาราง journal หรือเชื่อมต่อไม่ได้
+def get_changes(since=0, limit=500):
+    with transaction() as conn:
+        if not conn: return None
         with conn.cursor() as cur:
-            cur.execute(f"SELECT DISTINCT {column_name} FROM {config.DB_SCHEMA}.{table_name} WHERE {column_name} IS NOT NULL AND {column_name} != '' ORDER BY {column_name} ASC")
-            items = [row[0] for row in cur.fetchall()]
-        conn.close()
-    return items
+            return journal.get_changes(cur, since, limit)
 
+# ลบรายการ journal ที่ซ้ำ/เก่าเกินกำหนด (รันจาก `python manage.py compact-journal`)
+def compact_change_journal(max_age_days=30):
+    with transaction() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            return journal.compact(cur, max_age_days)
 
-def get_blocking_ids(child_table, fk_column, parent_id, pk_name='id'):
-    # ตรวจสอบว่ามีข้อมูลอื่นอ้างอิง ติด กับ ID นี้อยู่หรือไม่ เช็ตก่อนลบ 
-    conn = get_db_connection()
+# นับจำนวนแถวจริงแล้วแก้ตัวนับใน entity_counters ให้ตรง (รันจาก `python manage.py reconcile-counters` เป็นระยะ)
+# lock ตารางแบบ SHARE ระหว่างนับ เพื่อไม่ให้มีการเขียนแทรกจนตัวเลขคลาดเคลื่อน (การอ่านยังทำได้ตามปกติ)
+# คืนค่า list ของ (ชื่อตาราง, ค่าเดิม, ค่าที่ถูกต้อง)
+def reconcile_entity_counters():
     results = []
-    if conn:
+    for _, table in _DASHBOARD_COUNTS:
+        with transaction() as conn:
+            if not conn: return results
+            with conn.cursor() as cur:
+                cur.execute(f"LOCK TABLE {config.DB_SCHEMA}.{table} IN SHARE MODE")
+                cur.execute(f"SELECT COUNT(*) FROM {config.DB_SCHEMA}.{table}")
+                actual = cur.fetchone()[0]
+                cur.execute(f"SELECT row_count FROM {config.DB_SCHEMA}.entity_counters WHERE table_name = %s", (table,))
+                row = cur.fetchone()
+                previous = row[0] if row else None
+                cur.execute(f"""
+                    INSERT INTO {config.DB_SCHEMA}.entity_counters (table_name, row_count, reconciled_at)
+                    VALUES (%s, %s, now())
+                    ON CONFLICT (table_name) DO UPDATE SET row_count = EXCLUDED.row_count, reconciled_at = EXCLUDED.reconciled_at
+                """, (table, actual))
+        results.append((table, previous, actual))
+    return results
+
+# ดึง session แชทล่าสุดทีละหน้า (ค่าเริ่มต้น 50 session) เฉพาะข้อมูลสรุป ข้อความของแต่ละ session โหลดแยกด้วย get_session_messages
+# ใช้ตาราง chat_sessions (migrations/002) ถ้ามี ไม่งั้นสรุปจาก chat_logs ด้วย GROUP BY ใน SQL แทน
+# before คือ token ของ session สุดท้ายในหน้าก่อน ใช้เลื่อนไปดู session ที่เก่ากว่า คืนค่า (sessions, next_token)
+def get_recent_sessions(limit=50, before=None):
+    sessions = []
+    with get_read_connection(('chat_logs',)) as conn:
+        if not conn: return sessions, None
+        with conn.cursor() as cur:
+            if db_pool.table_exists(cur, 'chat_sessions'):
+                source_sql = f"SELECT session_id, last_updated, message_count FROM {config.DB_SCHEMA}.chat_sessions"
+            else:
+                source_sql = f"""
+                    SELECT COALESCE(session_id::text, '') AS session_id, MAX(created_at) AS last_updated, COUNT(*) AS message_count
+                    FROM {config.DB_SCHEMA}.chat_logs GROUP BY COALESCE(session_id::text, '')
+                """
+
+            seek_sql, params = _session_seek(before)
+            cur.execute(f"""
+                SELECT session_id, last_updated, message_count FROM ({source_sql}) s
+                {seek_sql}
+                ORDER BY last_updated DESC, session_id DESC LIMIT %s
+            """, tuple(params + [limit + 1]))
+            rows = cur.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if not rows: return sessions, None
+
+            sessions = [{'session_id': sid, 'last_updated': last_updated, 'message_count': message_count}
+                        for sid, last_updated, message_count in rows]
+
+    next_token = None
+    if has_more:
+        last = sessions[-1]
+        next_token = _encode_token({'t': last['last_updated'].isoformat(), 's': last['session_id']})
+    return sessions, next_token
+
+def _session_seek(before):
+    token = _decode_token(before) if before else None
+    if isinstance(token, dict) and 't' in token and 's' in token:
+        return "WHERE (last_updated, session_id) < (%s::timestamptz, %s)", [token['t'], token['s']]
+    return "", []
+
+# ข้อมูลสรุปของ session ในหน้าที่ get_recent_sessions จะแสดง (ใช้ index last_updated อ่านแค่ limit + 1 แถว) ใช้สร้าง ETag ของ Dashboard
+# เปลี่ยนเฉพาะเมื่อ session ในหน้านั้นเปลี่ยน ข้อความใหม่ของ session ที่อยู่หน้าอื่นไม่ทำให้หน้านี้ต้องโหลดใหม่
+# คืนค่า None ถ้าไม่มีตาราง chat_sessions หรือเชื่อมต่อไม่ได้ (ไม่ใช้ ETag)
+def get_sessions_marker(before=None, limit=50):
+    with get_read_connection(('chat_logs',)) as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            if not db_pool.table_exists(cur, 'chat_sessions'):
+                return None
+            seek_sql, params = _session_seek(before)
+            cur.execute(f"""
+                SELECT session_id, last_updated, message_count FROM {config.DB_SCHEMA}.chat_sessions
+                {seek_sql}
+                ORDER BY last_updated DESC, session_id DESC LIMIT %s
+            """, tuple(params + [limit + 1]))
+            return [[sid, last_updated.isoformat(), count] for sid, last_updated, count in cur.fetchall()]
+
+# ข้อความของ session แชทเดียวทีละหน้า (ใหม่ไปเก่า ใช้ index chat_logs_session_created_idx) สำหรับหน้าต่างดูแชทบน Dashboard
+# session_id '' คือข้อความที่ไม่มี session (ตรงกับ chat_sessions) before คือ token ของข้อความเก่าสุดในหน้าก่อน
+# คืนค่า (messages เรียงเก่าไปใหม่, token ของหน้าที่เก่ากว่า) หรือ None ถ้าเชื่อมต่อไม่ได้
+def get_session_messages(session_id, before=None, limit=50):
+    with get_read_connection(('chat_logs',)) as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            if session_id == '':
+                where_sql = "(session_id IS NULL OR session_id::text = '')"
+                params = []
+            else:
+                where_sql = "session_id::text = %s"
+                params = [session_id]
+            token = _decode_token(before) if before else None
+            if isinstance(token, dict) and 't' in token:
+                where_sql += " AND created_at < %s::timestamptz"
+                params.append(token['t'])
+            cur.execute(f"""
+                SELECT * FROM {config.DB_SCHEMA}.chat_logs
+                WHERE {where_sql}
+                ORDER BY created_at DESC LIMIT %s
+            """, tuple(params + [limit + 1]))
+            cols = [desc[0] for desc in cur.description]
+            messages = [dict(zip(cols, row)) for row in cur.fetchall()]
+    next_token = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_token = _encode_token({'t': messages[-1]['created_at'].isoformat()})
+    messages.reverse()
+    return messages, next_token
+
+# (เวลาข้อความล่าสุด, จำนวนข้อความ, revision) ของ session จาก chat_sessions เปลี่ยนทุกครั้งที่ข้อความของ session นั้นถูกเพิ่ม/ลบ/แก้
+# ใช้เป็น key ของ cache หน้าต่างดูแชท คืนค่า None ถ้ายังไม่ได้รัน migration 010 หรือเชื่อมต่อไม่ได้ (ไม่ cache)
+def get_session_marker(session_id):
+    with get_read_connection(('chat_logs',)) as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            if not db_pool.table_exists(cur, 'chat_sessions', 'revision'):
+                return None
+            cur.execute(f"SELECT last_updated, message_count, revision FROM {config.DB_SCHEMA}.chat_sessions WHERE session_id = %s",
+                        (session_id,))
+            row = cur.fetchone()
+    return (row[0].isoformat(), row[1], row[2]) if row else ('', 0, 0)
+
+def get_distinct_values(table_name, column_name):
+    # ดึงค่าที่ไม่ซ้ำกันในคอลัมน์ ใช้สำหรับทำตัวเลือกในช่อง filter (cache ไว้จนกว่าตารางจะถูกแก้ไข)
+    items = _options_cache.get_or_load(('distinct', table_name, column_name), _tables_for(table_name),
+                                       lambda: _load_distinct_values(table_name, column_name))
+    return items if items is not None else []
+
+def _load_distinct_values(table_name, column_name):
+    with get_read_connection(_tables_for(table_name)) as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT DISTINCT {column_name} FROM {config.DB_SCHEMA}.{table_name} WHERE {column_name} IS NOT NULL AND {column_name} != '' ORDER BY {column_name} ASC")
+            return [row[0] for row in cur.fetchall()]
+
+
+# ความสัมพันธ์ของตารางหลักกับตารางลูกที่อ้างอิงอยู่ (ใช้ตรวจก่อนลบ)
+# ตารางหลัก -> (primary key, [(ตารางลูก, คอลัมน์ FK ในตารางลูก, คอลัมน์ที่ถูกอ้างในตารางหลัก, ชื่อหน้า)])
+DEPENDENCIES = {
+    'research_funds': ('fund_id', [('manual_chunks', 'fund_abbr', 'fund_abbr', 'manuals')]),
+    'documents': ('id', [('manual_chunks', 'doc_id', 'id', 'manuals')]),
+    'categories': ('id', [('manual_chunks', 'category_id', 'id', 'manuals'),
+                          ('support_stories', 'category_id', 'id', 'stories')]),
+}
+BLOCKER_SAMPLE = 20   # จำนวน ID ตัวอย่างของแถวลูกที่คืนต่อ (แถวหลัก, ตารางลูก)
+
+def _find_blockers(cur, table_name, ids):
+    # หาแถวลูกที่อ้างอิง ids ทุกตารางลูกใน query เดียว
+    # คืนค่า {parent_id: {child_table: {'page', 'count', 'ids'}}} เฉพาะ id ที่ยังมีการใช้งาน
+    pk, children = DEPENDENCIES[table_name]
+    if not ids: return {}
+    parts = []
+    for child, fk, ref, page in children:
+        parts.append(f"""
+            SELECT p.{pk}, %s, %s, COUNT(*), (array_agg(c.id ORDER BY c.id))[1:{BLOCKER_SAMPLE}]
+            FROM {config.DB_SCHEMA}.{table_name} p JOIN {config.DB_SCHEMA}.{child} c ON c.{fk} = p.{ref}
+            WHERE p.{pk} = ANY(%s) GROUP BY p.{pk}
+        """)
+    params = []
+    for child, _, _, page in children:
+        params += [child, page, list(ids)]
+    cur.execute(" UNION ALL ".join(parts), params)
+    blockers = {}
+    for parent_id, child, page, count, sample in cur.fetchall():
+        blockers.setdefault(parent_id, {})[child] = {'page': page, 'count': count, 'ids': sample}
+    return blockers
+
+def get_dependencies(table_name, ids):
+    # ตรวจว่า id ไหนยังถูกอ้างอิงอยู่ (ลบไม่ได้) ใช้แสดงก่อนยืนยันการลบ คืนค่า None ถ้าเชื่อมต่อไม่ได้
+    with get_db_connection() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            return _find_blockers(cur, table_name, ids)
+
+def bulk_delete(table_name, ids):
+    # ลบหลายแถวของตารางหลักใน transaction เดียว แถวที่ยังถูกอ้างอิงจะข้ามไปและรายงานกลับ
+    # lock แถวหลักด้วย FOR UPDATE ก่อนตรวจ แถวลูกที่เพิ่ม/ย้ายมาอ้างอิงระหว่างนั้นต้องรอจน transaction นี้จบ จึงไม่ชน FK ภายหลัง
+    # คืนค่า {'deleted': [...], 'blocked': {id: blockers}, 'missing': [...]} หรือ None ถ้าเชื่อมต่อไม่ได้
+    pk, _ = DEPENDENCIES[table_name]
+    ids = sorted(set(ids))
+    result = {'deleted': [], 'blocked': {}, 'missing': []}
+    if not ids: return result
+    with transaction() as conn:
+        if not conn: return None
         try:
             with conn.cursor() as cur:
-                sql = f"SELECT {pk_name} FROM {config.DB_SCHEMA}.{child_table} WHERE {fk_column} = %s ORDER BY {pk_name} ASC"
-                cur.execute(sql, (parent_id,))
-                results = [row[0] for row in cur.fetchall()]
+                cur.execute(f"SELECT {pk} FROM {config.DB_SCHEMA}.{table_name} WHERE {pk} = ANY(%s) ORDER BY {pk} FOR UPDATE", (ids,))
+                found = [row[0] for row in cur.fetchall()]
+                result['blocked'] = _find_blockers(cur, table_name, found)
+                deletable = [i for i in found if i not in result['blocked']]
+                if deletable:
+                    cur.execute(f"DELETE FROM {config.DB_SCHEMA}.{table_name} WHERE {pk} = ANY(%s) RETURNING {pk}", (deletable,))
+                    result['deleted'] = sorted(row[0] for row in cur.fetchall())
         except Exception as e:
-            print(f"[DEBUG] get_blocking_ids failed: {e}")
-        finally:
-            conn.close()
-    return results
\ No newline at end of file
+            print(f"[ERROR] Bulk delete {table_name} failed: {e}")
+            raise e
+        if result['deleted']:
+            record_change(conn, table_name, result['deleted'], 'D')
+    result['missing'] = [i for i in ids if i not in found]
+    return result
@@ -0,0 +1,409 @@
+import itertools
+import os
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+import config
+import instrumentation
+
+# ส่วนจัดการ Connection Pool ของ PostgreSQL
+# แต่ละ gunicorn worker (process) จะมี pool เป็นของตัวเอง สร้างตอนใช้งานครั้งแรก
+# หลัง fork จะไม่ใช้ connection ที่ติดมาจาก process แม่ต่อ เพื่อไม่ให้ใช้ socket ร่วมกัน
+
+
+class PoolTimeout(Exception):
+    # รอ connection ว่างนานเกิน DB_POOL_TIMEOUT
+    pass
+
+
+class _PooledConnection:
+    # เก็บ connection พร้อมเวลาที่สร้างและเวลาที่ใช้งานล่าสุด เพื่อใช้ตัดสินใจ recycle
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    def __init__(self, connect_kwargs, minconn=1, maxconn=5, max_lifetime=1800,
+                 max_idle=300, timeout=10, check_interval=30, autocommit=False):
+        self._connect_kwargs = connect_kwargs
+        self.autocommit = autocommit
+        self.minconn = minconn
+        self.maxconn = max(maxconn, 1)
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.check_interval = check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []       # connection ที่ว่างอยู่ (ใช้แบบ LIFO ตัวล่าสุดจะอุ่นที่สุด)
+        self._in_use = {}     # id(conn) -> _PooledConnection ที่ถูกยืมออกไป
+        self._opened = 0      # จำนวน connection ที่เปิดอยู่ทั้งหมด (ว่าง + ใช้งาน + กำลังเปิด)
+        self._pid = os.getpid()
+        self._orphans = []    # connection ที่ติดมาจาก process แม่ เก็บไว้เฉยๆ ห้ามปิด
+
+        self._stats = {
+            'checkouts': 0, 'waits': 0, 'wait_time_total': 0.0, 'wait_time_max': 0.0,
+            'timeouts': 0, 'created': 0, 'closed': 0, 'recycled': 0, 'failed_checks': 0,
+        }
+
+    # เปิด connection ใหม่ไปยังฐานข้อมูล
+    def _open(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        if self.autocommit:
+            conn.autocommit = True
+        self._stats['created'] += 1
+        return _PooledConnection(conn)
+
+    def _close(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        self._stats['closed'] += 1
+
+    def _is_expired(self, entry, now):
+        if self.max_lifetime and now - entry.created_at > self.max_lifetime:
+            return True
+        if self.max_idle and now - entry.last_used > self.max_idle and self._opened > self.minconn:
+            return True
+        return False
+
+    # ตรวจว่าอยู่ใน process เดิมไหม ถ้าเป็น process ลูกหลัง fork ให้ทิ้งของเดิมโดยไม่ปิด socket
+    def _check_fork(self):
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._orphans.extend(self._idle)
+            self._orphans.extend(self._in_use.values())
+            self._idle = []
+            self._in_use = {}
+            self._opened = 0
+            self._pid = os.getpid()
+
+    # เช็คสุขภาพ connection ก่อนส่งให้ผู้ใช้ ถ้าว่างนานเกิน check_interval จะยิง SELECT 1
+    def _is_healthy(self, entry, now):
+        conn = entry.conn
+        if conn.closed:
+            return False
+        if now - entry.last_used < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # ยืม connection ออกจาก pool ถ้าเต็มจะรอจนกว่าจะมีคืน หรือหมดเวลา
+    def getconn(self):
+        self._check_fork()
+        deadline = None
+        waited_from = None
+        while True:
+            entry = None
+            create = False
+            with self._cond:
+                now = time.monotonic()
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if self._is_expired(candidate, now):
+                        self._opened -= 1
+                        self._stats['recycled'] += 1
+                        self._close(candidate)
+                        continue
+                    entry = candidate
+                    break
+                if entry is None and self._opened < self.maxconn:
+                    self._opened += 1
+                    create = True
+                if entry is None and not create:
+                    if deadline is None:
+                        deadline = now + self.timeout
+                        waited_from = now
+                        self._stats['waits'] += 1
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        self._record_wait(waited_from)
+                        raise PoolTimeout(f"no free connection after {self.timeout}s (max={self.maxconn})")
+                    self._cond.wait(remaining)
+                    continue
+
+            if create:
+                try:
+                    entry = self._open()
+                except Exception:
+                    with self._cond:
+                        self._opened -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(entry, time.monotonic()):
+                self._stats['failed_checks'] += 1
+                self._close(entry)
+                with self._cond:
+                    self._opened -= 1
+                continue
+
+            with self._cond:
+                self._in_use[id(entry.conn)] = entry
+                self._stats['checkouts'] += 1
+                if waited_from is not None:
+                    self._record_wait(waited_from)
+            return entry.conn
+
+    def _record_wait(self, waited_from):
+        waited = time.monotonic() - waited_from
+        self._stats['wait_time_total'] += waited
+        self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+    # คืน connection เข้า pool ถ้า transaction ค้างอยู่จะ rollback ให้ก่อน
+    def putconn(self, conn, discard=False):
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            return
+
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        now = time.monotonic()
+        with self._cond:
+            if discard or conn.closed or (self.max_lifetime and now - entry.created_at > self.max_lifetime):
+                self._opened -= 1
+                self._stats['recycled'] += 1
+                self._close(entry)
+            else:
+                entry.last_used = now
+                self._idle.append(entry)
+            self._cond.notify()
+
+    # ปิด connection ที่ว่างอยู่ทั้งหมด (ใช้ตอนปิดโปรแกรม)
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            for entry in idle:
+                self._close(entry)
+            self._cond.notify_all()
+
+    # สถิติสำหรับ monitoring
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                'pid': self._pid,
+                'min': self.minconn,
+                'max': self.maxconn,
+                'open': self._opened,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+            })
+        data['wait_time_avg'] = data['wait_time_total'] / data['waits'] if data['waits'] else 0.0
+        return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def connect_kwargs():
+    # ค่าที่ใช้เปิด connection (ใช้ร่วมกับ connection เฉพาะกิจที่ไม่ผ่าน pool เช่น ตัวรอฟัง NOTIFY)
+    return dict(
+        host=config.DB_HOST,
+        database=config.DB_NAME,
+        user=config.DB_USER,
+        password=config.DB_PASS,
+        port=config.DB_PORT,
+        connect_timeout=config.DB_CONNECT_TIMEOUT,
+    )
+
+
+def get_pool():
+    # คืนค่า pool ของ process ปัจจุบัน (สร้างตอนเรียกใช้ครั้งแรก)
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    # ทุก cursor จาก pool จับเวลา SQL ให้ (instrumentation.py)
+                    connect_kwargs=dict(connect_kwargs(), cursor_factory=instrumentation.TimedCursor),
+                    minconn=config.DB_POOL_MIN,
+                    maxconn=config.DB_POOL_MAX,
+                    max_lifetime=config.DB_POOL_MAX_LIFETIME,
+                    max_idle=config.DB_POOL_MAX_IDLE,
+                    timeout=config.DB_POOL_TIMEOUT,
+                    check_interval=config.DB_POOL_CHECK_INTERVAL,
+                )
+    return _pool
+
+
+def pool_stats():
+    return get_pool().stats()
+
+# เช็คว่ามีตาราง (หรือคอลัมน์) ที่สร้างจาก migration แล้วหรือยัง ใช้ร่วมกันทุกโมดูล
+# ผลถูก cache ไว้ 5 นาที หลังรัน migration ระบบจะเริ่มใช้ส่วนใหม่เองภายในเวลานั้นโดยไม่ต้อง restart
+_SCHEMA_CHECK_TTL = 300
+_schema_checks = {}   # (ตาราง, คอลัมน์) -> (มีหรือไม่, เวลาที่เช็ค)
+_schema_checks_lock = threading.Lock()
+
+def table_exists(cur, table_name, column_name=None):
+    key = (table_name, column_name)
+    with _schema_checks_lock:
+        cached = _schema_checks.get(key)
+    if cached and time.monotonic() - cached[1] < _SCHEMA_CHECK_TTL:
+        return cached[0]
+    if column_name is None:
+        cur.execute("SELECT to_regclass(%s)", (f"{config.DB_SCHEMA}.{table_name}",))
+        exists = cur.fetchone()[0] is not None
+    else:
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s AND column_name = %s
+        """, (config.DB_SCHEMA, table_name, column_name))
+        exists = cur.fetchone() is not None
+    with _schema_checks_lock:
+        _schema_checks[key] = (exists, time.monotonic())
+    return exists
+
+
+# Read replica: แต่ละตัวมี pool ของตัวเอง (autocommit เพื่อไม่ให้มี transaction ค้างบน replica ซึ่งทำให้ replay ติด)
+# ตรวจ lag ทุก DB_REPLICA_CHECK_INTERVAL วินาที ตัวที่ช้าเกิน DB_REPLICA_MAX_LAG หรือเชื่อมต่อไม่ได้จะถูกข้าม (ใช้ primary แทน)
+_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.lag = None          # วินาทีที่ช้ากว่า primary จากการตรวจครั้งล่าสุด (None = ยังไม่รู้ / ใช้ไม่ได้)
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self.error = None
+        self.reads = 0
+        self._checking = threading.Lock()
+
+    def check(self):
+        # ตรวจ lag (ถ้ามี thread อื่นกำลังตรวจอยู่จะใช้ค่าเดิมไปก่อน)
+        if not self._checking.acquire(blocking=False):
+            return
+        try:
+            conn = self.pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(_LAG_SQL)
+                    self.lag = float(cur.fetchone()[0])
+            finally:
+                self.pool.putconn(conn)
+            self.error = None
+        except PoolTimeout:
+            pass
+        except Exception as e:
+            self.mark_down(e)
+        finally:
+            self.checked_at = time.monotonic()
+            self._checking.release()
+
+    def mark_down(self, error):
+        # พักการใช้ replica นี้ DB_REPLICA_RETRY วินาที
+        self.lag = None
+        self.error = str(error)
+        self.down_until = time.monotonic() + config.DB_REPLICA_RETRY
+        print(f"[ERROR] Replica {self.name} unavailable: {error}")
+
+    def stats(self):
+        data = self.pool.stats()
+        data.update({'name': self.name, 'lag': self.lag, 'reads': self.reads, 'error': self.error,
+                     'down': self.down_until > time.monotonic()})
+        return data
+
+
+_replicas = None
+_round_robin = itertools.count()
+
+
+def _replica_kwargs(dsn):
+    # ค่าใน DSN ของ replica ทับค่าของ primary (ไม่ระบุ user / password / database ก็ใช้ตาม primary)
+    kwargs = connect_kwargs()
+    parsed = psycopg2.extensions.parse_dsn(dsn)
+    if 'dbname' in parsed:
+        kwargs.pop('database', None)
+    kwargs.update(parsed)
+    return kwargs
+
+
+def get_replicas():
+    global _replicas
+    if _replicas is None:
+        with _pool_lock:
+            if _replicas is None:
+                replicas = []
+                for dsn in config.DB_REPLICA_DSNS:
+                    kwargs = _replica_kwargs(dsn)
+                    pool = ConnectionPool(
+                        connect_kwargs=dict(kwargs, cursor_factory=instrumentation.TimedCursor),
+                        minconn=config.DB_POOL_MIN,
+                        maxconn=config.DB_POOL_MAX,
+                        max_lifetime=config.DB_POOL_MAX_LIFETIME,
+                        max_idle=config.DB_POOL_MAX_IDLE,
+                        timeout=config.DB_POOL_TIMEOUT,
+                        check_interval=config.DB_POOL_CHECK_INTERVAL,
+                        autocommit=True,
+                    )
+                    replicas.append(Replica(f"{kwargs.get('host') or 'localhost'}:{kwargs.get('port') or 5432}", pool))
+                _replicas = replicas
+    return _replicas
+
+
+def pick_replica():
+    # เลือก replica ที่ใช้ได้และ lag ไม่เกิน DB_REPLICA_MAX_LAG แบบวนสลับ คืนค่า None ถ้าไม่มีตัวไหนใช้ได้
+    now = time.monotonic()
+    usable = []
+    for replica in get_replicas():
+        if replica.down_until > now:
+            continue
+        if now - replica.checked_at > config.DB_REPLICA_CHECK_INTERVAL:
+            replica.check()
+        if replica.lag is not None and replica.lag <= config.DB_REPLICA_MAX_LAG:
+            usable.append(replica)
+    if not usable:
+        return None
+    return usable[next(_round_robin) % len(usable)]
+
+
+def replica_stats():
+    return [replica.stats() for replica in get_replicas()]
+
+
+# หลัง fork ให้ process ลูกล้าง connection ของ process แม่ออกจาก pool (เก็บไว้เป็น orphan ไม่ให้ถูกปิด)
+def _after_fork_in_child():
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    if _pool is not None:
+        _pool._cond = threading.Condition()
+        _pool._check_fork()
+    for replica in _replicas or []:
+        replica.pool._cond = threading.Condition()
+        replica.pool._check_fork()
+        replica._checking = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
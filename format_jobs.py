@@ -0,0 +1,369 @@
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import ai_format
+import config
+import db_actions
+import db_pool
+
+# งานจัดรูปแบบ manual_chunks ที่มีอยู่แล้วด้วย AI ทีละมากๆ แบบ background (ตาราง format_jobs / format_job_items, migrations/006)
+# - ตอนสร้างงานจะบันทึก id ของ chunk ที่ตรงกับตัวกรอง (data_type, category_id, doc_id) ไว้ทั้งหมด
+# - แต่ละ worker มี thread หนึ่งตัวคอยรับงานที่ queued (หรืองานที่ worker เดิมหายไป heartbeat ขาด) ด้วย FOR UPDATE SKIP LOCKED
+#   จึงไม่มีสอง worker ทำงานเดียวกัน และงานที่ค้างตอน restart จะถูกรับไปทำต่อเฉพาะรายการที่ยัง pending
+# - mode draft: เก็บผลไว้ใน format_job_items รอตรวจแล้วกด apply, mode apply: บันทึกผ่าน update_manual_chunk ทันที
+#   ก่อนบันทึกจะเช็คว่าเนื้อหาไม่ถูกแก้ไขระหว่างรอ AI ถ้าถูกแก้จะข้ามรายการนั้น
+
+FILTERS = ('data_type', 'category_id', 'doc_id')
+MODES = ('draft', 'apply')
+ITEM_STATUSES = ('pending', 'drafted', 'applied', 'skipped', 'failed')
+
+_state = {'pid': None, 'thread': None, 'job_id': None, 'last_error': None}
+_start_lock = threading.Lock()
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def is_enabled(cur):
+    return db_pool.table_exists(cur, 'format_jobs')
+
+
+class _RateLimiter:
+    # เว้นระยะการเรียก AI ให้ไม่เกิน per_minute ครั้งต่อนาที (ใช้ร่วมกันทุก thread ของงานเดียวกัน)
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute and per_minute > 0 else 0
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self, stop):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_at, now)
+            self.next_at = slot + self.interval
+        stop.wait(max(0, slot - now))
+
+
+# ส่วนจัดการงาน (เรียกจากหน้าเว็บ / API)
+def create_job(filters, mode='draft', concurrency=None, rate_per_minute=None):
+    # สร้างงานใหม่ คืนค่า id ของงาน (None ถ้าเชื่อมต่อไม่ได้หรือยังไม่ได้รัน migration)
+    filters = {k: filters[k] for k in FILTERS if filters.get(k) not in (None, '')}
+    concurrency = max(1, min(int(concurrency or config.FORMAT_JOB_CONCURRENCY), config.AI_MAX_CONCURRENT))
+    rate_per_minute = int(rate_per_minute if rate_per_minute is not None else config.FORMAT_JOB_RATE_PER_MINUTE)
+    where, params = [], []
+    for column in FILTERS:
+        if column in filters:
+            where.append(f"{column} = %s")
+            params.append(filters[column])
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+    with db_actions.transaction() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            if not is_enabled(cur): return None
+            cur.execute(f"""
+                INSERT INTO {config.DB_SCHEMA}.format_jobs (mode, filters, concurrency, rate_per_minute)
+                VALUES (%s, %s, %s, %s) RETURNING id
+            """, (mode, json.dumps(filters), concurrency, rate_per_minute))
+            job_id = cur.fetchone()[0]
+            cur.execute(f"""
+                INSERT INTO {config.DB_SCHEMA}.format_job_items (job_id, chunk_id)
+                SELECT %s, id FROM {config.DB_SCHEMA}.manual_chunks {where_sql}
+            """, [job_id] + params)
+            cur.execute(f"UPDATE {config.DB_SCHEMA}.format_jobs SET total = %s WHERE id = %s", (cur.rowcount, job_id))
+    return job_id
+
+def _job_dicts(cur, where_sql, params):
+    cur.execute(f"""
+        SELECT j.id, j.status, j.mode, j.filters, j.concurrency, j.rate_per_minute, j.total, j.owner,
+               j.created_at, j.started_at, j.finished_at, j.heartbeat_at,
+               COUNT(i.chunk_id) FILTER (WHERE i.status = 'pending') AS pending,
+               COUNT(i.chunk_id) FILTER (WHERE i.status = 'drafted') AS drafted,
+               COUNT(i.chunk_id) FILTER (WHERE i.status = 'applied') AS applied,
+               COUNT(i.chunk_id) FILTER (WHERE i.status = 'skipped') AS skipped,
+               COUNT(i.chunk_id) FILTER (WHERE i.status = 'failed') AS failed,
+               COUNT(i.chunk_id) FILTER (WHERE i.processed_at > now() - interval '5 minutes' AND i.status <> 'pending') AS recent,
+               EXTRACT(EPOCH FROM (COALESCE(j.finished_at, now()) - j.started_at)) AS elapsed
+        FROM {config.DB_SCHEMA}.format_jobs j
+        LEFT JOIN {config.DB_SCHEMA}.format_job_items i ON i.job_id = j.id
+        {where_sql}
+        GROUP BY j.id ORDER BY j.id DESC
+    """, params)
+    columns = [d[0] for d in cur.description]
+    jobs = []
+    for row in cur.fetchall():
+        job = dict(zip(columns, row))
+        job['processed'] = job['total'] - job['pending']
+        elapsed = float(job.pop('elapsed') or 0)
+        # throughput: รายการต่อนาทีตั้งแต่เริ่มงาน และในช่วง 5 นาทีล่าสุด
+        job['per_minute'] = round(job['processed'] * 60 / elapsed, 2) if elapsed > 0 else None
+        job['recent_per_minute'] = round(job.pop('recent') / 5, 2)
+        for key in ('created_at', 'started_at', 'finished_at', 'heartbeat_at'):
+            job[key] = job[key].isoformat() if job[key] else None
+        jobs.append(job)
+    return jobs
+
+def list_jobs(limit=20):
+    with db_actions.get_db_connection() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            if not is_enabled(cur): return None
+            return _job_dicts(cur, f"WHERE j.id IN (SELECT id FROM {config.DB_SCHEMA}.format_jobs ORDER BY id DESC LIMIT %s)", (limit,))
+
+def get_job(job_id, item_status=None, limit=100):
+    # รายละเอียดงานพร้อมรายการ (กรองตามสถานะได้ เช่น failed หรือ drafted)
+    with db_actions.get_db_connection() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            if not is_enabled(cur): return None
+            jobs = _job_dicts(cur, "WHERE j.id = %s", (job_id,))
+            if not jobs: return None
+            job = jobs[0]
+            cur.execute(f"""
+                SELECT i.chunk_id, m.topic, i.status, i.attempts, i.error, i.warnings, i.draft_content, i.processed_at
+                FROM {config.DB_SCHEMA}.format_job_items i
+                LEFT JOIN {config.DB_SCHEMA}.manual_chunks m ON m.id = i.chunk_id
+                WHERE i.job_id = %s AND (%s::text IS NULL OR i.status = %s)
+                ORDER BY i.processed_at DESC NULLS LAST, i.chunk_id LIMIT %s
+            """, (job_id, item_status, item_status, limit))
+            columns = [d[0] for d in cur.description]
+            job['items'] = [dict(zip(columns, row)) for row in cur.fetchall()]
+            for item in job['items']:
+                item['processed_at'] = item['processed_at'].isoformat() if item['processed_at'] else None
+            return job
+
+# การเปลี่ยนสถานะที่ทำได้จากหน้าเว็บ: (สถานะเดิมที่ยอมให้เปลี่ยน, สถานะใหม่)
+_ACTIONS = {
+    'pause': (('queued', 'running'), 'paused'),
+    'resume': (('paused',), 'queued'),
+    'cancel': (('queued', 'running', 'paused'), 'cancelled'),
+}
+
+def set_status(job_id, action):
+    # คืนค่าสถานะใหม่ หรือ None ถ้าเปลี่ยนไม่ได้ (worker ที่กำลังทำงานจะเห็นและหยุดเองภายในรอบ heartbeat ถัดไป)
+    allowed, status = _ACTIONS[action]
+    with db_actions.transaction() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {config.DB_SCHEMA}.format_jobs
+                SET status = %s, owner = CASE WHEN %s = 'queued' THEN NULL ELSE owner END,
+                    finished_at = CASE WHEN %s = 'cancelled' THEN now() ELSE finished_at END
+                WHERE id = %s AND status = ANY(%s) RETURNING status
+            """, (status, status, status, job_id, list(allowed)))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+def _apply_content(cur, chunk_id, source_content, formatted):
+    # บันทึกเนื้อหาใหม่ผ่าน update_manual_chunk (ใน transaction เดียวกับผู้เรียก)
+    # คืนค่า False ถ้า chunk ถูกลบ หรือเนื้อหาถูกแก้ไขไปแล้วหลังจากที่ส่งให้ AI
+    cur.execute(f"""
+        SELECT topic, content, section, step_number, fund_abbr, data_type, doc_id, category_id
+        FROM {config.DB_SCHEMA}.manual_chunks WHERE id = %s FOR UPDATE
+    """, (chunk_id,))
+    row = cur.fetchone()
+    if row is None:
+        return False
+    data = dict(zip([d[0] for d in cur.description], row))
+    if data['content'] != source_content:
+        return False
+    data['content'] = formatted
+    db_actions.update_manual_chunk(chunk_id, data)
+    return True
+
+def apply_drafts(job_id, chunk_ids=None):
+    # บันทึกผลที่เป็น draft ลง manual_chunks (ทั้งงาน หรือเฉพาะ chunk_ids) คืนค่า (จำนวนที่บันทึก, จำนวนที่ข้าม)
+    applied = skipped = 0
+    with db_actions.transaction() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT chunk_id, source_content, draft_content FROM {config.DB_SCHEMA}.format_job_items
+                WHERE job_id = %s AND status = 'drafted' AND (%s::int[] IS NULL OR chunk_id = ANY(%s))
+                ORDER BY chunk_id FOR UPDATE
+            """, (job_id, chunk_ids, chunk_ids))
+            for chunk_id, source_content, draft_content in cur.fetchall():
+                if _apply_content(cur, chunk_id, source_content, draft_content):
+                    status, error = 'applied', None
+                    applied += 1
+                else:
+                    status, error = 'skipped', 'content changed since formatting'
+                    skipped += 1
+                cur.execute(f"""
+                    UPDATE {config.DB_SCHEMA}.format_job_items SET status = %s, error = %s, processed_at = now()
+                    WHERE job_id = %s AND chunk_id = %s
+                """, (status, error, job_id, chunk_id))
+    return applied, skipped
+
+
+# ส่วนทำงาน (background thread ของแต่ละ worker หรือ `python manage.py run-format-jobs`)
+def _claim():
+    # รับงานที่รออยู่ หรืองานที่ heartbeat ขาดเกิน FORMAT_JOB_STALE วินาที (worker เดิม restart/ตายไปแล้ว)
+    with db_actions.transaction() as conn:
+        if not conn: return None
+        with conn.cursor() as cur:
+            if not is_enabled(cur): return None
+            cur.execute(f"""
+                UPDATE {config.DB_SCHEMA}.format_jobs
+                SET status = 'running', owner = %s, heartbeat_at = now(), started_at = COALESCE(started_at, now())
+                WHERE id = (
+                    SELECT id FROM {config.DB_SCHEMA}.format_jobs
+                    WHERE status = 'queued'
+                       OR (status = 'running' AND heartbeat_at < now() - make_interval(secs => %s))
+                    ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, mode, concurrency, rate_per_minute
+            """, (_owner(), config.FORMAT_JOB_STALE))
+            row = cur.fetchone()
+            return dict(zip(['id', 'mode', 'concurrency', 'rate_per_minute'], row)) if row else None
+
+def _heartbeat(job_id):
+    # ต่ออายุการถือครองงาน คืนค่า False ถ้างานถูกหยุด/ยกเลิก หรือ worker อื่นรับไปแล้ว
+    with db_actions.transaction() as conn:
+        if not conn: return False
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {config.DB_SCHEMA}.format_jobs SET heartbeat_at = now()
+                WHERE id = %s AND status = 'running' AND owner = %s RETURNING id
+            """, (job_id, _owner()))
+            return cur.fetchone() is not None
+
+def _next_items(job_id, after, limit):
+    # เชื่อมต่อไม่ได้ต้อง raise (ไม่คืน []) ไม่งั้น _run_job จะเข้าใจว่าไม่มีรายการเหลือแล้วปิดงานเป็น done
+    with db_actions.get_db_connection() as conn:
+        if not conn: raise RuntimeError("database unavailable")
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT chunk_id FROM {config.DB_SCHEMA}.format_job_items
+                WHERE job_id = %s AND status = 'pending' AND chunk_id > %s ORDER BY chunk_id LIMIT %s
+            """, (job_id, after, limit))
+            return [row[0] for row in cur.fetchall()]
+
+def _finish_item(job_id, chunk_id, status, source_content=None, draft=None, warnings=None, error=None, failed=False):
+    # บันทึกผลของรายการ (รายการที่ล้มเหลวจะกลับไปเป็น pending จนกว่าจะลองครบ FORMAT_JOB_MAX_ATTEMPTS ครั้ง)
+    with db_actions.transaction() as conn:
+        if not conn: raise RuntimeError("database unavailable")
+        with conn.cursor() as cur:
+            if status == 'applied' and not _apply_content(cur, chunk_id, source_content, draft):
+                status, error = 'skipped', 'content changed since formatting'
+            cur.execute(f"""
+                UPDATE {config.DB_SCHEMA}.format_job_items
+                SET attempts = attempts + %s, error = %s, processed_at = now(),
+                    status = CASE WHEN %s AND attempts + 1 < %s THEN 'pending' ELSE %s END,
+                    source_content = %s, draft_content = %s, warnings = %s
+                WHERE job_id = %s AND chunk_id = %s
+            """, (1 if failed else 0, error, failed, config.FORMAT_JOB_MAX_ATTEMPTS, status,
+                  source_content, draft if status == 'drafted' else None,
+                  json.dumps(warnings, ensure_ascii=False) if warnings else None, job_id, chunk_id))
+
+def _process_item(job, chunk_id, limiter, stop):
+    with db_actions.get_db_connection() as conn:
+        if not conn: raise RuntimeError("database unavailable")
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT content FROM {config.DB_SCHEMA}.manual_chunks WHERE id = %s", (chunk_id,))
+            row = cur.fetchone()
+    if row is None or not (row[0] or '').strip():
+        _finish_item(job['id'], chunk_id, 'skipped', error='chunk deleted or empty')
+        return
+    content = row[0]
+    while not stop.is_set():
+        limiter.wait(stop)
+        try:
+            formatted, warnings = ai_format.format_document(content)
+            break
+        except ai_format.AIBusy:
+            # หน้าเว็บกำลังใช้ AI เต็มจำนวน ให้ผู้ใช้จริงก่อนแล้วค่อยลองใหม่
+            stop.wait(config.AI_QUEUE_TIMEOUT)
+        except Exception as e:
+            print(f"[ERROR] Format job {job['id']} chunk {chunk_id} failed: {e}")
+            _finish_item(job['id'], chunk_id, 'failed', error=str(e)[:500], failed=True)
+            return
+    else:
+        return
+    if formatted.strip() == content.strip():
+        _finish_item(job['id'], chunk_id, 'skipped', error='no change')
+        return
+    status = 'applied' if job['mode'] == 'apply' else 'drafted'
+    _finish_item(job['id'], chunk_id, status, source_content=content, draft=formatted, warnings=warnings)
+
+def _run_job(job):
+    # ทำรายการที่ยัง pending ทีละรอบ (รอบถัดไปคือรายการที่ล้มเหลวแต่ยังลองใหม่ได้) โดยมีรายการทำงานพร้อมกันไม่เกิน concurrency
+    _state['job_id'] = job['id']
+    stop = threading.Event()
+    limiter = _RateLimiter(job['rate_per_minute'])
+    concurrency = max(1, min(job['concurrency'], config.AI_MAX_CONCURRENT))
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"format-job-{job['id']}")
+    in_flight = set()
+    last_beat = time.monotonic()
+    try:
+        after, queue = 0, []
+        while True:
+            if not queue and len(in_flight) < concurrency:
+                queue = _next_items(job['id'], after, concurrency * 4)
+                if not queue and not in_flight:
+                    if after == 0:
+                        break
+                    after = 0   # จบรอบแล้ว เริ่มรอบใหม่สำหรับรายการที่ต้องลองใหม่
+                    continue
+            while queue and len(in_flight) < concurrency:
+                chunk_id = queue.pop(0)
+                after = chunk_id
+                in_flight.add(pool.submit(_process_item, job, chunk_id, limiter, stop))
+            done, in_flight = wait(in_flight, timeout=config.FORMAT_JOB_HEARTBEAT, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    # เช่น ฐานข้อมูลหลุด: หยุดงานไว้ตรงนี้ งานยังเป็น running แต่ heartbeat จะขาด แล้วถูกรับไปทำต่อภายหลัง
+                    raise future.exception()
+            if time.monotonic() - last_beat >= config.FORMAT_JOB_HEARTBEAT:
+                last_beat = time.monotonic()
+                if not _heartbeat(job['id']):
+                    # ถูกหยุด/ยกเลิกจากหน้าเว็บ รายการที่ยังไม่เสร็จจะยังเป็น pending ทำต่อได้ภายหลัง
+                    stop.set()
+                    return
+        with db_actions.transaction() as conn:
+            if not conn: return
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    UPDATE {config.DB_SCHEMA}.format_jobs SET status = 'done', finished_at = now()
+                    WHERE id = %s AND status = 'running' AND owner = %s
+                """, (job['id'], _owner()))
+    finally:
+        stop.set()
+        pool.shutdown(wait=True)
+        _state['job_id'] = None
+
+def run_once():
+    # รับงานหนึ่งงานแล้วทำจนจบ คืนค่า id ของงาน หรือ None ถ้าไม่มีงานรอ
+    job = _claim()
+    if job is None:
+        return None
+    _run_job(job)
+    return job['id']
+
+def _work_forever():
+    while True:
+        try:
+            if run_once() is not None:
+                continue
+        except Exception as e:
+            print(f"[ERROR] Format job runner: {e}")
+            _state['last_error'] = str(e)
+        time.sleep(config.FORMAT_JOB_POLL)
+
+def start():
+    # เริ่ม thread รับงานของ process นี้ (เรียกซ้ำได้ หลัง fork จะเริ่มใหม่ใน process ลูก)
+    if not config.FORMAT_JOBS_ENABLED or _state['pid'] == os.getpid():
+        return
+    with _start_lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        thread = threading.Thread(target=_work_forever, name='format-jobs', daemon=True)
+        thread.start()
+        _state['thread'] = thread
+
+def stats():
+    return {k: v for k, v in _state.items() if k != 'thread'}
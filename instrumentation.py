@@ -0,0 +1,180 @@
+import re
+import threading
+import time
+import psycopg2.extensions
+import config
+
+# จับเวลาการทำงานของ SQL ทุกคำสั่ง (ใช้เป็น cursor_factory ของทุก connection ใน pool จึงครอบทั้ง db_actions และ app.py)
+# - นับจำนวน query, เวลารวม และจำนวนแถวของแต่ละ request แล้วส่งกลับใน header Server-Timing (ดูได้ใน DevTools > Network > Timing)
+# - query ที่ช้ากว่า SLOW_QUERY_MS จะถูก log พร้อมรูปแบบ SQL ที่ตัดค่าคงที่ออกแล้ว (query หน้าตาเดียวกันจะ log เหมือนกัน)
+# - เก็บ histogram ของเวลาตอบกลับและเวลาใน DB แยกตาม route ของแต่ละ worker ดูได้ที่ /api/request-stats
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_local = threading.local()
+_routes = {}
+_routes_lock = threading.Lock()
+# รวมทุก query ของ worker (รวมที่ไม่ได้อยู่ใน request เช่น background job)
+_totals = {'queries': 0, 'seconds': 0.0, 'slow': 0}
+
+
+class Histogram:
+    # histogram แบบสะสมสำหรับ export (ช่องสุดท้ายคือค่าที่เกิน bound ตัวสุดท้าย)
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+
+    def snapshot(self):
+        with self.lock:
+            return {'bounds': list(self.bounds), 'counts': list(self.counts), 'count': sum(self.counts), 'sum': self.total}
+
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s")
+_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query):
+    # รูปแบบของ SQL: ยุบช่องว่าง แทนค่าคงที่/placeholder ด้วย ? และรายการ (?, ?, ...) ด้วย (...)
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    shape = _LIST.sub('(...)', _LITERAL.sub('?', _SPACE.sub(' ', str(query)).strip()))
+    return shape if len(shape) <= 500 else shape[:500] + ' ...'
+
+
+# ส่วนเก็บสถิติของ request ปัจจุบัน
+def begin():
+    _local.stats = {'started': time.perf_counter(), 'queries': 0, 'db_ms': 0.0, 'rows': 0, 'slow': 0}
+
+def current():
+    return getattr(_local, 'stats', None)
+
+def _record(query, elapsed, rows, fetch=False):
+    # fetch=True คือการดึงแถวจาก server-side cursor (นับเวลาและแถว แต่ไม่นับเป็น query ใหม่)
+    ms = elapsed * 1000
+    slow = ms >= config.SLOW_QUERY_MS
+    with _routes_lock:
+        _totals['queries'] += not fetch
+        _totals['seconds'] += elapsed
+        _totals['slow'] += slow
+    stats = current()
+    if stats is not None:
+        stats['queries'] += not fetch
+        stats['db_ms'] += ms
+        stats['slow'] += slow
+        if rows is not None and rows > 0:
+            stats['rows'] += rows
+    if slow:
+        kind = 'fetch ' if fetch else ''
+        print(f"[SLOW SQL] {kind}{ms:.1f}ms rows={rows if rows is not None else '-'} {normalize_sql(query)}")
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    # cursor ที่จับเวลาทุก execute / executemany / copy_expert
+    # server-side cursor (มีชื่อ) ตอน execute แค่ DECLARE งานจริงอยู่ตอน fetch จึงจับเวลา fetch* ด้วย
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record(query, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record(query, time.perf_counter() - started, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _record(sql, time.perf_counter() - started, self.rowcount)
+
+    def _timed_fetch(self, started, rows, count):
+        if self.name:
+            _record(self.query, time.perf_counter() - started, count, fetch=True)
+        return rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        return self._timed_fetch(started, row, 0 if row is None else 1)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        return self._timed_fetch(started, rows, len(rows))
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        return self._timed_fetch(started, rows, len(rows))
+
+
+def server_timing():
+    # ค่า header Server-Timing ของ request ปัจจุบัน (None ถ้าไม่ได้เรียก begin)
+    stats = current()
+    if stats is None:
+        return None
+    total_ms = (time.perf_counter() - stats['started']) * 1000
+    return (f'db;dur={stats["db_ms"]:.1f};desc="{stats["queries"]} queries, {stats["rows"]} rows", '
+            f'app;dur={max(total_ms - stats["db_ms"], 0):.1f}, total;dur={total_ms:.1f}')
+
+def finish(endpoint, method):
+    # จบ request: รวมสถิติเข้า histogram ของ route นั้น (แยกตามชื่อ endpoint ของ Flask และ HTTP method)
+    stats = current()
+    if stats is None:
+        return
+    _local.stats = None
+    total_ms = (time.perf_counter() - stats['started']) * 1000
+    with _routes_lock:
+        entry = _routes.get((endpoint, method))
+        if entry is None:
+            entry = _routes[(endpoint, method)] = {'queries': 0, 'rows': 0, 'slow_queries': 0, 'max_ms': 0.0,
+                                                   'duration': Histogram(), 'db': Histogram()}
+        entry['queries'] += stats['queries']
+        entry['rows'] += stats['rows']
+        entry['slow_queries'] += stats['slow']
+        entry['max_ms'] = max(entry['max_ms'], total_ms)
+    entry['duration'].observe(total_ms)
+    entry['db'].observe(stats['db_ms'])
+
+def query_totals():
+    with _routes_lock:
+        return dict(_totals)
+
+def route_histograms():
+    # [(endpoint, method, entry)] โดย duration/db เป็น snapshot ของ Histogram (มิลลิวินาที)
+    with _routes_lock:
+        items = list(_routes.items())
+    return [(endpoint, method, dict(entry, duration=entry['duration'].snapshot(), db=entry['db'].snapshot()))
+            for (endpoint, method), entry in items]
+
+def route_stats():
+    # สรุปต่อ route พร้อมค่าเฉลี่ย (ช่องสุดท้ายของ buckets คือเกิน BUCKETS_MS ตัวสุดท้าย)
+    routes = {}
+    for endpoint, method, entry in route_histograms():
+        count = entry['duration']['count']
+        routes[f"{method} {endpoint}"] = {
+            'count': count, 'total_ms': entry['duration']['sum'], 'db_ms': entry['db']['sum'],
+            'queries': entry['queries'], 'rows': entry['rows'], 'slow_queries': entry['slow_queries'], 'max_ms': entry['max_ms'],
+            'duration_buckets': entry['duration']['counts'], 'db_buckets': entry['db']['counts'],
+            'avg_ms': round(entry['duration']['sum'] / count, 2), 'avg_db_ms': round(entry['db']['sum'] / count, 2),
+            'avg_queries': round(entry['queries'] / count, 2),
+        }
+    return {'buckets_ms': list(BUCKETS_MS), 'routes': routes, 'totals': query_totals()}
@@ -0,0 +1,131 @@
+import config
+import db_pool
+
+# Change journal: บันทึก (ตาราง, primary key, การกระทำ, version) ของทุกการแก้ไขลง change_journal (migrations/004)
+# บอทจำ version ล่าสุดที่ประมวลผลแล้ว (watermark) แล้วขอเฉพาะรายการที่ใหม่กว่าผ่าน /api/changes?since=
+# ผู้เขียนบันทึกรายการโดยยังไม่มี version (ไม่ต้องรอกัน) ผู้อ่านเรียก sequence() ให้ version กับรายการที่ commit แล้ว
+# ภายใต้ advisory lock ที่มีแค่ผู้อ่านใช้ (migrations/009) รายการที่ commit ทีหลังจึงได้ version มากกว่าเสมอ
+# (ไม่มีกรณีที่ version น้อยกว่าโผล่มาทีหลังจนผู้อ่านข้ามไป)
+
+_LOCK_KEY = 7240311   # advisory lock ของการให้ version (ผู้อ่าน / compact เท่านั้น)
+
+OPS = {'INSERT': 'I', 'UPDATE': 'U', 'DELETE': 'D'}
+
+# แก้ชื่อในตารางแม่แล้ว เนื้อหาที่บอทใช้ของตารางลูกเปลี่ยนด้วย (ชื่อหมวดหมู่/เอกสาร/กองทุนที่ JOIN มา) จึงบันทึกแถวลูกไปด้วย
+_DEPENDENTS = {
+    'categories': [('manual_chunks', 'id', "category_id = ANY(%s)"), ('support_stories', 'id', "category_id = ANY(%s)")],
+    'documents': [('manual_chunks', 'id', "doc_id = ANY(%s)")],
+    'research_funds': [('manual_chunks', 'id', "fund_abbr IN (SELECT fund_abbr FROM {schema}.research_funds WHERE fund_id = ANY(%s))")],
+}
+
+def is_enabled(cur):
+    return db_pool.table_exists(cur, 'change_journal')
+
+def sequence(cur):
+    # ให้ version กับรายการที่ commit แล้วแต่ยังไม่มี version เรียงตามลำดับการเขียน
+    # lock ถูกถือจนจบ transaction ของผู้อ่าน ผู้อ่านคนถัดไปจึงเห็น version ชุดนี้ commit แล้วก่อนให้ version ชุดใหม่
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+    cur.execute(f"""
+        WITH pending AS (
+            SELECT id, nextval('{config.DB_SCHEMA}.change_journal_version_seq') AS version
+            FROM (SELECT id FROM {config.DB_SCHEMA}.change_journal WHERE version IS NULL ORDER BY id) p
+        )
+        UPDATE {config.DB_SCHEMA}.change_journal j SET version = pending.version
+        FROM pending WHERE j.id = pending.id
+    """)
+    return cur.rowcount
+
+def record(cur, table_name, ids, op):
+    # บันทึกแถวที่เปลี่ยน (เรียกใน transaction เดียวกับการแก้ไข)
+    if not ids or not is_enabled(cur):
+        return
+    cur.execute(f"""
+        INSERT INTO {config.DB_SCHEMA}.change_journal (table_name, row_pk, op)
+        SELECT %s, pk::text, %s FROM unnest(%s) AS pk
+    """, (table_name, op, list(ids)))
+    if op == 'U':
+        for child, pk, condition in _DEPENDENTS.get(table_name, []):
+            cur.execute(f"""
+                INSERT INTO {config.DB_SCHEMA}.change_journal (table_name, row_pk, op)
+                SELECT %s, {pk}::text, 'U' FROM {config.DB_SCHEMA}.{child}
+                WHERE {condition.format(schema=config.DB_SCHEMA)}
+            """, (child, list(ids)))
+
+def execute_logged(cur, table_name, op, dml_sql, params, pk, returning=False):
+    # รัน INSERT/UPDATE/DELETE (ยังไม่มี RETURNING) แล้วบันทึกทุกแถวที่โดนลง journal ใน statement เดียว
+    # ใช้กับงานที่แก้ทีละมากๆ เช่น bulk import จะได้ไม่ต้องดึง id ทั้งหมดกลับมาที่ Python คืนค่าจำนวนแถวที่เปลี่ยน
+    # returning=True คืนค่า list ของ pk ที่เปลี่ยนแทน (ใช้เมื่อต้องทำอะไรต่อกับแถวเหล่านั้น เช่นสร้าง index ค้นหา)
+    if not is_enabled(cur):
+        cur.execute(f"{dml_sql} RETURNING {pk}" if returning else dml_sql, params)
+        return [row[0] for row in cur.fetchall()] if returning else cur.rowcount
+    if returning:
+        cur.execute(f"""
+            WITH changed AS ({dml_sql} RETURNING {pk}),
+                 logged AS (INSERT INTO {config.DB_SCHEMA}.change_journal (table_name, row_pk, op)
+                            SELECT %s, {pk}::text, %s FROM changed)
+            SELECT {pk} FROM changed
+        """, tuple(params) + (table_name, op))
+        return [row[0] for row in cur.fetchall()]
+    cur.execute(f"""
+        WITH changed AS ({dml_sql} RETURNING {pk})
+        INSERT INTO {config.DB_SCHEMA}.change_journal (table_name, row_pk, op)
+        SELECT %s, {pk}::text, %s FROM changed
+    """, tuple(params) + (table_name, op))
+    return cur.rowcount
+
+def get_changes(cur, since=0, limit=500):
+    # คืนค่า dict ของ delta ที่ version มากกว่า since (สูงสุด limit รายการ) หรือ None ถ้ายังไม่ได้รัน migration
+    # ถ้า since เก่ากว่ารายการที่ถูก compact ทิ้งไปแล้วจะได้ resync_required = True (ต้อง sync ใหม่ทั้งหมด)
+    # ต้องเรียกใน transaction ที่ commit (version ที่ให้ใน sequence จะได้คงอยู่)
+    if not is_enabled(cur):
+        return None
+    sequence(cur)
+    cur.execute(f"""
+        SELECT s.floor_version, (SELECT COALESCE(MAX(version), s.floor_version) FROM {config.DB_SCHEMA}.change_journal)
+        FROM {config.DB_SCHEMA}.change_journal_state s
+    """)
+    floor_version, current = cur.fetchone() or (0, 0)
+    result = {'since': since, 'current': current, 'floor': floor_version, 'changes': [],
+              'next': since, 'has_more': False, 'resync_required': since < floor_version}
+    if result['resync_required']:
+        result['next'] = current
+        return result
+    cur.execute(f"""
+        SELECT version, table_name, row_pk, op, changed_at FROM {config.DB_SCHEMA}.change_journal
+        WHERE version > %s ORDER BY version LIMIT %s
+    """, (since, limit + 1))
+    rows = cur.fetchall()
+    result['has_more'] = len(rows) > limit
+    for version, table_name, row_pk, op, changed_at in rows[:limit]:
+        result['changes'].append({'version': version, 'table': table_name, 'pk': row_pk, 'op': op,
+                                  'changed_at': changed_at.isoformat() if changed_at else None})
+    if result['changes']:
+        result['next'] = result['changes'][-1]['version']
+    return result
+
+def compact(cur, max_age_days=30):
+    # 1) ลบรายการที่มีรายการใหม่กว่าของแถวเดียวกันแล้ว (ผู้ที่ยังไม่ได้อ่านจะเจอรายการล่าสุดอยู่ดี)
+    # 2) ลบรายการที่เก่ากว่า max_age_days แล้วเลื่อน floor_version ขึ้น ผู้อ่านที่ค้างอยู่ก่อนหน้านั้นต้อง sync ใหม่ทั้งหมด
+    # คืนค่า (จำนวนที่ลบเพราะซ้ำ, จำนวนที่ลบเพราะเก่า, floor_version ใหม่)
+    sequence(cur)
+    cur.execute(f"""
+        DELETE FROM {config.DB_SCHEMA}.change_journal a
+        USING {config.DB_SCHEMA}.change_journal b
+        WHERE a.table_name = b.table_name AND a.row_pk = b.row_pk AND a.version < b.version
+    """)
+    superseded = cur.rowcount
+    cur.execute(f"""
+        WITH gone AS (
+            DELETE FROM {config.DB_SCHEMA}.change_journal
+            WHERE changed_at < now() - make_interval(days => %s)
+            RETURNING version
+        )
+        SELECT COUNT(*), COALESCE(MAX(version), 0) FROM gone
+    """, (max_age_days,))
+    expired, max_expired = cur.fetchone()
+    cur.execute(f"""
+        UPDATE {config.DB_SCHEMA}.change_journal_state
+        SET floor_version = GREATEST(floor_version, %s), compacted_at = now()
+        RETURNING floor_version
+    """, (max_expired,))
+    return superseded, expired, cur.fetchone()[0]
@@ -0,0 +1,169 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import config
+import db_actions
+import search
+import bulk_io
+import snapshot
+import ai_format
+import format_jobs
+
+# คำสั่งดูแลระบบที่รันจาก command line เช่น
+#   python manage.py migrate
+#   python manage.py rebuild-search --table manual_chunks
+#   python manage.py reconcile-counters
+#   python manage.py compact-journal --max-age-days 30
+#   python manage.py build-snapshot
+#   python manage.py prune-ai-cache
+#   python manage.py run-format-jobs
+#   python manage.py import manual_chunks chunks.csv
+#   python manage.py export manual_chunks -o chunks.csv.gz --gzip
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+def migrate(args):
+    # รันไฟล์ .sql ใน migrations/ ตามลำดับชื่อ ไฟล์ที่เคยรันแล้วจะถูกข้าม ({schema} จะถูกแทนด้วย DB_SCHEMA)
+    with db_actions.transaction() as conn:
+        if not conn: sys.exit("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {config.DB_SCHEMA}.schema_migrations (
+                    filename TEXT PRIMARY KEY,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            cur.execute(f"SELECT filename FROM {config.DB_SCHEMA}.schema_migrations")
+            applied = {row[0] for row in cur.fetchall()}
+
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql'))):
+        filename = os.path.basename(path)
+        if filename in applied:
+            continue
+        with open(path, encoding='utf-8') as f:
+            sql = f.read().replace('{schema}', config.DB_SCHEMA)
+        with db_actions.transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute(f"INSERT INTO {config.DB_SCHEMA}.schema_migrations (filename) VALUES (%s)", (filename,))
+        print(f"[MIGRATE] applied {filename}")
+
+def rebuild_search(args):
+    # สร้าง search_vector ใหม่ (ทีละตาราง แต่ละตาราง commit ครั้งเดียว)
+    tables = [args.table] if args.table else ['manual_chunks', 'support_stories', 'glossary_terms']
+    for table in tables:
+        with db_actions.transaction() as conn:
+            if not conn: sys.exit("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+            count = search.rebuild(conn, table, only_missing=args.missing_only)
+        print(f"[SEARCH] {table}: {count} rows indexed")
+
+def reconcile_counters(args):
+    # แก้ตัวนับจำนวนแถวของ Dashboard ให้ตรงกับข้อมูลจริง (ตั้ง cron ให้รันเป็นระยะได้)
+    results = db_actions.reconcile_entity_counters()
+    if not results: sys.exit("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+    for table, previous, actual in results:
+        status = "ok" if previous == actual else f"fixed (was {previous})"
+        print(f"[COUNTERS] {table}: {actual} {status}")
+
+def compact_journal(args):
+    # ลบรายการ change journal ที่ถูกแทนที่แล้ว และรายการที่เก่ากว่ากำหนด
+    result = db_actions.compact_change_journal(args.max_age_days)
+    if result is None: sys.exit("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+    superseded, expired, floor_version = result
+    print(f"[JOURNAL] removed {superseded} superseded, {expired} expired; floor version {floor_version}")
+
+def build_snapshot(args):
+    # สร้างไฟล์ snapshot ของฐานความรู้ใหม่ทันที
+    info = snapshot.build()
+    print(f"[SNAPSHOT] {info['file']} ({info['size']} bytes) version {info['journal_version']} counts {info['counts']}")
+
+def prune_ai_cache(args):
+    # ลบผลการจัดรูปแบบด้วย AI ที่หมดอายุออกจาก ai_format_cache
+    removed = ai_format.prune()
+    if removed is None: sys.exit("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+    print(f"[AI CACHE] removed {removed} expired entries")
+
+def run_format_jobs(args):
+    # ทำงานจัดรูปแบบที่รออยู่ใน foreground (ใช้แทน/เสริม thread ใน worker ของเว็บ ตั้ง FORMAT_JOBS_ENABLED=false ที่เว็บได้)
+    while True:
+        job_id = format_jobs.run_once()
+        if job_id is not None:
+            print(f"[FORMAT JOB] job {job_id} stopped or finished")
+            continue
+        if not args.watch:
+            break
+        time.sleep(config.FORMAT_JOB_POLL)
+
+def import_data(args):
+    # นำเข้าไฟล์ CSV/JSONL ทั้งไฟล์ใน transaction เดียว แสดงความคืบหน้าทุก batch
+    fmt = args.format or bulk_io.detect_format(args.file)
+    def show(progress):
+        print(f"[IMPORT] read {progress['read']} staged {progress['staged']} errors {progress['error_count']}", file=sys.stderr)
+    try:
+        with open(args.file, encoding='utf-8-sig', newline='') as f:
+            result = bulk_io.import_file(args.table, f, fmt, batch_size=args.batch_size, on_progress=show)
+    except bulk_io.BulkImportError as e:
+        sys.exit(str(e))
+    for error in result['errors']:
+        print(f"[IMPORT] row {error['row']}: {error['error']}", file=sys.stderr)
+    print(f"[IMPORT] {args.table}: {result['inserted']} inserted, {result['updated']} updated, {result['error_count']} rejected")
+
+def export_data(args):
+    # ส่งออกทั้งตารางลงไฟล์ (หรือ stdout) อ่านทีละชุดจาก server-side cursor
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in bulk_io.iter_export(args.table, args.format, args.gzip, fetch_size=args.fetch_size):
+            out.write(chunk)
+    except bulk_io.BulkImportError as e:
+        sys.exit(str(e))
+    finally:
+        if args.output:
+            out.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KB Admin maintenance commands")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('migrate', help="apply pending SQL migrations").set_defaults(func=migrate)
+
+    p = sub.add_parser('rebuild-search', help="rebuild search_vector for full-text search")
+    p.add_argument('--table', choices=['manual_chunks', 'support_stories', 'glossary_terms'])
+    p.add_argument('--missing-only', action='store_true', help="only rows without search_vector")
+    p.set_defaults(func=rebuild_search)
+
+    sub.add_parser('reconcile-counters', help="recount rows and repair dashboard counters").set_defaults(func=reconcile_counters)
+
+    p = sub.add_parser('compact-journal', help="drop superseded and old change journal entries")
+    p.add_argument('--max-age-days', type=int, default=30)
+    p.set_defaults(func=compact_journal)
+
+    sub.add_parser('build-snapshot', help="rebuild the SQLite knowledge snapshot").set_defaults(func=build_snapshot)
+
+    sub.add_parser('prune-ai-cache', help="delete expired AI formatting results").set_defaults(func=prune_ai_cache)
+
+    p = sub.add_parser('run-format-jobs', help="process queued AI formatting jobs")
+    p.add_argument('--watch', action='store_true', help="keep polling for new jobs")
+    p.set_defaults(func=run_format_jobs)
+
+    p = sub.add_parser('import', help="bulk import a CSV/JSONL file (rows with an id update, others insert)")
+    p.add_argument('table', choices=sorted(bulk_io.IMPORT_TARGETS))
+    p.add_argument('file')
+    p.add_argument('--format', choices=['csv', 'jsonl'], help="default: from file extension")
+    p.add_argument('--batch-size', type=int, default=1000)
+    p.set_defaults(func=import_data)
+
+    p = sub.add_parser('export', help="export a table as CSV/JSONL (optionally gzip)")
+    p.add_argument('table', choices=sorted(bulk_io.EXPORT_TABLES))
+    p.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    p.add_argument('--gzip', action='store_true')
+    p.add_argument('-o', '--output', help="default: stdout")
+    p.add_argument('--fetch-size', type=int, default=2000)
+    p.set_defaults(func=export_data)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
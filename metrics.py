@@ -0,0 +1,134 @@
+import os
+import ai_format
+import cache
+import cache_sync
+import config
+import db_actions
+import format_jobs
+import instrumentation
+
+# /metrics ในรูปแบบ Prometheus text exposition (version 0.0.4)
+# ค่าทั้งหมดเป็นของ worker (process) ที่รับ request นี้ ทุก series จึงมี label pid
+# Prometheus ที่ scrape ผ่าน gunicorn จะได้ worker สลับกันไป ให้รวมด้วย sum without (pid) (...) เวลา query
+
+PREFIX = 'kb_admin_'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Writer:
+    # รวมบรรทัดของแต่ละ metric ไว้ด้วยกัน (รูปแบบ Prometheus กำหนดให้ sample ของชื่อเดียวกันต้องอยู่ติดกัน)
+    def __init__(self, base_labels):
+        self.base_labels = base_labels
+        self.families = {}
+
+    def _family(self, name, kind, help_text):
+        if name not in self.families:
+            self.families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        return self.families[name]
+
+    def sample(self, name, kind, help_text, value, **labels):
+        name = PREFIX + name
+        self._family(name, kind, help_text).append(f"{name}{_labels(dict(self.base_labels, **labels))} {_number(value)}")
+
+    def histogram(self, name, help_text, snapshot, scale=1.0, **labels):
+        # snapshot จาก instrumentation.Histogram (ช่องละจำนวน ไม่สะสม) แปลงเป็น bucket แบบสะสมตามรูปแบบ Prometheus
+        name = PREFIX + name
+        lines = self._family(name, 'histogram', help_text)
+        labels = dict(self.base_labels, **labels)
+        running = 0
+        for bound, count in zip(snapshot['bounds'], snapshot['counts']):
+            running += count
+            lines.append(f"{name}_bucket{_labels(dict(labels, le=_number(bound * scale)))} {running}")
+        lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {snapshot['count']}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(snapshot['sum'] * scale)}")
+        lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+
+    def text(self):
+        return '\n'.join(line for lines in self.families.values() for line in lines) + '\n'
+
+
+def _requests(w):
+    for endpoint, method, entry in sorted(instrumentation.route_histograms(), key=lambda r: (r[0], r[1])):
+        labels = {'endpoint': endpoint, 'method': method}
+        w.histogram('http_request_duration_seconds', "Request latency by Flask endpoint.", entry['duration'], 0.001, **labels)
+        w.histogram('http_request_db_seconds', "Time spent in SQL per request.", entry['db'], 0.001, **labels)
+        w.sample('http_request_queries_total', 'counter', "SQL statements executed by requests.", entry['queries'], **labels)
+        w.sample('http_request_slow_queries_total', 'counter', "Slow SQL statements executed by requests.", entry['slow_queries'], **labels)
+
+def _database(w):
+    totals = instrumentation.query_totals()
+    w.sample('db_queries_total', 'counter', "SQL statements executed (including background work).", totals['queries'])
+    w.sample('db_query_seconds_total', 'counter', "Total time spent executing SQL.", totals['seconds'])
+    w.sample('db_slow_queries_total', 'counter', "SQL statements slower than SLOW_QUERY_MS.", totals['slow'])
+    pool = db_actions.get_pool_stats()
+    for key, help_text in (('open', "Open pooled connections."), ('idle', "Idle pooled connections."),
+                           ('in_use', "Pooled connections checked out."), ('max', "Pool size limit.")):
+        w.sample(f'db_pool_{key}', 'gauge', help_text, pool[key])
+    for key, help_text in (('checkouts', "Connections handed out."), ('waits', "Checkouts that had to wait."),
+                           ('timeouts', "Checkouts that timed out."), ('created', "Connections opened."),
+                           ('recycled', "Connections recycled."), ('failed_checks', "Failed health checks.")):
+        w.sample(f'db_pool_{key}_total', 'counter', help_text, pool[key])
+    w.sample('db_pool_wait_seconds_total', 'counter', "Time spent waiting for a pooled connection.", pool['wait_time_total'])
+    for replica in pool.get('replicas', []):
+        name = replica['name']
+        w.sample('db_replica_up', 'gauge', "1 while the read replica is reachable.", 0 if replica['down'] else 1, replica=name)
+        if replica['lag'] is not None:
+            w.sample('db_replica_lag_seconds', 'gauge', "Replication lag at the last check.", replica['lag'], replica=name)
+        w.sample('db_replica_reads_total', 'counter', "Read queries served by the replica.", replica['reads'], replica=name)
+
+def _ai(w):
+    stats = ai_format.upstream_stats()
+    w.sample('ai_requests_total', 'counter', "Calls made to the AI API.", stats['calls'])
+    w.sample('ai_errors_total', 'counter', "AI API calls that failed.", stats['errors'])
+    w.sample('ai_busy_total', 'counter', "Requests rejected because AI_MAX_CONCURRENT was reached.", stats['busy'])
+    for mode, snapshot in sorted(stats['latency'].items()):
+        w.histogram('ai_request_duration_seconds', "AI API call latency.", snapshot, 0.001, mode=mode)
+    results = ai_format.cache_stats()
+    for key, result in (('memory_hits', 'memory_hit'), ('db_hits', 'db_hit'), ('misses', 'miss'), ('coalesced', 'coalesced')):
+        w.sample('ai_format_cache_total', 'counter', "AI formatting lookups by outcome.", results[key], result=result)
+
+def _caches(w):
+    stats = cache.all_stats()
+    w.sample('cache_bypass', 'gauge', "1 while table-versioned caches are bypassed (change listener disconnected).",
+             stats['bypass'])
+    if config.CACHE_NOTIFY_ENABLED:
+        w.sample('cache_listener_down_seconds', 'gauge', "Seconds the change listener has been disconnected (0 = listening).",
+                 cache_sync.stats()['down_seconds'])
+    for name, data in sorted(stats['caches'].items()):
+        w.sample('cache_hits_total', 'counter', "Cache hits.", data['hits'], cache=name)
+        w.sample('cache_misses_total', 'counter', "Cache misses.", data['misses'], cache=name)
+        w.sample('cache_evictions_total', 'counter', "Entries evicted because the cache was full.", data['evictions'], cache=name)
+        w.sample('cache_hit_ratio', 'gauge', "Hits / (hits + misses) since start.", data['hit_rate'], cache=name)
+        w.sample('cache_entries', 'gauge', "Entries currently cached.", data['size'], cache=name)
+
+def _state(w):
+    pending = db_actions.get_bot_sync_pending()
+    if pending is not None:
+        w.sample('bot_sync_pending', 'gauge', "1 when the knowledge base changed since the bot last synced.", pending)
+    worker = format_jobs.stats()
+    w.sample('format_job_running', 'gauge', "1 while this worker is processing a format job.", worker['job_id'] is not None)
+
+def render():
+    w = _Writer({'pid': os.getpid()})
+    for section in (_requests, _database, _ai, _caches, _state):
+        try:
+            section(w)
+        except Exception as e:
+            # ส่วนใดพัง (เช่น DB หลุด) ยังส่งส่วนอื่นได้
+            print(f"[ERROR] metrics {section.__name__} failed: {e}")
+    return w.text()
@@ -0,0 +1,23 @@
+-- ระบบค้นหา: คอลัมน์ search_vector (tsvector ที่ตัดคำไทยจากฝั่ง Python ดู search.py) + GIN index
+-- และ trigram index สำหรับ ILIKE ที่ยังใช้เป็นทางสำรอง (คำค้นสั้นเกินไป / ตารางที่ไม่มี search_vector)
+-- หลังรันไฟล์นี้ให้รัน `python manage.py rebuild-search` เพื่อสร้าง search_vector ของข้อมูลเดิม
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE {schema}.manual_chunks ADD COLUMN IF NOT EXISTS search_vector tsvector;
+ALTER TABLE {schema}.support_stories ADD COLUMN IF NOT EXISTS search_vector tsvector;
+ALTER TABLE {schema}.glossary_terms ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE INDEX IF NOT EXISTS manual_chunks_search_idx ON {schema}.manual_chunks USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS support_stories_search_idx ON {schema}.support_stories USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS glossary_terms_search_idx ON {schema}.glossary_terms USING gin (search_vector);
+
+CREATE INDEX IF NOT EXISTS manual_chunks_topic_trgm_idx ON {schema}.manual_chunks USING gin (topic gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS manual_chunks_content_trgm_idx ON {schema}.manual_chunks USING gin (content gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS support_stories_scenario_trgm_idx ON {schema}.support_stories USING gin (scenario gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS support_stories_solution_trgm_idx ON {schema}.support_stories USING gin (solution gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS glossary_terms_word_trgm_idx ON {schema}.glossary_terms USING gin (word gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS glossary_terms_meaning_trgm_idx ON {schema}.glossary_terms USING gin (meaning gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS categories_name_trgm_idx ON {schema}.categories USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS documents_title_trgm_idx ON {schema}.documents USING gin (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS research_funds_name_trgm_idx ON {schema}.research_funds USING gin (fund_name_th gin_trgm_ops);
@@ -0,0 +1,44 @@
+-- ตารางสรุป session แชท (1 แถวต่อ session) ให้หน้า Dashboard ดึง 50 session ล่าสุดได้โดยไม่ต้องอ่าน chat_logs ทั้งหมด
+-- อัปเดตอัตโนมัติด้วย trigger ทุกครั้งที่บอทเขียน/ลบ chat_logs (session_id ที่เป็น NULL เก็บเป็น '')
+-- trigger ในไฟล์นี้ถูกแทนที่ด้วย 008_chat_sessions_updates.sql (รองรับ UPDATE และหาเวลาล่าสุดใหม่เมื่อลบข้อความ)
+
+CREATE TABLE IF NOT EXISTS {schema}.chat_sessions (
+    session_id TEXT PRIMARY KEY,
+    last_updated TIMESTAMPTZ NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS chat_sessions_last_updated_idx ON {schema}.chat_sessions (last_updated DESC, session_id DESC);
+CREATE INDEX IF NOT EXISTS chat_logs_session_created_idx ON {schema}.chat_logs (session_id, created_at DESC);
+
+CREATE OR REPLACE FUNCTION {schema}.chat_sessions_track() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO {schema}.chat_sessions (session_id, last_updated, message_count)
+        VALUES (COALESCE(NEW.session_id::text, ''), COALESCE(NEW.created_at, now()), 1)
+        ON CONFLICT (session_id) DO UPDATE
+            SET last_updated = GREATEST({schema}.chat_sessions.last_updated, EXCLUDED.last_updated),
+                message_count = {schema}.chat_sessions.message_count + 1;
+        RETURN NEW;
+    ELSE
+        UPDATE {schema}.chat_sessions SET message_count = message_count - 1
+        WHERE session_id = COALESCE(OLD.session_id::text, '');
+        DELETE FROM {schema}.chat_sessions
+        WHERE session_id = COALESCE(OLD.session_id::text, '') AND message_count <= 0;
+        RETURN OLD;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS chat_sessions_track ON {schema}.chat_logs;
+CREATE TRIGGER chat_sessions_track
+    AFTER INSERT OR DELETE ON {schema}.chat_logs
+    FOR EACH ROW EXECUTE PROCEDURE {schema}.chat_sessions_track();
+
+-- เติมข้อมูลจากประวัติแชทที่มีอยู่แล้ว
+INSERT INTO {schema}.chat_sessions (session_id, last_updated, message_count)
+SELECT COALESCE(session_id::text, ''), MAX(COALESCE(created_at, now())), COUNT(*)
+FROM {schema}.chat_logs
+GROUP BY COALESCE(session_id::text, '')
+ON CONFLICT (session_id) DO UPDATE
+    SET last_updated = EXCLUDED.last_updated, message_count = EXCLUDED.message_count;
@@ -0,0 +1,53 @@
+-- ตัวนับจำนวนแถวของแต่ละตาราง ให้การ์ดตัวเลขบน Dashboard อ่านได้ใน query เดียว แทนการ COUNT(*) ทุกตาราง
+-- อัปเดตด้วย statement trigger (นับจาก transition table จึงรองรับ insert/delete ทีละหลายแถวด้วย)
+-- ถ้าตัวเลขเพี้ยน ให้รัน `python manage.py reconcile-counters` เพื่อนับใหม่จากข้อมูลจริง
+
+CREATE TABLE IF NOT EXISTS {schema}.entity_counters (
+    table_name TEXT PRIMARY KEY,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    reconciled_at TIMESTAMPTZ
+);
+
+CREATE OR REPLACE FUNCTION {schema}.entity_counters_track() RETURNS trigger AS $$
+DECLARE
+    delta BIGINT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE {schema}.entity_counters SET row_count = 0 WHERE table_name = TG_TABLE_NAME;
+        RETURN NULL;
+    ELSIF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*) INTO delta FROM new_rows;
+    ELSE
+        SELECT -COUNT(*) INTO delta FROM old_rows;
+    END IF;
+    IF delta <> 0 THEN
+        INSERT INTO {schema}.entity_counters (table_name, row_count) VALUES (TG_TABLE_NAME, delta)
+        ON CONFLICT (table_name) DO UPDATE SET row_count = {schema}.entity_counters.row_count + EXCLUDED.row_count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['research_funds', 'glossary_terms', 'manual_chunks', 'support_stories', 'documents', 'categories'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS entity_counters_ins ON {schema}.%I', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS entity_counters_del ON {schema}.%I', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS entity_counters_trunc ON {schema}.%I', t);
+        EXECUTE format('CREATE TRIGGER entity_counters_ins AFTER INSERT ON {schema}.%I
+                        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+                        EXECUTE PROCEDURE {schema}.entity_counters_track()', t);
+        EXECUTE format('CREATE TRIGGER entity_counters_del AFTER DELETE ON {schema}.%I
+                        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+                        EXECUTE PROCEDURE {schema}.entity_counters_track()', t);
+        EXECUTE format('CREATE TRIGGER entity_counters_trunc AFTER TRUNCATE ON {schema}.%I
+                        FOR EACH STATEMENT EXECUTE PROCEDURE {schema}.entity_counters_track()', t);
+        EXECUTE format('INSERT INTO {schema}.entity_counters (table_name, row_count, reconciled_at)
+                        SELECT %L, COUNT(*), now() FROM {schema}.%I
+                        ON CONFLICT (table_name) DO UPDATE
+                            SET row_count = EXCLUDED.row_count, reconciled_at = EXCLUDED.reconciled_at', t, t);
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,22 @@
+-- บันทึกการเปลี่ยนแปลงทีละแถว ให้บอทดึงเฉพาะส่วนที่เปลี่ยนผ่าน /api/changes?since=<version> แทนการโหลดใหม่ทั้งหมด
+-- version เรียงตามลำดับ commit (ฝั่งแอปล็อก advisory lock ก่อนเขียน journal ทุกครั้ง) จึงใช้เป็น watermark ได้
+
+CREATE TABLE IF NOT EXISTS {schema}.change_journal (
+    version BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    row_pk TEXT NOT NULL,
+    op CHAR(1) NOT NULL,          -- I = เพิ่ม, U = แก้ไข, D = ลบ
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS change_journal_row_idx ON {schema}.change_journal (table_name, row_pk, version);
+CREATE INDEX IF NOT EXISTS change_journal_changed_at_idx ON {schema}.change_journal (changed_at);
+
+-- version ต่ำสุดที่ยังขอ delta ได้ ถ้า since น้อยกว่านี้ ผู้ใช้ต้อง sync ใหม่ทั้งหมด (เพิ่มขึ้นเมื่อ compact ลบรายการเก่า)
+CREATE TABLE IF NOT EXISTS {schema}.change_journal_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    floor_version BIGINT NOT NULL DEFAULT 0,
+    compacted_at TIMESTAMPTZ
+);
+
+INSERT INTO {schema}.change_journal_state (id, floor_version) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,14 @@
+-- cache ผลการจัดรูปแบบด้วย AI (key = sha256 ของข้อความที่ normalize แล้ว + system prompt + model + temperature)
+-- ใช้ร่วมกันทุก worker และอยู่รอดหลัง restart ส่วน cache ในหน่วยความจำของแต่ละ worker อยู่ด้านหน้าอีกชั้น
+
+CREATE TABLE IF NOT EXISTS {schema}.ai_format_cache (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT,
+    formatted_content TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    expires_at TIMESTAMPTZ NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    last_hit_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS ai_format_cache_expires_idx ON {schema}.ai_format_cache (expires_at);
@@ -0,0 +1,32 @@
+-- งานจัดรูปแบบ manual_chunks ด้วย AI ทีละมากๆ แบบ background (format_jobs.py)
+-- รายการ chunk ของงานถูกบันทึกไว้ตั้งแต่สร้างงาน สถานะของแต่ละรายการอยู่ในตาราง จึงทำต่อจากจุดเดิมได้หลัง restart
+
+CREATE TABLE IF NOT EXISTS {schema}.format_jobs (
+    id SERIAL PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'queued',      -- queued, running, paused, done, cancelled
+    mode TEXT NOT NULL DEFAULT 'draft',         -- draft = เก็บผลไว้ให้ตรวจก่อน, apply = บันทึกลง manual_chunks ทันที
+    filters JSONB NOT NULL DEFAULT '{}',
+    concurrency INTEGER NOT NULL DEFAULT 2,
+    rate_per_minute INTEGER NOT NULL DEFAULT 30,
+    total INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,                                 -- host:pid ของ worker ที่กำลังทำงานนี้
+    heartbeat_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS {schema}.format_job_items (
+    job_id INTEGER NOT NULL REFERENCES {schema}.format_jobs (id) ON DELETE CASCADE,
+    chunk_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',     -- pending, drafted, applied, skipped, failed
+    source_content TEXT,                        -- เนื้อหาตอนที่ส่งให้ AI ใช้เช็คว่ามีคนแก้ไขระหว่างรอหรือไม่
+    draft_content TEXT,
+    warnings JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    processed_at TIMESTAMPTZ,
+    PRIMARY KEY (job_id, chunk_id)
+);
+
+CREATE INDEX IF NOT EXISTS format_job_items_status_idx ON {schema}.format_job_items (job_id, status);
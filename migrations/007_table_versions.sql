@@ -0,0 +1,34 @@
+-- เลข version ของข้อมูลแต่ละตาราง เพิ่มขึ้นทุกครั้งที่มีคำสั่งแก้ไขตารางนั้น (ทั้งจากหน้าเว็บ, import และ psql โดยตรง)
+-- ใช้สร้าง ETag ของหน้า list / API: version ไม่เปลี่ยน = ข้อมูลไม่เปลี่ยน ตอบ 304 ได้โดยไม่ต้อง query ข้อมูลจริง
+-- version ถูกเพิ่มใน transaction เดียวกับการแก้ไข ผู้อ่านจึงเห็น version ใหม่พร้อมกับข้อมูลใหม่เสมอ
+-- chat_logs ไม่มี trigger นี้ (บอทเขียนบ่อยมาก) หน้า Dashboard ใช้ข้อมูลใน chat_sessions แทน (db_actions.get_sessions_marker)
+
+CREATE TABLE IF NOT EXISTS {schema}.table_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION {schema}.table_versions_bump() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO {schema}.table_versions (table_name, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = {schema}.table_versions.version + 1, changed_at = now();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['research_funds', 'glossary_terms', 'manual_chunks', 'support_stories', 'documents', 'categories'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS table_versions_bump ON {schema}.%I', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS table_versions_trunc ON {schema}.%I', t);
+        EXECUTE format('CREATE TRIGGER table_versions_bump AFTER INSERT OR UPDATE OR DELETE ON {schema}.%I
+                        FOR EACH STATEMENT EXECUTE PROCEDURE {schema}.table_versions_bump()', t);
+        EXECUTE format('CREATE TRIGGER table_versions_trunc AFTER TRUNCATE ON {schema}.%I
+                        FOR EACH STATEMENT EXECUTE PROCEDURE {schema}.table_versions_bump()', t);
+        EXECUTE format('INSERT INTO {schema}.table_versions (table_name) VALUES (%L) ON CONFLICT (table_name) DO NOTHING', t);
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,70 @@
+-- แก้ trigger ของ chat_sessions (migrations/002) ให้ตรงกับ chat_logs ทุกกรณี
+-- - ลบข้อความล่าสุดของ session: หาเวลาล่าสุดใหม่จาก chat_logs (ใช้ index chat_logs_session_created_idx)
+-- - UPDATE ที่ย้าย session_id หรือเปลี่ยน created_at: นับออกจาก session เดิมแล้วนับเข้า session ใหม่
+-- ท้ายไฟล์สรุปข้อมูลใหม่จาก chat_logs ทั้งหมด เพื่อแก้ค่าที่เพี้ยนไปก่อนหน้านี้
+
+CREATE OR REPLACE FUNCTION {schema}.chat_sessions_add(sid TEXT, added_at TIMESTAMPTZ) RETURNS void AS $$
+BEGIN
+    INSERT INTO {schema}.chat_sessions (session_id, last_updated, message_count)
+    VALUES (sid, added_at, 1)
+    ON CONFLICT (session_id) DO UPDATE
+        SET last_updated = GREATEST({schema}.chat_sessions.last_updated, EXCLUDED.last_updated),
+            message_count = {schema}.chat_sessions.message_count + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION {schema}.chat_sessions_remove(sid TEXT, removed_at TIMESTAMPTZ) RETURNS void AS $$
+DECLARE
+    current_last TIMESTAMPTZ;
+    latest TIMESTAMPTZ;
+BEGIN
+    UPDATE {schema}.chat_sessions SET message_count = message_count - 1
+    WHERE session_id = sid
+    RETURNING last_updated INTO current_last;
+    DELETE FROM {schema}.chat_sessions WHERE session_id = sid AND message_count <= 0;
+
+    -- เวลาล่าสุดเปลี่ยนเฉพาะตอนลบข้อความล่าสุดของ session (trigger แบบ AFTER จึงไม่เห็นแถวที่ลบแล้ว)
+    IF current_last IS NOT NULL AND (removed_at IS NULL OR removed_at >= current_last) THEN
+        IF sid = '' THEN
+            SELECT MAX(created_at) INTO latest FROM {schema}.chat_logs WHERE session_id IS NULL OR session_id::text = '';
+        ELSE
+            SELECT MAX(created_at) INTO latest FROM {schema}.chat_logs WHERE session_id::text = sid;
+        END IF;
+        IF latest IS NOT NULL THEN
+            UPDATE {schema}.chat_sessions SET last_updated = latest WHERE session_id = sid;
+        END IF;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION {schema}.chat_sessions_track() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.session_id IS NOT DISTINCT FROM NEW.session_id
+                        AND OLD.created_at IS NOT DISTINCT FROM NEW.created_at THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM {schema}.chat_sessions_remove(COALESCE(OLD.session_id::text, ''), OLD.created_at);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM {schema}.chat_sessions_add(COALESCE(NEW.session_id::text, ''), COALESCE(NEW.created_at, now()));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS chat_sessions_track ON {schema}.chat_logs;
+CREATE TRIGGER chat_sessions_track
+    AFTER INSERT OR DELETE OR UPDATE OF session_id, created_at ON {schema}.chat_logs
+    FOR EACH ROW EXECUTE PROCEDURE {schema}.chat_sessions_track();
+
+-- สรุปใหม่จากข้อมูลจริง (แก้เวลาล่าสุดที่ค้างจากการลบ และ session ที่ไม่มีข้อความเหลือแล้ว)
+INSERT INTO {schema}.chat_sessions (session_id, last_updated, message_count)
+SELECT COALESCE(session_id::text, ''), MAX(COALESCE(created_at, now())), COUNT(*)
+FROM {schema}.chat_logs
+GROUP BY COALESCE(session_id::text, '')
+ON CONFLICT (session_id) DO UPDATE
+    SET last_updated = EXCLUDED.last_updated, message_count = EXCLUDED.message_count;
+
+DELETE FROM {schema}.chat_sessions s
+WHERE NOT EXISTS (SELECT 1 FROM {schema}.chat_logs l WHERE COALESCE(l.session_id::text, '') = s.session_id);
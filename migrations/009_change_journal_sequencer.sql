@@ -0,0 +1,12 @@
+-- เลิกใช้ advisory lock ตอนเขียน journal (เดิมทุก transaction ที่แก้ข้อมูลต้องรอกันจน commit ทำให้ import ยาวๆ บล็อกการบันทึกทั้งระบบ)
+-- ตอนนี้รายการใหม่ถูกเขียนโดยยังไม่มี version แล้วผู้อ่าน (/api/changes, compact) เป็นคนให้ version ตามลำดับที่มองเห็นว่า commit แล้ว
+-- (ดู journal.sequence) รายการของ transaction ที่ยังไม่ commit จะได้ version ทีหลังเสมอ watermark ของบอทจึงไม่ข้ามรายการ
+-- id คือลำดับการเขียน ใช้เป็น primary key แทน version ที่ว่างได้ระหว่างรอ
+
+ALTER TABLE {schema}.change_journal ADD COLUMN IF NOT EXISTS id BIGSERIAL;
+ALTER TABLE {schema}.change_journal DROP CONSTRAINT IF EXISTS change_journal_pkey;
+ALTER TABLE {schema}.change_journal ADD CONSTRAINT change_journal_pkey PRIMARY KEY (id);
+ALTER TABLE {schema}.change_journal ALTER COLUMN version DROP NOT NULL, ALTER COLUMN version DROP DEFAULT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS change_journal_version_idx ON {schema}.change_journal (version);
+CREATE INDEX IF NOT EXISTS change_journal_unsequenced_idx ON {schema}.change_journal (id) WHERE version IS NULL;
@@ -0,0 +1,71 @@
+-- chat_sessions มี revision ต่อ session เพิ่มขึ้นทุกครั้งที่ข้อความของ session นั้นถูกเพิ่ม/ลบ/แก้ (เช่นบอทบันทึก feedback_score)
+-- ใช้เป็น key ของ cache หน้าต่างดูแชท (db_actions.get_session_marker)
+-- chat_logs ไม่มี trigger ของ table_versions (แถวเดียวที่ทุกคำสั่งของบอทต้องรอ lock กัน) หน้า Dashboard ใช้ข้อมูลใน chat_sessions แทน
+-- (db_actions.get_sessions_marker) ถ้าเคยรันไฟล์นี้รุ่นที่ติด trigger ไว้ ส่วนนี้จะถอดออก
+
+DROP TRIGGER IF EXISTS table_versions_bump ON {schema}.chat_logs;
+DROP TRIGGER IF EXISTS table_versions_trunc ON {schema}.chat_logs;
+DELETE FROM {schema}.table_versions WHERE table_name = 'chat_logs';
+
+ALTER TABLE {schema}.chat_sessions ADD COLUMN IF NOT EXISTS revision BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION {schema}.chat_sessions_add(sid TEXT, added_at TIMESTAMPTZ) RETURNS void AS $$
+BEGIN
+    INSERT INTO {schema}.chat_sessions (session_id, last_updated, message_count)
+    VALUES (sid, added_at, 1)
+    ON CONFLICT (session_id) DO UPDATE
+        SET last_updated = GREATEST({schema}.chat_sessions.last_updated, EXCLUDED.last_updated),
+            message_count = {schema}.chat_sessions.message_count + 1,
+            revision = {schema}.chat_sessions.revision + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION {schema}.chat_sessions_remove(sid TEXT, removed_at TIMESTAMPTZ) RETURNS void AS $$
+DECLARE
+    current_last TIMESTAMPTZ;
+    latest TIMESTAMPTZ;
+BEGIN
+    UPDATE {schema}.chat_sessions SET message_count = message_count - 1, revision = revision + 1
+    WHERE session_id = sid
+    RETURNING last_updated INTO current_last;
+    DELETE FROM {schema}.chat_sessions WHERE session_id = sid AND message_count <= 0;
+
+    -- เวลาล่าสุดเปลี่ยนเฉพาะตอนลบข้อความล่าสุดของ session (trigger แบบ AFTER จึงไม่เห็นแถวที่ลบแล้ว)
+    IF current_last IS NOT NULL AND (removed_at IS NULL OR removed_at >= current_last) THEN
+        IF sid = '' THEN
+            SELECT MAX(created_at) INTO latest FROM {schema}.chat_logs WHERE session_id IS NULL OR session_id::text = '';
+        ELSE
+            SELECT MAX(created_at) INTO latest FROM {schema}.chat_logs WHERE session_id::text = sid;
+        END IF;
+        IF latest IS NOT NULL THEN
+            UPDATE {schema}.chat_sessions SET last_updated = latest WHERE session_id = sid;
+        END IF;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION {schema}.chat_sessions_track() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.session_id IS NOT DISTINCT FROM NEW.session_id
+                        AND OLD.created_at IS NOT DISTINCT FROM NEW.created_at THEN
+        -- แก้เนื้อหาข้อความ (ไม่ได้ย้าย session) นับเป็น revision ใหม่ของ session เดิม
+        IF OLD IS DISTINCT FROM NEW THEN
+            UPDATE {schema}.chat_sessions SET revision = revision + 1
+            WHERE session_id = COALESCE(NEW.session_id::text, '');
+        END IF;
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM {schema}.chat_sessions_remove(COALESCE(OLD.session_id::text, ''), OLD.created_at);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM {schema}.chat_sessions_add(COALESCE(NEW.session_id::text, ''), COALESCE(NEW.created_at, now()));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS chat_sessions_track ON {schema}.chat_logs;
+CREATE TRIGGER chat_sessions_track
+    AFTER INSERT OR DELETE OR UPDATE ON {schema}.chat_logs
+    FOR EACH ROW EXECUTE PROCEDURE {schema}.chat_sessions_track();
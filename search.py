@@ -0,0 +1,160 @@
+import re
+import config
+import db_pool
+from psycopg2.extras import execute_values
+
+# ส่วนค้นหาแบบ Full-text สำหรับ manual_chunks, support_stories และ glossary_terms
+# ภาษาไทยไม่มีการเว้นวรรคระหว่างคำ ตัวตัดคำของ PostgreSQL จึงใช้ไม่ได้
+# เลยตัดคำเองใน Python: ข้อความไทยแตกเป็นคู่ตัวอักษร (bigram) ส่วนภาษาอังกฤษ/ตัวเลขแยกตามคำ
+# แล้วเก็บเป็น tsvector พร้อมตำแหน่งในคอลัมน์ search_vector (ดู migrations/001_search.sql) ซึ่งมี GIN index
+# ตอนค้นหา index ใช้คัดแถวที่มี bigram ไทยของคำค้นครบทุกตัวก่อน แล้ว ILIKE ตรวจซ้ำว่ามีคำค้นเป็น substring จริง
+
+_TOKEN_RE = re.compile(r'[\u0E00-\u0E7F]+|[0-9a-z\u00C0-\u024F]+')
+
+def _is_thai(token):
+    return '\u0E00' <= token[0] <= '\u0E7F'
+
+def tokenize(text):
+    # คืนค่า list ของ lexeme ที่ใช้ทั้งตอนสร้าง index และตอนค้นหา
+    tokens = []
+    if not text:
+        return tokens
+    for match in _TOKEN_RE.finditer(str(text).lower()):
+        token = match.group()
+        if _is_thai(token) and len(token) > 1:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+def build_tsquery(text):
+    # แปลงคำค้นเป็น tsquery สำหรับคัดแถวก่อนตรวจด้วย ILIKE ต้องได้ทุกแถวที่ ILIKE จะเจอ จึงใช้เฉพาะ bigram ของคำไทยต่อกันด้วย &
+    # - ไม่ใช้ <-> เพราะ lexeme ที่เลยตำแหน่ง 16383 หรือเกิน 256 ครั้งไม่มีตำแหน่งเก็บไว้ (ดู build_vector)
+    # - ไม่ใช้คำภาษาอังกฤษ/ตัวเลข เพราะ substring กลางคำ (เช่น "und" ใน "fund") ไม่ตรงกับ lexeme ใด
+    # คืนค่า None ถ้าคำค้นไม่มีคำไทยยาว 2 ตัวอักษรขึ้นไป (ให้ใช้ ILIKE ที่มี trigram index อย่างเดียว)
+    terms = []
+    for match in _TOKEN_RE.finditer(str(text or '').lower()):
+        token = match.group()
+        if _is_thai(token) and len(token) > 1:
+            terms.extend(f"'{token[i:i + 2]}'" for i in range(len(token) - 1))
+    if not terms:
+        return None
+    return " & ".join(dict.fromkeys(terms))
+
+def build_vector(groups):
+    # สร้าง tsvector (รูปแบบข้อความ) จาก [(น้ำหนัก, [ค่าของแต่ละคอลัมน์]), ...] พร้อมตำแหน่งของทุก lexeme
+    # เว้นตำแหน่งระหว่างคอลัมน์ phrase จะได้ไม่ต่อข้ามคอลัมน์ (lexeme มีแค่ตัวอักษรไทย/a-z/ตัวเลข จึงไม่ต้อง escape)
+    # PostgreSQL เก็บตำแหน่งได้ไม่เกิน 16383 และไม่เกิน 256 ตำแหน่งต่อ lexeme คำที่เลยกว่านั้นเก็บแค่ lexeme ไม่มีตำแหน่ง
+    positions = {}
+    position = 0
+    for weight, fields in groups:
+        for value in fields:
+            for token in tokenize(value):
+                position += 1
+                found = positions.setdefault(token, [])
+                if position <= 16383 and len(found) < 256:
+                    found.append(f"{position}{weight}")
+            position += 1
+    return " ".join(f"'{lexeme}':{','.join(found)}" if found else f"'{lexeme}'" for lexeme, found in positions.items())
+
+# ข้อมูลที่นำมาทำ index ของแต่ละตาราง แบ่งน้ำหนัก A (หัวข้อ) > B (เนื้อหา) > C (ชื่อจากตารางที่ JOIN)
+# columns คือชื่อคอลัมน์ในหน้า list ที่อยู่ใน index (ค้นคอลัมน์อื่นด้วย index ไม่ได้)
+SEARCH_SOURCES = {
+    'manual_chunks': {
+        'pk': 'id', 'alias': 'm',
+        'columns': {'topic', 'section', 'content', 'category_name', 'main_group', 'doc_title', 'fund_abbr', 'fund_full_name'},
+        'from': """{schema}.manual_chunks m
+            LEFT JOIN {schema}.categories c ON m.category_id = c.id
+            LEFT JOIN {schema}.documents d ON m.doc_id = d.id
+            LEFT JOIN {schema}.research_funds f ON m.fund_abbr = f.fund_abbr""",
+        'A': ['m.topic', 'm.section'],
+        'B': ['m.content'],
+        'C': ['c.name', 'c.main_group', 'd.title', 'm.fund_abbr', 'f.fund_name_th'],
+    },
+    'support_stories': {
+        'pk': 'id', 'alias': 's',
+        'columns': {'scenario', 'solution', 'category_name'},
+        'from': """{schema}.support_stories s
+            LEFT JOIN {schema}.categories c ON s.category_id = c.id""",
+        'A': ['s.scenario'],
+        'B': ['s.solution'],
+        'C': ['c.name'],
+    },
+    'glossary_terms': {
+        'pk': 'word_id', 'alias': 'g',
+        'columns': {'word', 'meaning', 'word_type'},
+        'from': "{schema}.glossary_terms g",
+        'A': ['g.word'],
+        'B': ['g.meaning'],
+        'C': ['g.word_type'],
+    },
+}
+SEARCH_SOURCES['view_support_stories'] = SEARCH_SOURCES['support_stories']
+
+# ตารางแม่ที่ชื่อถูกนำไปใส่ใน index ของตารางลูก แก้ไขแล้วต้องสร้าง index ของลูกใหม่
+_DEPENDENTS = {
+    'categories': [('manual_chunks', "m.category_id = ANY(%s)"), ('support_stories', "s.category_id = ANY(%s)")],
+    'documents': [('manual_chunks', "m.doc_id = ANY(%s)")],
+    'research_funds': [('manual_chunks', "m.fund_abbr IN (SELECT fund_abbr FROM {schema}.research_funds WHERE fund_id = ANY(%s))")],
+}
+
+def is_enabled(cur, table_name):
+    # เช็คว่า migration เพิ่มคอลัมน์ search_vector แล้วหรือยัง
+    source = SEARCH_SOURCES.get(table_name)
+    if source is None:
+        return False
+    return db_pool.table_exists(cur, source['from'].split()[0].split('.')[-1], 'search_vector')
+
+def _refresh(cur, table_name, where_sql, params, batch_size=500):
+    # คำนวณ search_vector ใหม่ของแถวที่ตรงเงื่อนไข แล้ว UPDATE ทีละชุดด้วย execute_values
+    source = SEARCH_SOURCES[table_name]
+    schema = config.DB_SCHEMA
+    alias, pk = source['alias'], source['pk']
+    cols = source['A'] + source['B'] + source['C']
+    base = source['from'].split()[0].format(schema=schema)
+
+    # ใช้ server-side cursor อ่านทีละชุด ตารางใหญ่ก็ไม่ต้องโหลดทั้งหมดเข้าหน่วยความจำ
+    read_cur = cur.connection.cursor(name=f"search_refresh_{table_name}")
+    read_cur.itersize = batch_size
+    read_cur.execute(f"SELECT {alias}.{pk}, {', '.join(cols)} FROM {source['from'].format(schema=schema)} WHERE {where_sql}", params)
+    updated = 0
+    while True:
+        rows = read_cur.fetchmany(batch_size)
+        if not rows:
+            break
+        sizes = [len(source['A']), len(source['B'])]
+        values = []
+        for row in rows:
+            fields = row[1:]
+            groups = [('A', fields[:sizes[0]]), ('B', fields[sizes[0]:sizes[0] + sizes[1]]),
+                      ('C', fields[sizes[0] + sizes[1]:])]
+            values.append((row[0], build_vector(groups)))
+        with cur.connection.cursor() as write_cur:
+            execute_values(write_cur, f"""
+                UPDATE {base} t SET search_vector = v.vector
+                FROM (VALUES %s) AS v(pk, vector) WHERE t.{pk} = v.pk
+            """, values, template="(%s, %s::tsvector)")
+        updated += len(rows)
+    read_cur.close()
+    return updated
+
+def refresh_for_write(conn, table_name, ids):
+    # เรียกหลัง insert/update ใน transaction เดียวกัน เพื่อให้ index ค้นหาตรงกับข้อมูลเสมอ
+    if not ids:
+        return
+    with conn.cursor() as cur:
+        if table_name in SEARCH_SOURCES and is_enabled(cur, table_name):
+            source = SEARCH_SOURCES[table_name]
+            _refresh(cur, table_name, f"{source['alias']}.{source['pk']} = ANY(%s)", (list(ids),))
+        for child, condition in _DEPENDENTS.get(table_name, []):
+            if is_enabled(cur, child):
+                _refresh(cur, child, condition.format(schema=config.DB_SCHEMA), (list(ids),))
+
+def rebuild(conn, table_name, only_missing=False):
+    # สร้าง search_vector ใหม่ทั้งตาราง (ใช้หลังรัน migration หรือเมื่อเปลี่ยนวิธีตัดคำ)
+    with conn.cursor() as cur:
+        if not is_enabled(cur, table_name):
+            return 0
+        alias = SEARCH_SOURCES[table_name]['alias']
+        where_sql = f"{alias}.search_vector IS NULL" if only_missing else "TRUE"
+        return _refresh(cur, table_name, where_sql, ())
@@ -0,0 +1,258 @@
+import datetime
+import decimal
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import config
+import db_pool
+import journal
+
+# Snapshot ของฐานความรู้ทั้งหมดในไฟล์ SQLite ไฟล์เดียว ให้บอทโหลดครั้งเดียวตอนเริ่มทำงาน แทนการ query/JOIN ทุกตารางเอง
+# - manual_chunks / support_stories ถูก JOIN ชื่อหมวดหมู่ เอกสาร และกองทุนไว้แล้ว มี index ของคอลัมน์ที่ใช้ค้นบ่อย
+# - ทุกตารางอ่านใน transaction แบบ REPEATABLE READ เดียวกัน ข้อมูลจึงตรงกัน ณ จุดเวลาเดียว
+# - ตาราง meta เก็บ version ของ change journal ณ ตอนสร้าง บอทใช้เป็น since ของ /api/changes ต่อได้เลย
+# - ไฟล์ตั้งชื่อตาม sha256 ของเนื้อไฟล์ และมี snapshot.json บอกไฟล์ปัจจุบัน (ใช้เป็น ETag)
+# - สร้างโดย thread เบื้องหลังของแต่ละ worker (start) ไม่ใช่ตอนบอทดาวน์โหลด /api/snapshot จะส่งไฟล์ล่าสุดที่สร้างเสร็จแล้วเสมอ
+#   บอทใช้ journal_version ของไฟล์เป็น since ของ /api/changes เพื่อตามการแก้ไขที่เกิดหลังสร้างไฟล์
+
+_SOURCES = [
+    ('manual_chunks', """
+        SELECT m.id, m.doc_id, m.category_id, m.topic, m.section, m.step_number, m.content, m.data_type, m.fund_abbr,
+               c.name AS category_name, c.main_group, d.title AS doc_title, d.version AS doc_version,
+               d.last_updated AS doc_last_updated, f.fund_name_th AS fund_full_name
+        FROM {schema}.manual_chunks m
+        LEFT JOIN {schema}.categories c ON m.category_id = c.id
+        LEFT JOIN {schema}.documents d ON m.doc_id = d.id
+        LEFT JOIN {schema}.research_funds f ON m.fund_abbr = f.fund_abbr
+        ORDER BY m.id
+    """, ['category_id', 'doc_id', 'fund_abbr', 'data_type', 'topic']),
+    ('support_stories', """
+        SELECT s.id, s.category_id, s.scenario, s.solution, c.name AS category_name, c.main_group
+        FROM {schema}.support_stories s
+        LEFT JOIN {schema}.categories c ON s.category_id = c.id
+        ORDER BY s.id
+    """, ['category_id']),
+    ('glossary_terms', """
+        SELECT word_id, word, meaning, word_type FROM {schema}.glossary_terms ORDER BY word_id
+    """, ['word', 'word_type']),
+    ('research_funds', """
+        SELECT fund_id, fund_abbr, fund_name_th, fund_name_en, fiscal_year, source_agency, start_period, end_period, status
+        FROM {schema}.research_funds ORDER BY fund_id
+    """, ['fund_abbr', 'status']),
+]
+
+_FETCH_SIZE = 2000
+_KEEP_FILES = 2   # เก็บไฟล์เก่าไว้ 1 รุ่น เผื่อมีคนกำลังดาวน์โหลดอยู่ตอนสร้างไฟล์ใหม่
+
+
+def _dir():
+    os.makedirs(config.SNAPSHOT_DIR, exist_ok=True)
+    return config.SNAPSHOT_DIR
+
+def _to_sqlite(value):
+    # SQLite รองรับแค่ตัวเลข ข้อความ และ bytes วันที่เก็บเป็น ISO string
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+def current_info():
+    # ข้อมูลของ snapshot ปัจจุบัน (จาก snapshot.json) หรือ None ถ้ายังไม่เคยสร้าง / ไฟล์หายไป
+    try:
+        with open(os.path.join(_dir(), 'snapshot.json'), encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    info['path'] = os.path.join(_dir(), info['file'])
+    return info if os.path.exists(info['path']) else None
+
+def open_current():
+    # (info, ไฟล์ที่เปิดแล้ว) ของ snapshot ปัจจุบัน หรือ (None, None) ถ้ายังไม่มี
+    # ไฟล์ที่เปิดไว้แล้วยังอ่านได้จนปิด แม้ถูกลบทิ้งระหว่างดาวน์โหลด (สร้างไฟล์ใหม่เสร็จเกิน _KEEP_FILES รุ่น)
+    # ถ้าไฟล์ถูกลบไปก่อนเปิดทัน ให้อ่าน snapshot.json ใหม่แล้วลองอีกครั้ง
+    for _ in range(3):
+        info = current_info()
+        if info is None:
+            return None, None
+        try:
+            return info, open(info['path'], 'rb')
+        except FileNotFoundError:
+            continue
+    return None, None
+
+def _copy_tables(pg_conn, db):
+    # อ่านแต่ละตารางจาก server-side cursor ทีละชุดแล้วเขียนลง SQLite คืนค่าจำนวนแถวของแต่ละตาราง
+    counts = {}
+    for table_name, sql, indexes in _SOURCES:
+        cur = pg_conn.cursor(name=f"snapshot_{table_name}")
+        cur.itersize = _FETCH_SIZE
+        cur.execute(sql.format(schema=config.DB_SCHEMA))
+        rows = cur.fetchmany(_FETCH_SIZE)
+        columns = [d[0] for d in cur.description]
+        db.execute(f"CREATE TABLE {table_name} ({', '.join(columns)}, PRIMARY KEY ({columns[0]}))")
+        insert_sql = f"INSERT INTO {table_name} VALUES ({', '.join('?' for _ in columns)})"
+        counts[table_name] = 0
+        while rows:
+            db.executemany(insert_sql, [tuple(_to_sqlite(v) for v in row) for row in rows])
+            counts[table_name] += len(rows)
+            rows = cur.fetchmany(_FETCH_SIZE)
+        cur.close()
+        for column in indexes:
+            db.execute(f"CREATE INDEX {table_name}_{column}_idx ON {table_name} ({column})")
+    return counts
+
+def _write_snapshot(path):
+    # เขียนไฟล์ SQLite ใหม่ที่ path คืนค่า (journal version, จำนวนแถว, เวลาที่สร้าง)
+    pool = db_pool.get_pool()
+    pg_conn = pool.getconn()
+    try:
+        pg_conn.rollback()
+        with pg_conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            version = None
+            if journal.is_enabled(cur):
+                cur.execute(f"SELECT COALESCE(MAX(version), 0) FROM {config.DB_SCHEMA}.change_journal")
+                version = cur.fetchone()[0]
+        db = sqlite3.connect(path)
+        try:
+            db.execute("PRAGMA journal_mode = OFF")
+            db.execute("PRAGMA synchronous = OFF")
+            counts = _copy_tables(pg_conn, db)
+            built_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            db.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ('journal_version', '' if version is None else str(version)),
+                ('built_at', built_at),
+                ('counts', json.dumps(counts)),
+            ])
+            db.commit()
+            db.execute("VACUUM")
+        finally:
+            db.close()
+    finally:
+        pg_conn.rollback()
+        pool.putconn(pg_conn)
+    return version, counts, built_at
+
+def build(wait=True):
+    # สร้าง snapshot ใหม่ คืนค่า info ของไฟล์ที่ได้
+    # ถ้ามี process อื่นกำลังสร้างอยู่: wait=True รอจนเสร็จแล้วสร้างต่อ, wait=False ไม่สร้างและคืนค่า None
+    directory = _dir()
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+
+        tmp_path = os.path.join(directory, f".building-{os.getpid()}.sqlite")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            version, counts, built_at = _write_snapshot(tmp_path)
+            sha = hashlib.sha256()
+            with open(tmp_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            filename = f"kb_snapshot-{digest[:16]}.sqlite"
+            path = os.path.join(directory, filename)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        info = {'file': filename, 'sha256': digest, 'journal_version': version, 'built_at': built_at,
+                'built_ts': time.time(), 'size': os.path.getsize(path), 'counts': counts}
+        with open(os.path.join(directory, 'snapshot.json.tmp'), 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        os.replace(os.path.join(directory, 'snapshot.json.tmp'), os.path.join(directory, 'snapshot.json'))
+
+        # ลบไฟล์รุ่นเก่า
+        files = sorted(glob.glob(os.path.join(directory, 'kb_snapshot-*.sqlite')), key=os.path.getmtime, reverse=True)
+        for old in files[_KEEP_FILES:]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    info['path'] = path
+    return info
+
+def is_stale(info, cur):
+    # snapshot เก่ากว่าข้อมูลหรือไม่: ดูจาก change journal ถ้ามี ไม่งั้นดูจากอายุไฟล์ (SNAPSHOT_MAX_AGE)
+    if info is None:
+        return True
+    if journal.is_enabled(cur) and info.get('journal_version') is not None:
+        cur.execute(f"SELECT COALESCE(MAX(version), 0) FROM {config.DB_SCHEMA}.change_journal")
+        return cur.fetchone()[0] > info['journal_version']
+    return time.time() - info.get('built_ts', 0) > config.SNAPSHOT_MAX_AGE
+
+# ตัวสร้าง snapshot เบื้องหลัง: ตื่นเมื่อ worker นี้แก้ไขข้อมูล (db_actions เรียก request_build หลัง commit)
+# หรือทุก SNAPSHOT_CHECK_INTERVAL วินาที (จับการแก้ไขจาก worker อื่น / psql) รอ SNAPSHOT_BUILD_DELAY วินาทีเพื่อรวบการแก้ไขต่อเนื่อง
+# แล้วสร้างใหม่ถ้าข้อมูลใหม่กว่าไฟล์ล่าสุด ถ้ามี worker อื่นกำลังสร้างอยู่จะข้ามรอบนี้ไป
+_state = {'pid': None, 'thread': None, 'building': False, 'builds': 0, 'last_build_seconds': None, 'last_error': None}
+_start_lock = threading.Lock()
+_wake = threading.Event()
+
+def request_build():
+    _wake.set()
+
+def _needs_build():
+    # ให้ version กับการแก้ไขที่ commit แล้วก่อน (ต้อง commit) แล้วค่อยเทียบกับไฟล์ล่าสุด
+    pool = db_pool.get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            if journal.is_enabled(cur):
+                journal.sequence(cur)
+            stale = is_stale(current_info(), cur)
+        conn.commit()
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
+    return stale
+
+def _build_forever():
+    while True:
+        if _wake.wait(config.SNAPSHOT_CHECK_INTERVAL):
+            time.sleep(config.SNAPSHOT_BUILD_DELAY)
+        _wake.clear()
+        try:
+            if not _needs_build():
+                continue
+            started = time.monotonic()
+            _state['building'] = True
+            try:
+                info = build(wait=False)
+            finally:
+                _state['building'] = False
+            if info is not None:
+                _state['builds'] += 1
+                _state['last_build_seconds'] = round(time.monotonic() - started, 3)
+        except Exception as e:
+            print(f"[ERROR] Snapshot builder: {e}")
+            _state['last_error'] = str(e)
+
+def start():
+    # เริ่ม thread สร้าง snapshot ของ process นี้ (เรียกซ้ำได้ หลัง fork จะเริ่มใหม่ใน process ลูก)
+    if not config.SNAPSHOT_BUILDER_ENABLED or _state['pid'] == os.getpid():
+        return
+    with _start_lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        # ยังไม่เคยสร้างไฟล์ ให้เช็คทันทีไม่ต้องรอรอบแรก
+        _wake.set()
+        thread = threading.Thread(target=_build_forever, name='snapshot-builder', daemon=True)
+        thread.start()
+        _state['thread'] = thread
+
+def stats():
+    return {k: v for k, v in _state.items() if k != 'thread'}
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# ตั้งค่าที่ config ต้องใช้ก่อน import โมดูลของแอป (ทดสอบเฉพาะฟังก์ชันที่ไม่ต้องต่อฐานข้อมูล)
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("DB_SCHEMA", "kb")
+os.environ.setdefault("CACHE_NOTIFY_ENABLED", "false")
+os.environ.setdefault("FORMAT_JOBS_ENABLED", "false")
+os.environ.setdefault("SNAPSHOT_BUILDER_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
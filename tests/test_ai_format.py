@@ -0,0 +1,36 @@
+import ai_format
+
+
+def test_numbers_are_compared_after_normalising():
+    assert ai_format.missing_numbers('ปี ๒๕๖๗ งบ 1,000 บาท', '**ปี 2567** งบ 1000 บาท') == []
+    assert ai_format.missing_numbers('ข้อ 007', '1. ข้อ 7') == []
+
+
+def test_dropped_numbers_are_reported():
+    assert ai_format.missing_numbers('วันที่ 5 ถึง 5 มี.ค. 2567', 'วันที่ 5 มี.ค.') == ['2567', '5']
+
+
+def test_segment_with_dropped_numbers_keeps_original():
+    warnings = []
+    assert ai_format._checked('งบ 500 บาท', 'งบ บาท', warnings) == 'งบ 500 บาท'
+    assert warnings == [{'segment': 'งบ 500 บาท', 'missing': ['500']}]
+    assert ai_format._checked('งบ 500 บาท', '**งบ 500 บาท**', warnings) == '**งบ 500 บาท**'
+    assert len(warnings) == 1
+
+
+def test_short_text_is_one_segment():
+    assert ai_format.split_segments('  สั้น\r\nมาก  ', limit=100) == ['สั้น\nมาก']
+
+
+def test_segments_split_on_blank_lines_within_limit():
+    text = '\n\n'.join(['a' * 50, 'b' * 50, '# หัวข้อ\n' + 'c' * 30])
+    segments = ai_format.split_segments(text, limit=80)
+    assert segments == ['a' * 50, 'b' * 50, '# หัวข้อ\n' + 'c' * 30]
+    assert all(len(s) <= 80 for s in segments)
+
+
+def test_long_block_is_cut_at_spaces():
+    text = ' '.join(['word'] * 60)
+    segments = ai_format.split_segments(text, limit=100)
+    assert all(len(s) <= 100 for s in segments)
+    assert ' '.join(segments).split() == text.split()
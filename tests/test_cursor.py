@@ -0,0 +1,29 @@
+import base64
+import json
+import db_actions
+
+
+def test_round_trip():
+    cursor = db_actions.encode_cursor('fund_id DESC', {'fund_id': 42, 'name': 'x'})
+    assert db_actions.decode_cursor('fund_id DESC', cursor) == (42, 'next')
+
+    cursor = db_actions.encode_cursor('word', {'word': 'ทุนวิจัย'}, direction='prev')
+    assert db_actions.decode_cursor('word ASC', cursor) == ('ทุนวิจัย', 'prev')
+
+
+def test_other_column_is_rejected():
+    cursor = db_actions.encode_cursor('fund_id', {'fund_id': 42})
+    assert db_actions.decode_cursor('id', cursor) is None
+
+
+def test_tampered_cursor_is_rejected():
+    assert db_actions.decode_cursor('id', '') is None
+    assert db_actions.decode_cursor('id', 'not base64 !!') is None
+    assert db_actions.decode_cursor('id', base64.urlsafe_b64encode(b'\xff\xfe').decode()) is None
+
+    def token(payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+    assert db_actions.decode_cursor('id', token([1, 2])) is None
+    assert db_actions.decode_cursor('id', token({'c': 'id', 'k': 1, 'd': 'sideways'})) is None
+    assert db_actions.decode_cursor('id', token({'c': 'id', 'k': 1, 'd': 'prev'})) == (1, 'prev')
@@ -0,0 +1,40 @@
+import app
+import db_actions
+
+
+class RecordingCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_blockers_query_covers_every_child_table():
+    cur = RecordingCursor([(3, 'manual_chunks', 'manuals', 2, [10, 11]),
+                           (3, 'support_stories', 'stories', 1, [7])])
+    blockers = db_actions._find_blockers(cur, 'categories', [3, 4])
+    assert blockers == {3: {'manual_chunks': {'page': 'manuals', 'count': 2, 'ids': [10, 11]},
+                            'support_stories': {'page': 'stories', 'count': 1, 'ids': [7]}}}
+    query, params = cur.executed[0]
+    assert query.count('UNION ALL') == len(db_actions.DEPENDENCIES['categories'][1]) - 1
+    assert 'kb.manual_chunks c ON c.category_id = p.id' in query
+    assert params == ['manual_chunks', 'manuals', [3, 4], 'support_stories', 'stories', [3, 4]]
+
+
+def test_no_ids_skips_the_query():
+    cur = RecordingCursor([])
+    assert db_actions._find_blockers(cur, 'documents', []) == {}
+    assert cur.executed == []
+
+
+def test_blocker_message():
+    children = {'manual_chunks': {'page': 'manuals', 'count': 2, 'ids': [10, 11]},
+                'support_stories': {'page': 'stories', 'count': 25, 'ids': list(range(1, 21))}}
+    message = app._describe_blockers(children)
+    assert message.startswith('พบการใช้งานในหน้า "manuals" ID ที่ 10, 11, พบการใช้งานในหน้า "stories" ID ที่ 1, 2,')
+    assert message.endswith('19, 20 (ทั้งหมด 25 รายการ)')
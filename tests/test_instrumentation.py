@@ -0,0 +1,16 @@
+import instrumentation
+
+
+def test_literals_and_placeholders_are_replaced():
+    query = "SELECT * FROM t WHERE a = 'it''s' AND b = 12.5 AND c = %s AND d = %(name)s"
+    assert instrumentation.normalize_sql(query) == "SELECT * FROM t WHERE a = ? AND b = ? AND c = ? AND d = ?"
+
+
+def test_lists_and_whitespace_are_collapsed():
+    assert instrumentation.normalize_sql(b"SELECT 1\n  FROM t WHERE id IN (1, 2,3)") == "SELECT ? FROM t WHERE id IN (...)"
+    assert instrumentation.normalize_sql("SELECT a1 FROM t2") == "SELECT a1 FROM t2"
+
+
+def test_long_queries_are_truncated():
+    shape = instrumentation.normalize_sql("SELECT " + ", ".join(f"col_{i}" for i in range(200)) + " FROM t")
+    assert len(shape) == 504 and shape.endswith(' ...')
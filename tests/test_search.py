@@ -0,0 +1,43 @@
+import search
+
+
+def test_thai_text_becomes_bigrams():
+    assert search.tokenize('ทุนวิจัย') == ['ทุ', 'ุน', 'นว', 'วิ', 'ิจ', 'จั', 'ัย']
+    assert search.tokenize('ทุน ABC-12') == ['ทุ', 'ุน', 'abc', '12']
+    assert search.tokenize('ก') == ['ก']
+    assert search.tokenize(None) == []
+
+
+def test_tsquery_requires_every_thai_bigram():
+    assert search.build_tsquery('ทุน') == "'ทุ' & 'ุน'"
+    assert search.build_tsquery('ทุ') == "'ทุ'"
+    assert search.build_tsquery('ทุน ทุน') == "'ทุ' & 'ุน'"
+
+
+def test_tsquery_skips_latin_and_numbers():
+    # ILIKE เป็นตัวตรวจส่วนนี้ ("und" ต้องเจอ "fund", "566" ต้องเจอ "2566")
+    assert search.build_tsquery('ทุน fund 2566') == "'ทุ' & 'ุน'"
+    assert search.build_tsquery('und') is None
+    assert search.build_tsquery('566') is None
+
+
+def test_tsquery_falls_back_to_ilike():
+    assert search.build_tsquery('ก') is None
+    assert search.build_tsquery('!!') is None
+    assert search.build_tsquery('') is None
+
+
+def test_tsquery_matches_every_substring_hit():
+    # ทุก bigram ของคำค้นต้องอยู่ใน index ของข้อความใดก็ตามที่มีคำค้นเป็น substring
+    text = 'ทุนวิจัยปี 2566 (fund)'
+    for query in ['นวิจ', 'ัยปี 25', 'วิจัย', 'ปี 2566 (fu']:
+        assert query in text
+        tsquery = search.build_tsquery(query)
+        assert tsquery is not None
+        lexemes = set(search.tokenize(text))
+        assert all(term.strip("'") in lexemes for term in tsquery.split(' & '))
+
+
+def test_vector_positions_do_not_cross_fields():
+    vector = search.build_vector([('A', ['ทุน']), ('B', ['ab', None])])
+    assert vector == "'ทุ':1A 'ุน':2A 'ab':4B"